@@ -1,4 +1,5 @@
 import os
+from datetime import timedelta
 from kombu import Exchange, Queue
 
 BROKER_TRANSPORT = "redis"
@@ -25,9 +26,34 @@ CELERY_ROUTES = {
     # -- HIGH PRIORITY QUEUE -- #
     'uggipuggi.tasks.resource_add_task.user_feed_add_recipe':   {'queue': 'high'},    
     'uggipuggi.tasks.resource_add_task.user_feed_add_activity': {'queue': 'high'},
+    'uggipuggi.tasks.resource_add_task.user_feed_fan_out_chunk': {'queue': 'high'},
+    'uggipuggi.tasks.engagement_tasks.forward_engagement_events': {'queue': 'high'},
     # -- NORMAL PRIORITY QUEUE -- #
     'uggipuggi.tasks.resource_add_task.user_feed_put_comment':  {'queue': 'high'},
     'uggipuggi.tasks.user_tasks.user_display_pic_task':  {'queue': 'high'},
+    'uggipuggi.tasks.user_tasks.add_joined_contacts':    {'queue': 'normal'},
     # -- LOW PRIORITY QUEUE -- #
+    'uggipuggi.tasks.concise_view_tasks.migrate_concise_views': {'queue': 'low'},
+    'uggipuggi.tasks.counter_tasks.flush_counters': {'queue': 'low'},
+    'uggipuggi.tasks.engagement_tasks.backfill_user_liked': {'queue': 'low'},
+    'uggipuggi.tasks.key_tasks.migrate_cluster_keys': {'queue': 'low'},
+    'uggipuggi.tasks.key_tasks.migrate_phone_directory': {'queue': 'low'},
+    'uggipuggi.tasks.key_tasks.migrate_user_ids': {'queue': 'low'},
+    'uggipuggi.tasks.key_tasks.index_pending_contacts': {'queue': 'low'},
     #'myapp.tasks.close_session': {'queue': 'low'},
 }
+
+# Needs a beat: celery worker -B ..., or a separate celery beat process
+CELERYBEAT_SCHEDULE = {
+    'flush-counters': {
+        'task': 'uggipuggi.tasks.counter_tasks.flush_counters',
+        'schedule': timedelta(seconds=30),  # COUNTER_FLUSH_INTERVAL
+        # A flush that hasn't started before the next one is due is dropped
+        'options': {'expires': 30},
+    },
+    'forward-engagement-events': {
+        'task': 'uggipuggi.tasks.engagement_tasks.forward_engagement_events',
+        'schedule': timedelta(seconds=2),  # ENGAGEMENT_FORWARD_INTERVAL
+        'options': {'expires': 2},
+    },
+}
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# gunicorn settings, used as: gunicorn -c conf/gunicorn_conf.py "manage:uggipuggi_app.app"
+#
+# Worker modes (GUNICORN_WORKER_CLASS):
+#   sync    - one request per worker process (default, previous behaviour)
+#   gthread - GUNICORN_THREADS requests per worker process, overlapping their
+#             Redis, Mongo and Kafka I/O. Recommended mode.
+#   gevent  - GUNICORN_WORKER_CONNECTIONS greenlets per worker, needs gevent
+#             installed. Calls that block in C (e.g. a Kafka producer flush)
+#             stall every greenlet of the worker, prefer gthread while the
+#             Kafka hooks still flush synchronously.
+#
+# The app keeps no per request state on shared objects (auth state lives on
+# req.context), so the threaded and gevent modes are safe to use.
+#
+# Prometheus metrics of all workers are aggregated on /metrics when
+# prometheus_multiproc_dir points to a directory writable by the workers.
+import os
+import glob
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 1))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 150))
+accesslog = '-'
+
+
+def post_fork(server, worker):
+    # Only matters with preload_app, otherwise the app is imported after the fork.
+    # Either way every worker creates its own Redis, Kafka and Mongo clients.
+    from uggipuggi.services.connections import connections
+    connections.after_fork()
+
+
+def post_worker_init(worker):
+    # The app is loaded, fill this worker's concise view cache before it takes requests
+    from uggipuggi.services.connections import connections
+    from uggipuggi.services.concise_cache import warm_up
+    warm_up(connections.redis)
+
+
+def on_starting(server):
+    # Files left behind by a previous run would be added to the new counts
+    multiproc_dir = os.environ.get('prometheus_multiproc_dir')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # Drops the live gauges (requests in flight) of the worker which exited
+    if os.environ.get('prometheus_multiproc_dir'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
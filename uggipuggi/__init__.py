@@ -4,24 +4,28 @@ from __future__ import absolute_import
 #import __builtin__
 import os
 import time
-import builtins
 import falcon
 import logging
 import logging.config as logging_config
 import logging.handlers
 from falcon_cors import CORS
+from pymongo import monitoring
 
 from bson import json_util
-from mongoengine import connection as mongo_connection
 from falcon_multipart.middleware import MultipartMiddleware
 from uggipuggi.controllers import recipe, tag, status, rating, user, user_feed, batch, activity,\
                                   redis_group, redis_contacts, redis_followers, redis_following,\
                                   user_recipes, user_activity, image_store, saved_recipes, Ping,\
                                   group_recipes, recipe_saved, recipe_liked, activity_liked 
 from uggipuggi.services.user import get_user  
+from uggipuggi.services.connections import connections
 from uggipuggi.middlewares import auth_jwt
+from uggipuggi.middlewares.policy import attach_route_policy
+from uggipuggi.middlewares.request_id import RequestIdMiddleware
+from uggipuggi.middlewares.tracing import TracingMiddleware
 from uggipuggi.middlewares.prometheus_middleware import PrometheusMiddleware
-from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
+from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer, RequestIdFilter
+from uggipuggi.helpers.tracing import MongoCommandTracer
 from uggipuggi.constants import DATETIME_FORMAT, AUTH_SHARED_SECRET_ENV, \
                                 MAX_TOKEN_AGE, TOKEN_EXPIRATION_SECS,\
                                 VERIFY_PHONE_TOKEN_EXPIRATION_SECS, SERVER_RUN_MODE
@@ -32,6 +36,8 @@ class UggiPuggi(object):
     def __init__(self, config):
 
         self.config = config
+        # Redis, Kafka and Mongo clients are created per worker process from these settings
+        connections.configure(config)
 
         shared_secret = os.getenv(AUTH_SHARED_SECRET_ENV, 'uggipuggi')
         
@@ -58,10 +64,19 @@ class UggiPuggi(object):
         )
         
         self.prometheus_metrics = PrometheusMiddleware()
-        self.app = falcon.API(middleware=[cors.middleware,
-                                          MultipartMiddleware(),
-                                          self.auth_middleware,
-                                          self.prometheus_metrics])
+        # RequestIdMiddleware goes first so that every log line of the request carries its id
+        middleware = [RequestIdMiddleware()]
+        self.tracer = None
+        tracing_config = self.config.get('tracing', {})
+        if tracing_config.get('enabled', 'false').lower() == 'true':
+            self.tracer = init_tracer('uggipuggi_backend', tracing_config)
+            # Has to be registered before the first MongoClient is created in _setup_db
+            monitoring.register(MongoCommandTracer())
+            middleware.append(TracingMiddleware(self.tracer))
+        self.app = falcon.API(middleware=middleware + [cors.middleware,
+                                                       MultipartMiddleware(),
+                                                       self.auth_middleware,
+                                                       self.prometheus_metrics])
 
         if SERVER_RUN_MODE == 'DEBUG':
             self.logger = self._set_logging()
@@ -76,67 +91,59 @@ class UggiPuggi(object):
 
     def _load_routes(self):
         self.logger.info('Loading routes ...')
-        self.app.add_route('/ping', Ping())
-        self.app.add_route('/metrics', self.prometheus_metrics)
+        self._add_route('/ping', Ping())
+        self._add_route('/metrics', self.prometheus_metrics)
         
-        self.app.add_route('/recipes', recipe.Collection())
-        self.app.add_route('/recipes/{id}', recipe.Item())
+        self._add_route('/recipes', recipe.Collection())
+        self._add_route('/recipes/{id}', recipe.Item())
         
-        self.app.add_route('/activity', activity.Collection())
-        self.app.add_route('/activity/{id}', activity.Item())
+        self._add_route('/activity', activity.Collection())
+        self._add_route('/activity/{id}', activity.Item())
         
-        self.app.add_route('/get_userid', user.ID())
-        self.app.add_route('/users', user.Collection())
-        self.app.add_route('/users/{id}', user.Item())
+        self._add_route('/get_userid', user.ID())
+        self._add_route('/users', user.Collection())
+        self._add_route('/users/{id}', user.Item())
         
-        self.app.add_route('/recipe_liked/{id}', recipe_liked.Item())
-        self.app.add_route('/recipe_saved/{id}', recipe_saved.Item())
-        self.app.add_route('/activity_liked/{id}', activity_liked.Item())
+        self._add_route('/recipe_liked/{id}', recipe_liked.Item())
+        self._add_route('/recipe_saved/{id}', recipe_saved.Item())
+        self._add_route('/activity_liked/{id}', activity_liked.Item())
         
-        self.app.add_route('/saved_recipes/{id}', saved_recipes.Item())
-        self.app.add_route('/user_recipes/{id}', user_recipes.Item())
-        self.app.add_route('/user_activity/{id}', user_activity.Item())
+        self._add_route('/saved_recipes/{id}', saved_recipes.Item())
+        self._add_route('/user_recipes/{id}', user_recipes.Item())
+        self._add_route('/user_activity/{id}', user_activity.Item())
         
-        self.app.add_route('/feed', user_feed.Item())
+        self._add_route('/feed', user_feed.Item())
         
-        self.app.add_route('/groups', redis_group.Collection())
-        self.app.add_route('/groups/{id}', redis_group.Item())
-        self.app.add_route('/group_recipes/{id}', group_recipes.Item())
+        self._add_route('/groups', redis_group.Collection())
+        self._add_route('/groups/{id}', redis_group.Item())
+        self._add_route('/group_recipes/{id}', group_recipes.Item())
         
-        self.app.add_route('/contacts/{id}', redis_contacts.Item())
-        self.app.add_route('/followers/{id}', redis_followers.Item())
-        self.app.add_route('/following/{id}', redis_following.Item())
+        self._add_route('/contacts/{id}', redis_contacts.Item())
+        self._add_route('/contacts/{id}/sync', redis_contacts.Sync())
+        self._add_route('/followers/{id}', redis_followers.Item())
+        self._add_route('/following/{id}', redis_following.Item())
+        self._add_route('/following/{id}/bulk', redis_following.Bulk())
         
-        self.app.add_route('/register', self.register)
-        self.app.add_route('/verify', self.verify_phone)
-        self.app.add_route('/logout', self.logout)
-        self.app.add_route('/forgot_password', self.forgot_password)
-        self.app.add_route('/password_change', self.pw_change)
-        self.app.add_route('/images/{id}', image_store.Item())
+        self._add_route('/register', self.register)
+        self._add_route('/verify', self.verify_phone)
+        self._add_route('/logout', self.logout)
+        self._add_route('/forgot_password', self.forgot_password)
+        self._add_route('/password_change', self.pw_change)
+        self._add_route('/images/{id}', image_store.Item())
         
         # batch resources
-        self.app.add_route('/batch/recipes', batch.RecipeCollection())
+        self._add_route('/batch/recipes', batch.RecipeCollection())
         self.logger.info('Loading routes FINISHED')
         
-    def _setup_db(self, db_section='mongodb'):
+    def _add_route(self, template, resource):
+        # AuthMiddleware looks up the policy compiled here instead of matching paths per request
+        attach_route_policy(resource, template)
+        self.app.add_route(template, resource)
+        
+    def _setup_db(self):
         self.logger.info('connecting to database ...')
-        # get all config values about DB
-        db_config = self.config[db_section]  # map
-
-        self.logger.info(db_config)
-        db_name = db_config.get('name')
-
-        attr_map = {'host': 'str', 'port': 'int', 'username': 'str', 'password': 'str'}
-
-        kwargs = {}
-        for key, typ in attr_map.items():
-            typecast_fn = getattr(builtins, typ)
-            # cast the value from db_config accordingly if key-value pair exists
-            kwargs[key] = typecast_fn(db_config.get(key)) if db_config.get(key) else None
-
-        mongo_connection.disconnect('default')  # disconnect previous default connection if any
-
-        self.db = mongo_connection.connect(db_name, **kwargs)
+        # connect=False, every worker opens its own sockets on its first query
+        self.db = connections.connect_mongo()
 
         self.logger.info('connected to Database: {}'.format(self.db))
         
@@ -146,21 +153,28 @@ class UggiPuggi(object):
             'disable_existing_loggers': False,
             'formatters': {
                 'standard': {
-                    'format': '(%(asctime)s; %(filename)s:%(lineno)d)'
+                    'format': '(%(asctime)s; %(filename)s:%(lineno)d; %(request_id)s)'
                               '%(levelname)s: %(message)s ',                            
                     'datefmt': "%Y-%m-%d %H:%M:%S",
                 }
             },
+            'filters': {
+                'request_id': {
+                    '()': RequestIdFilter,
+                }
+            },
             'handlers': {
                 'console': {
                     'level': 'DEBUG',
                     'formatter': 'standard',
                     'class': 'logging.StreamHandler',
+                    'filters': ['request_id'],
                 },
                 'rotate_file': {
                     'level': 'DEBUG',
                     'formatter': 'standard',
                     'class': 'logging.handlers.RotatingFileHandler',
+                    'filters': ['request_id'],
                     'filename': 'logs/uggipuggi_backend.log',
                     'encoding': 'utf8',
                     'maxBytes': 100000,
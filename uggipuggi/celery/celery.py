@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 import os, sys
 from celery import Celery
+from celery.signals import worker_process_init
 
 #sys.path.append('/home/dubba/work/webdev/backends/up_be_falcon')
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -10,11 +11,25 @@ sys.path.append(ROOT_DIR)
 celery = Celery(include=[
                          'uggipuggi.tasks.resource_add_task',
                          'uggipuggi.tasks.user_tasks',
+                         'uggipuggi.tasks.concise_view_tasks',
+                         'uggipuggi.tasks.counter_tasks',
+                         'uggipuggi.tasks.engagement_tasks',
+                         'uggipuggi.tasks.key_tasks',
                         ])
 
 # import celery config file
 celery.config_from_object('conf.celeryconfig')
 
+from conf import get_config
+from uggipuggi.services.connections import connections
+connections.configure(get_config(os.environ.get('UGGIPUGGI_BACKEND_ENV', 'docker_compose')))
+
+
+@worker_process_init.connect
+def init_worker_connections(**kwargs):
+    # Pool processes are forked from the main worker, never reuse its clients
+    connections.after_fork()
+
 if __name__ == '__main__':
     # cd to project maindir
     # celery -A uggipuggi.celery.celery worker -l debug -n worker.high -Q high        
@@ -15,6 +15,15 @@ INTEGER_MAX = sys.maxsize - 1
 
 PAGE_LIMIT = 25
 
+# Request body size limits in bytes, bulk routes opt in to the larger one
+MAX_REQUEST_BODY_SIZE = 1024 * 1024
+MAX_BULK_REQUEST_BODY_SIZE = 16 * 1024 * 1024
+
+# Background log shipping: records queued beyond LOG_QUEUE_SIZE are dropped
+# instead of blocking the request, the shipper sends up to LOG_BATCH_SIZE at once
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 200
+
 MAX_TOKEN_AGE = 86400
 GCLOUD_SERVICE_CREDS='../conf/valid-cedar-274311-63d431d63cfe.json'
 FCM_SERVER_KEY = 'AAAAzPk-Tf4:APA91bGwttdFLH671-48ekIwFNW2htVppUH0qorLPxNEUNAQC_XtOcTDG2I2hzqn3p6JQ0wySadD_AV32agw35xYVXukCYsUQAv6gnf5xvdJhnQRZS_uZJq65V4hQv8jpI3Hp57FPCnu'
@@ -25,13 +34,85 @@ OTP_LENGTH = 6
 TOKEN_EXPIRATION_SECS = 604800
 VERIFY_PHONE_TOKEN_EXPIRATION_SECS = 900
 
+# Per worker cache of role and phone_last_verified used by AuthMiddleware
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_CACHE_TTL  = 300
+IDENTITY_INVALIDATION_CHANNEL = 'identity_invalidate'
+
+# Per worker cache of verified auth token claims, entries expire with the token
+TOKEN_CACHE_SIZE = 50000
+TOKEN_REVOCATION_CHANNEL = 'token_revoke'
+
+# Per worker cache of decoded recipe and activity concise views, writers publish the
+# changed key on CONCISE_INVALIDATION_CHANNEL, the TTL bounds staleness if one is missed
+CONCISE_CACHE_SIZE = 20000
+CONCISE_CACHE_TTL  = 60
+CONCISE_CACHE_WARM_UP = 500
+CONCISE_INVALIDATION_CHANNEL = 'concise_invalidate'
+
+# Sets of users hold integer ids allocated at verification, the per worker caches of
+# the id mapping need no invalidation as ids never change
+USER_ID_CACHE_SIZE = 100000
+USER_ID_CACHE_TTL  = 3600
+# Ids map back to user ids in hashes of UID_BUCKET_SIZE ids, kept small to stay compact
+UID_BUCKET_SIZE    = 100
+
+# Like, save and comment counts are kept in redis and written behind to mongo every
+# COUNTER_FLUSH_INTERVAL seconds, COUNTER_FLUSH_BATCH updates per bulk_write
+COUNTER_FLUSH_INTERVAL = 30
+COUNTER_FLUSH_BATCH    = 1000
+
+# Like and save events are appended to the ENGAGEMENT_EVENTS stream by the toggle
+# script, capped near ENGAGEMENT_STREAM_MAXLEN, and forwarded to kafka every
+# ENGAGEMENT_FORWARD_INTERVAL seconds, ENGAGEMENT_FORWARD_BATCH per read
+ENGAGEMENT_STREAM_MAXLEN    = 100000
+ENGAGEMENT_FORWARD_INTERVAL = 2
+ENGAGEMENT_FORWARD_BATCH    = 500
+
 AUTH_SERVER_NAME = "bouncer"
 AUTH_HEADER_USER_ID = "X-Gobbl-User-ID"
 AUTH_SHARED_SECRET_ENV = "DUBBA_SECRET"
+REQUEST_ID_HEADER = "X-Request-ID"
+# Sent with a page of the feed, or of a user list, when there is a next one, pass it back as ?cursor=
+FEED_CURSOR_HEADER = "X-Next-Cursor"
 
 # REDIS constants 
 MAX_USER_FEED_LENGTH = 150
 MAX_USER_FEED_LOAD   = 50
+# Users per page of a follower, following or contact list, and the concise view
+# fields of a hydrated page
+MAX_USER_LIST_LOAD    = 100
+USER_LIST_VIEW_FIELDS = ('display_name', 'display_pic', 'status')
+# Feed fan-out: recipients are read with SSCAN and queued FANOUT_CHUNK_SIZE per task,
+# each task updates FANOUT_SCRIPT_BATCH feeds per script call
+FANOUT_CHUNK_SIZE   = 1000
+FANOUT_SCRIPT_BATCH = 250
+# Public posts of authors with CELEBRITY_FOLLOWERS followers or more only go to their
+# timeline, followers pull up to MAX_PULLED_TIMELINES of them when reading their feed
+# and the merge is cached for PULLED_FEED_TTL seconds
+CELEBRITY_FOLLOWERS  = 10000
+MAX_PULLED_TIMELINES = 100
+PULLED_FEED_TTL      = 60
+# Most accounts one bulk request may follow and unfollow
+MAX_BULK_FOLLOW      = 1000
+# Phone numbers looked up per pipeline when syncing an address book
+CONTACTS_CHUNK_SIZE  = 500
+# Seconds a sync holds the user's address book, another sync meanwhile is refused
+# and told to retry after CONTACTS_SYNC_RETRY_AFTER seconds
+CONTACTS_SYNC_LOCK_TTL = 30
+CONTACTS_SYNC_RETRY_AFTER = 2
+# Phone numbers of users are spread over small hashes, which redis keeps compact while
+# they have at most hash-max-ziplist-entries fields, 128 by default. The bucket count
+# is picked for PHONE_DIRECTORY_CAPACITY numbers at a mean of PHONE_DIRECTORY_BUCKET_ENTRIES
+# per bucket, so at capacity only ~0.3% of buckets pass 128. Changing it means rebuilding the
+# directory, past capacity raise hash-max-ziplist-entries instead, e.g. to 256 for twice
+# as many numbers. See tests/benchmarks/bench_phone_directory.py
+PHONE_DIRECTORY_CAPACITY = 25000000
+PHONE_DIRECTORY_BUCKET_ENTRIES = 100
+PHONE_DIRECTORY_BUCKETS = PHONE_DIRECTORY_CAPACITY // PHONE_DIRECTORY_BUCKET_ENTRIES
+# Also look numbers up under the top level keys used before the directory, until
+# migrate_phone_directory has run
+PHONE_DIRECTORY_LEGACY_LOOKUP = True
 
 RECIPE_CONCISE_VIEW_FIELDS = ('images', 'recipe_name', 'likes_count', 'description', 
                               'saves_count', 'comments_count', 'cook_time', "id", 'generation_time',
@@ -50,6 +131,14 @@ GROUP_FEED    = 'grp_feed:'
 GROUP_MEMBERS = 'grp_members:'
 USER          = 'u:'
 USER_FEED     = 'u_feed:'
+USER_TIMELINE = 'u_tl:'
+PULLED_FEED   = 'u_pfeed:'
+CELEBRITIES   = 'celebs'
+COUNTER_DELTAS  = 'cnt_delta:'
+COUNTER_FLUSH   = 'cnt_flush:'
+COUNTER_BATCHES = 'cnt_batches'
+ENGAGEMENT_EVENTS       = 'eng_events'
+ENGAGEMENT_FORWARD_LOCK = 'eng_events_lock'
 USER_GROUPS   = 'u_grps:'
 USER_RECIPES  = 'u_recipes:'
 USER_ACTIVITY = 'u_act:'
@@ -59,9 +148,20 @@ RECIPE_SAVED  = 'r_saved'
 RECIPE_LIKED  = 'r_liked'
 ACTIVITY_LIKED= 'a_liked'
 CONTACTS      = 'contacts:'
+CONTACTS_BOOK    = 'contacts_book:'
+CONTACTS_PENDING = 'contacts_pending:'
+CONTACTS_DIGEST  = 'contacts_digest:'
+CONTACTS_SYNC_LOCK = 'contacts_sync_lock:'
+# Per unregistered number, the users whose address book holds it
+CONTACTS_WAITING = 'contacts_waiting:'
+# Per user, contacts who registered since the last sync
+CONTACTS_JOINED  = 'contacts_joined:'
+PHONE_DIRECTORY  = 'pdir:'
+USER_UIDS        = 'uids:'
 FOLLOWING     = 'following:'
 FOLLOWERS     = 'followers:'
 USER_SAVED_RECIPES  = 'usr:'
+USER_LIKED          = 'u_liked:'
 RECIPE_COMMENTORS   = 'recipe_commentors:'
 ACTIVITY_COMMENTORS = 'act_commentors:'
 USER_NOTIFICATION_FEED = 'unf:'
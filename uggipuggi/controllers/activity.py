@@ -15,20 +15,29 @@ from uggipuggi.constants import GCS_ACTIVITY_BUCKET, PAGE_LIMIT, ACTIVITY, USER_
                                 GAE_IMG_SERVER, IMG_STORE_PATH, ACTIVITY_CONCISE_VIEW_FIELDS, RECIPE
 from uggipuggi.controllers.image_store import ImageStore
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
-#from uggipuggi.controllers.schema.activity import CookingActivitySchema, CookingActivityCreateSchema
-from uggipuggi.models.cooking_activity import CookingActivity
-from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
+from uggipuggi.controllers.schema.activity import CookingActivitySchema, CookingActivityUpdateSchema
+from uggipuggi.helpers.schema import compile_schema, partial
+from uggipuggi.helpers.concise_view import ACTIVITY_VIEW
+from uggipuggi.services.concise_cache import invalidate_concise_view
+from uggipuggi.services.counters import incr_counter
+from uggipuggi.models.cooking_activity import Comment, CookingActivity
+from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer, lazy
+from uggipuggi.helpers.tracing import child_span
 from uggipuggi.libs.error import HTTPBadRequest, HTTPInternalServerError
 from uggipuggi.messaging.activity_kafka_producers import activity_kafka_collection_post_producer,\
                                                          activity_kafka_item_put_producer
 
 
 # -------- BEFORE_HOOK functions
-#def deserialize_create(req, res, resource, kwargs):
-    #deserialize(req, res, resource, schema=CookingActivitySchema())
+# Schemas are compiled once here instead of being interpreted on every request
+activity_create_schema = compile_schema(CookingActivitySchema())
+activity_update_schema = compile_schema(partial(CookingActivityUpdateSchema()))
 
-#def deserialize_update(req, res, id, resource):
-    #deserialize(req, res, resource, schema=CookingActivitySchema())
+def deserialize_create(req, res, resource, params):
+    deserialize(req, res, resource, params, schema=activity_create_schema)
+
+def deserialize_update(req, res, resource, params):
+    deserialize(req, res, resource, params, schema=activity_update_schema)
 
 # -------- END functions
 
@@ -89,15 +98,14 @@ class Collection(object):
         logger.debug("Query results: %d" %len(activities))
         if activities_qset.count() > 0:
             logger.debug("Sample result:")
-            logger.debug(activities[0].to_dict())
+            logger.debug("%s", lazy(activities[0].to_dict))
         # No need to use json_util.dumps here (?)                             
         resp.body = {'items': [res.to_dict() for res in activities],
                      'count': activities_qset.count()}
                                     
         resp.status = falcon.HTTP_OK
         
-    #@falcon.before(deserialize_create)
-    @falcon.before(deserialize)    
+    @falcon.before(deserialize_create)
     @falcon.after(activity_kafka_collection_post_producer)
     @statsd.timer('post_activity_collection_post')
     def on_post(self, req, resp):
@@ -107,6 +115,7 @@ class Collection(object):
         # save to DB
         activity_data = {}
         user_display_pic, user_display_name = req.redis_conn.hmget(USER+req.user_id, "display_pic", 'display_name')
+        activity_data['user_id'] = req.user_id
         activity_data['author_avatar'] = user_display_pic
         activity_data['author_display_name'] = user_display_name
         if 'multipart/form-data' in req.content_type:
@@ -135,7 +144,8 @@ class Collection(object):
             resp.body.update({"images": [img_url]})                
         else:
             activity_data['recipe_name'] = req.redis_conn.hmget(RECIPE+req.params['body']['recipe_id'], "recipe_name")[0]
-            activity = CookingActivity(**activity_data.update(req.params['body']))
+            activity_data.update(req.params['body'])
+            activity = CookingActivity(**activity_data)
             activity.save()
             resp.body = {"activity_id": str(activity.id)}
                     
@@ -144,10 +154,8 @@ class Collection(object):
         activity_dict = dict(activity._data)
         activity_dict['generation_time'] = activity.id.generation_time.strftime("%Y-%m-%d %H:%M")
         concise_view_dict = {key:activity_dict[key] for key in ACTIVITY_CONCISE_VIEW_FIELDS}
-        # redis does not accept lists, so convert it to string
-        concise_view_dict['images'] = str(activity_dict['images'])
         concise_view_dict['id'] = str(concise_view_dict['id'])
-        req.redis_conn.hmset(ACTIVITY+str(activity.id), concise_view_dict)
+        req.redis_conn.hmset(ACTIVITY+str(activity.id), ACTIVITY_VIEW.encode(concise_view_dict))
         
         req.redis_conn.zadd(USER_ACTIVITY+req.user_id, {str(activity.id): int(time.time())})
         logger.debug("Cooking Activity created with id: %s" %str(activity.id))
@@ -190,8 +198,7 @@ class Item(object):
         resp.status = falcon.HTTP_OK
 
     # TODO: handle PUT requests
-    #@falcon.before(deserialize_update)
-    @falcon.before(deserialize)
+    @falcon.before(deserialize_update)
     @falcon.after(activity_kafka_item_put_producer)
     @statsd.timer('update_activity_put')
     def on_put(self, req, resp, id):
@@ -212,12 +219,13 @@ class Item(object):
                     else:    
                         activity_data[key] = req.get_param(key)
                         
-            res = requests.post(GAE_IMG_SERVER + '/img_post', 
-                                files={'img': img_data.file}, 
-                                data={'gcs_bucket': GCS_ACTIVITY_BUCKET,
-                                      'file_name': str(activity.id) + '_' + 'activity_images.jpg',
-                                      'file_type': img_data.type
-                                     })
+            with child_span('gae.img_post', tags={'gcs_bucket': GCS_ACTIVITY_BUCKET}):
+                res = requests.post(GAE_IMG_SERVER + '/img_post', 
+                                    files={'img': img_data.file}, 
+                                    data={'gcs_bucket': GCS_ACTIVITY_BUCKET,
+                                          'file_name': str(activity.id) + '_' + 'activity_images.jpg',
+                                          'file_type': img_data.type
+                                         })
             logger.debug(res.status_code)
             logger.debug(res.text)
             if repr(res.status_code) == falcon.HTTP_OK.split(' ')[0]:
@@ -236,18 +244,20 @@ class Item(object):
                     comment = Comment(content=value['content'], user_id=value['user_id'])
                     activity.comments.append(comment)
                     activity.save()
+                    pipeline = req.redis_conn.pipeline(False)
+                    incr_counter(pipeline, ACTIVITY+id, 'comments_count')
+                    invalidate_concise_view(ACTIVITY+id, pipeline)
+                    pipeline.execute()
                     resp.activity_author_id = activity.user_id
                 else:                    
-                    activity.update(key=value)
+                    activity.update(**{key: value})
                     
             # Updating activity concise view in Redis
-            concise_view_dict = {key:activity_data[key] for key in ACTIVITY_CONCISE_VIEW_FIELDS if key in activity_data}
-            # redis does not accept lists or python objects, so converting to strings
-            if 'images' in concise_view_dict:
-                concise_view_dict['images'] = str(activity_data['images'])
-            concise_view_dict['id'] = str(concise_view_dict['id'])
+            concise_view_dict = ACTIVITY_VIEW.encode({key:activity_data[key] for key in ACTIVITY_CONCISE_VIEW_FIELDS
+                                                      if key in activity_data})
             if len(concise_view_dict) > 0:
                 req.redis_conn.hmset(ACTIVITY+id, concise_view_dict)
+                invalidate_concise_view(ACTIVITY+id, req.redis_conn)
                 
         except (ValidationError, LookUpError, InvalidQueryError, KeyError) as e:
             logger.error('Invalid fields provided for cooking activity. {}'.format(e))
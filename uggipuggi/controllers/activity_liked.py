@@ -5,11 +5,11 @@ import time
 import falcon
 import logging
 
-from uggipuggi.constants import ACTIVITY, ACTIVITY_LIKED
+from uggipuggi.constants import ACTIVITY
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.libs.error import HTTPBadRequest, HTTPUnauthorized
+from uggipuggi.services.engagement import toggle_like
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
-from uggipuggi.messaging.activity_kafka_producers import activity_liked_kafka_item_post_producer
 
 
 logger = init_logger()
@@ -24,20 +24,17 @@ class Item(object):
     @falcon.before(deserialize)
     @falcon.before(supply_redis_conn)
     @falcon.after(serialize)
-    @falcon.after(activity_liked_kafka_item_post_producer)
     @statsd.timer('post_activity_like_post')
     def on_post(self, req, resp, id):
         statsd.incr('activity_like.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-        pipeline = req.redis_conn.pipeline(True)
-        if req.params['body']['liked']:
-            pipeline.sadd(ACTIVITY_LIKED+id, req.user_id)
-            pipeline.hincrby(ACTIVITY+id, "likes_count", amount=1)
-        else:
-            pipeline.srem(ACTIVITY_LIKED+id, req.user_id)
-            pipeline.hincrby(ACTIVITY+id, "likes_count", amount=-1)
-        pipeline.hmget(ACTIVITY+id, "likes_count")
-        resp.body = {"likes_count": pipeline.execute()[-1][0]}
+        # Event as the kafka producer hook used to send it
+        event = repr([req.user_id, id, falcon.HTTP_OK])
+        changed, likes_count = toggle_like(req.redis_conn, req.user_id, ACTIVITY+id,
+                                           req.params['body']['liked'], req.kafka_topic_name, event)
+        if not changed:
+            statsd.incr('activity_liked.unchanged')
+        resp.body = {"likes_count": likes_count}
         resp.body['activity_id'] = id        
         logger.debug(resp.body)        
         resp.status = falcon.HTTP_OK
@@ -4,15 +4,53 @@ from __future__ import absolute_import
 import falcon
 import logging
 import colander
-import mongoengine as mongo
 from bson import json_util
+from uggipuggi.helpers import encoder
 from uggipuggi.helpers.json import map_query
-from uggipuggi.libs.error import HTTPBadRequest, HTTPNotAcceptable
+from uggipuggi.constants import MAX_REQUEST_BODY_SIZE
+from uggipuggi.libs.error import HTTPBadRequest, HTTPNotAcceptable, HTTPPayloadTooLarge
 
-import redis
-redis_conn = redis.Redis(host='redis', port=6379, db=0, charset="utf-8", decode_responses=True)
+from uggipuggi.services.connections import connections
 
-def deserialize(req, res, resource, params, schema=None):
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+def _media_type(content_type):
+    return (content_type or '').split(';', 1)[0].strip().lower()
+
+def _body_stream(req, max_body_size):
+    # Reject on the declared length before reading anything
+    content_length = req.content_length
+    if content_length is not None and content_length > max_body_size:
+        raise HTTPPayloadTooLarge(title='Request body too large',
+                                  description='Request body must not exceed {} bytes'.format(max_body_size))
+    return req.stream if content_length is None else req.bounded_stream
+
+def _read_body(req, max_body_size):
+    # Never read more than max_body_size + 1 bytes, even without a Content-Length
+    body = _body_stream(req, max_body_size).read(max_body_size + 1)
+    if len(body) > max_body_size:
+        raise HTTPPayloadTooLarge(title='Request body too large',
+                                  description='Request body must not exceed {} bytes'.format(max_body_size))
+    return body
+
+def _iter_ndjson(stream, max_body_size):
+    # One JSON value per line, parsed as the responder consumes them
+    read = 0
+    for line in stream:
+        read += len(line)
+        if read > max_body_size:
+            raise HTTPPayloadTooLarge(title='Request body too large',
+                                      description='Request body must not exceed {} bytes'.format(max_body_size))
+        if not line.strip():
+            continue
+        try:
+            yield encoder.loads(line)
+        except ValueError as e:
+            raise HTTPBadRequest(title='Invalid JSON',
+                                 description="I don't understand the HTTP request body: {}".format(e))
+
+def deserialize(req, res, resource, params, schema=None, max_body_size=MAX_REQUEST_BODY_SIZE,
+                extended_json=False, incremental=False):
     """
     A BEFORE hook function
     Deserializes data from the request object based on HTTP method
@@ -23,42 +61,50 @@ def deserialize(req, res, resource, params, schema=None):
     :param resource: response pbject
     :param params: parameters dict supplied by falcon
     :param schema: colander Schema object
+    :param max_body_size: larger bodies are rejected with 413 before they are parsed
+    :param extended_json: decode the body with bson.json_util, i.e. {"$oid": ..} etc.
+    :param incremental: application/x-ndjson bodies are not read here, instead
+                        req.params['body_items'] yields one parsed line at a time
     """
 
-    def _is_json_type(content_type):
-        return content_type == 'application/json'
-
     if req.method.upper() in ['POST', 'PUT', 'PATCH']:
 
         #if not _is_json_type(req.content_type):
             #raise HTTPNotAcceptable(description='JSON required. '
                                                 #'Invalid Content-Type\n{}'.format(req.content_type))
 
-        if _is_json_type(req.content_type):
-            req.params['body'] = {}    
+        media_type = _media_type(req.content_type)
+        if incremental and media_type == NDJSON_MEDIA_TYPE:
+            req.params['body'] = {}
+            req.params['body_items'] = _iter_ndjson(_body_stream(req, max_body_size), max_body_size)
+            return
+
+        if media_type != falcon.MEDIA_JSON:
+            logging.debug(req.content_type)
+            return
+
+        req.params['body'] = {}
+        body = _read_body(req, max_body_size)
+        if body.strip():
             try:
-                req_stream = req.stream.read()
-                if isinstance(req_stream, bytes):
-                    json_body = json_util.loads(req_stream.decode('utf8'))
+                if extended_json:
+                    body = json_util.loads(body.decode('utf8') if isinstance(body, bytes) else body)
                 else:
-                    json_body = json_util.loads(req_stream)
-                    
-                req.params['body'] = json_body    
-            except Exception:
-                raise falcon.HTTPBadRequest(
-                    "I don't understand the HTTP request body", traceback.format_exc())
-        
+                    body = encoder.loads(body)
+            except ValueError as e:
+                raise HTTPBadRequest(title='Invalid JSON',
+                                     description="I don't understand the HTTP request body: {}".format(e))
         else:
-            logging.debug(req.content_type)
-            
+            body = {}
+
         if schema:
             try:
-                json_body = schema.deserialize(json_body)
+                body = schema.deserialize(body)
             except colander.Invalid as e:
                 raise HTTPBadRequest(title='Invalid Value',
                                      description='Invalid arguments '
                                                  'in params:\n{}'.format(e.asdict()))
-
+        req.params['body'] = body
         
     elif req.method.upper() in ['OPTIONS', 'HEAD', 'GET', 'DELETE']:
 
@@ -87,28 +133,22 @@ def deserialize(req, res, resource, params, schema=None):
         logging.debug(req.params['query'])
         logging.debug("%%%%%%%%%%%%%%%%%%")
 
-def serialize(req, res, resource):
+def serialize(req, res, resource, dumps=encoder.dumps):
     """
     An AFTER hook function
-    Serializes the data from dict to json-formatted string
+    Serializes the response body to json-formatted bytes in res.data
     :param req: request object
     :param res: response object
     :param resource: resource object
+    :param dumps: encoder returning bytes, see uggipuggi.helpers.encoder
     """
-    def _to_json(obj):
-        # base cases:
-        if isinstance(obj, mongo.Document):
-            return obj._data
-        if isinstance(obj, dict):
-            return {k: _to_json(v) for k, v in obj.items()}
-        if isinstance(obj, mongo.queryset.queryset.QuerySet) or isinstance(obj, list):
-            return [_to_json(item) for item in obj]
-        return obj
-
-    res.body = json_util.dumps(_to_json(res.body))
+    res.data = dumps(res.body)
+    # falcon prefers body over data, so it must be cleared
+    res.body = None
     
 def supply_redis_conn(req, resp, resource, params):
-    req.redis_conn = redis_conn
+    req.redis_conn = connections.redis
     
 def get_redis_conn():
-    return redis_conn
\ No newline at end of file
+    # The redis client of this process, see uggipuggi.services.connections
+    return connections.redis
\ No newline at end of file
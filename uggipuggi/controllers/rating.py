@@ -5,6 +5,7 @@ import falcon
 from uggipuggi import constants
 from uggipuggi.controllers.hooks import deserialize, serialize
 from uggipuggi.controllers.schema.rating import RecipeRatingSchema
+from uggipuggi.helpers.schema import compile_schema
 from uggipuggi.models.recipe import Recipe
 from uggipuggi.models.rating import RecipeRating
 from uggipuggi.models.user import User
@@ -17,8 +18,11 @@ logger = init_logger()
 statsd = init_statsd('up.controllers.rating')
 
 # -------- BEFORE_HOOK functions
-def deserialize_create(req, res, resource):
-    deserialize(req, res, resource, schema=RecipeRatingSchema())
+# Schemas are compiled once here instead of being interpreted on every request
+rating_create_schema = compile_schema(RecipeRatingSchema())
+
+def deserialize_create(req, res, resource, params):
+    deserialize(req, res, resource, params, schema=rating_create_schema)
 
 # -------- END functions
 
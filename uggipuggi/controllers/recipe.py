@@ -7,18 +7,21 @@ import falcon
 import logging
 import requests
 import mongoengine
-from copy import deepcopy
 from google.cloud import storage as gc_storage
 from mongoengine.errors import DoesNotExist, MultipleObjectsReturned, ValidationError, \
                                LookUpError, InvalidQueryError 
 
 from uggipuggi.constants import GCS_RECIPE_BUCKET, PAGE_LIMIT, RECIPE, USER_RECIPES, USER,\
-                                GAE_IMG_SERVER, IMG_STORE_PATH, RECIPE_CONCISE_VIEW_FIELDS,\
-                                RECIPE_SAVED, RECIPE_LIKED
+                                GAE_IMG_SERVER, IMG_STORE_PATH, RECIPE_CONCISE_VIEW_FIELDS
 from uggipuggi.models import ExposeLevel
 from uggipuggi.controllers.image_store import ImageStore
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
-from uggipuggi.controllers.schema.recipe import RecipeSchema, RecipeCreateSchema
+from uggipuggi.controllers.schema.recipe import RecipeSchema, RecipeUpdateSchema
+from uggipuggi.helpers.schema import compile_schema, partial
+from uggipuggi.helpers.concise_view import RECIPE_VIEW
+from uggipuggi.services.concise_cache import invalidate_concise_view
+from uggipuggi.services.counters import incr_counter
+from uggipuggi.services.engagement import viewer_flags
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
 from uggipuggi.models.recipe import Comment, Recipe 
 from uggipuggi.libs.error import HTTPBadRequest
@@ -32,15 +35,15 @@ logger = init_logger()
 statsd = init_statsd('up.controllers.recipe')
     
 # -------- BEFORE_HOOK functions
+# Schemas are compiled once here instead of being interpreted on every request
+recipe_create_schema = compile_schema(RecipeSchema())
+recipe_update_schema = compile_schema(partial(RecipeUpdateSchema()))
+
 def deserialize_create(req, res, resource, params):
-    deserialize(req, res, resource, params, schema=RecipeSchema())
+    deserialize(req, res, resource, params, schema=recipe_create_schema)
 
 def deserialize_update(req, res, resource, params):
-    deserialize(req, res, resource, params, schema=RecipeSchema())
-
-
-#def deserialize_update(req, res, id, resource):
-    #deserialize(req, res, resource, schema=RecipeSchema())
+    deserialize(req, res, resource, params, schema=recipe_update_schema)
 
 # -------- END functions
 
@@ -93,18 +96,11 @@ class Collection(object):
         # save icons in the app when we display this list in the app
         if result_count > 0:
             recipes = [dict(obj._data) for obj in recipes_qset]            
-            pipeline = req.redis_conn.pipeline(True)
-            _ = [pipeline.sismember(RECIPE_SAVED+str(recipe["id"]), req.user_id) for recipe in recipes]
-            _ = [pipeline.sismember(RECIPE_LIKED+str(recipe["id"]), req.user_id) for recipe in recipes]
-            # We get all the results as one list: first part saved and second part liked
-            saved_liked_list = pipeline.execute()
-            logger.debug("Saved Liked result:")
-            logger.debug(saved_liked_list)
-            saved = saved_liked_list[0:result_count]
-            liked = saved_liked_list[result_count:]
+            flags = viewer_flags(req.redis_conn, req.user_id, [RECIPE+str(recipe["id"]) for recipe in recipes])
             # Update recipe dictionary with additional key:values 
             # whether the requesting user saved/liked the recipe or not
-            result_recipes = [dict({"saved":s, "liked":l},**recipe) for recipe, s, l in zip(recipes, saved, liked)]
+            result_recipes = [dict({"saved":saved, "liked":liked},**recipe)
+                              for recipe, (liked, saved) in zip(recipes, flags)]
             logger.debug(result_recipes)
             # No need to use json_util.dumps here (?)                                     
             resp.body = {'items': result_recipes, 'fields': RECIPE_CONCISE_VIEW_FIELDS, 'count': result_count}
@@ -112,8 +108,7 @@ class Collection(object):
             resp.body = {'items': [], 'count': 0}
         resp.status = falcon.HTTP_OK
         
-    #@falcon.before(deserialize_create)
-    @falcon.before(deserialize)
+    @falcon.before(deserialize_create)
     @falcon.after(recipe_kafka_collection_post_producer)
     @statsd.timer('add_recipe_post')
     def on_post(self, req, resp):
@@ -160,7 +155,8 @@ class Collection(object):
             #recipe.update(images=img_urls)
             #resp.body.update({"images": img_urls})            
         else:    
-            recipe = Recipe(**recipe_data.update(req.params['body']))
+            recipe_data.update(req.params['body'])
+            recipe = Recipe(**recipe_data)
             
         recipe.save()            
         resp.body = {"recipe_id": str(recipe.id)}
@@ -175,14 +171,12 @@ class Collection(object):
         concise_view_dict['id'] = str(concise_view_dict['id'])
         if len(concise_view_dict['images']) == 0 and img_url != "":
             # This happens for multipart, as recipe.update is not yet flushed 
-            concise_view_dict['images'] = str([img_url])
-        else:
-            concise_view_dict['images'] = str(recipe_dict['images'])
+            concise_view_dict['images'] = [img_url]
         logger.debug('======================================')
         logger.debug(concise_view_dict)
         logger.debug('======================================')
-        pipeline = req.redis_conn.pipeline(True)
-        pipeline.hmset(RECIPE+str(recipe.id), concise_view_dict)            
+        pipeline = req.redis_conn.pipeline(False)
+        pipeline.hmset(RECIPE+str(recipe.id), RECIPE_VIEW.encode(concise_view_dict))
         pipeline.zadd(USER_RECIPES+req.user_id, {str(recipe.id): int(time.time())})
         pipeline.execute()
         logger.info("Recipe created with id: %s" %str(recipe.id))
@@ -210,13 +204,9 @@ class Item(object):
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
         recipe = self._try_get_recipe(id)
         # Converting MongoEngine recipe document to dictionary
-        logger.debug(recipe.to_mongo().to_dict())
-        result_recipe = deepcopy(recipe.to_mongo().to_dict())
-        pipeline = req.redis_conn.pipeline(True)
-        pipeline.sismember(RECIPE_SAVED+id, req.user_id)
-        pipeline.sismember(RECIPE_LIKED+id, req.user_id)
-        saved, liked = pipeline.execute()
-        logger.debug("%s, %s" %(repr(saved), repr(liked)))
+        result_recipe = recipe.to_mongo().to_dict()
+        logger.debug("%s", result_recipe)
+        [(liked, saved)] = viewer_flags(req.redis_conn, req.user_id, [RECIPE+id])
         result_recipe.update({"saved": saved, "liked": liked})
         resp.body = result_recipe
         resp.status = falcon.HTTP_OK
@@ -234,8 +224,7 @@ class Item(object):
         logger.info("Deleted recipe data in database: %s" %id)
         resp.status = falcon.HTTP_OK
 
-    #@falcon.before(deserialize_update)
-    @falcon.before(deserialize)
+    @falcon.before(deserialize_update)
     @falcon.after(recipe_kafka_item_put_producer)
     @statsd.timer('update_recipe_put')
     def on_put(self, req, resp, id):
@@ -284,18 +273,21 @@ class Item(object):
                                       user_name=value['user_name'])
                     recipe.comments.append(comment)
                     recipe.save()
+                    pipeline = req.redis_conn.pipeline(False)
+                    incr_counter(pipeline, RECIPE+id, 'comments_count')
+                    invalidate_concise_view(RECIPE+id, pipeline)
+                    pipeline.execute()
                     resp.recipe_author_id = recipe.user_id
                 else:
                     # Updating/adding other fields
-                    recipe.update(key=value)
+                    recipe.update(**{key: value})
 
             # Updating recipe concise view in Redis
-            concise_view_dict = {key:recipe_data[key] for key in RECIPE_CONCISE_VIEW_FIELDS if key in recipe_data}
-            # redis does not accept list, so convert to strings
-            if 'images' in concise_view_dict:
-                concise_view_dict['images'] = str(recipe_data['images'])
+            concise_view_dict = RECIPE_VIEW.encode({key:recipe_data[key] for key in RECIPE_CONCISE_VIEW_FIELDS
+                                                    if key in recipe_data})
             if len(concise_view_dict) > 0:
                 req.redis_conn.hmset(RECIPE+id, concise_view_dict)
+                invalidate_concise_view(RECIPE+id, req.redis_conn)
 
         except (ValidationError, LookUpError, InvalidQueryError, KeyError) as e:
             logger.error('Invalid fields provided for recipe. {}'.format(e))
@@ -5,11 +5,11 @@ import time
 import falcon
 import logging
 
-from uggipuggi.constants import RECIPE, RECIPE_LIKED
+from uggipuggi.constants import RECIPE
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.libs.error import HTTPBadRequest, HTTPUnauthorized
+from uggipuggi.services.engagement import toggle_like
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
-from uggipuggi.messaging.recipe_kafka_producers import recipe_liked_kafka_item_post_producer
 
 
 logger = init_logger()
@@ -24,20 +24,17 @@ class Item(object):
     @falcon.before(deserialize)
     @falcon.before(supply_redis_conn)
     @falcon.after(serialize)
-    @falcon.after(recipe_liked_kafka_item_post_producer)
     @statsd.timer('recipe_liked_post')
     def on_post(self, req, resp, id):
         statsd.incr('recipe_liked.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-        pipeline = req.redis_conn.pipeline(True)
-        if req.params['body']['liked']:
-            pipeline.sadd(RECIPE_LIKED+id, req.user_id)
-            pipeline.hincrby(RECIPE+id, "likes_count", amount=1)
-        else:
-            pipeline.srem(RECIPE_LIKED+id, req.user_id)
-            pipeline.hincrby(RECIPE+id, "likes_count", amount=-1)
-        pipeline.hmget(RECIPE+id, "likes_count")
-        resp.body = {"likes_count": pipeline.execute()[-1][0]}
+        # Event as the kafka producer hook used to send it
+        event = repr([req.user_id, id, falcon.HTTP_OK])
+        changed, likes_count = toggle_like(req.redis_conn, req.user_id, RECIPE+id,
+                                           req.params['body']['liked'], req.kafka_topic_name, event)
+        if not changed:
+            statsd.incr('recipe_liked.unchanged')
+        resp.body = {"likes_count": likes_count}
         resp.body['recipe_id'] = id
         logger.debug(resp.body)
         resp.status = falcon.HTTP_OK
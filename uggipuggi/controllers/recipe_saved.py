@@ -5,11 +5,10 @@ import time
 import falcon
 import logging
 
-from uggipuggi.constants import RECIPE, USER_SAVED_RECIPES, RECIPE_SAVED
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.libs.error import HTTPBadRequest, HTTPUnauthorized
+from uggipuggi.services.engagement import toggle_save
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
-from uggipuggi.messaging.recipe_kafka_producers import recipe_saved_kafka_item_post_producer
 
 
 logger = init_logger()
@@ -24,22 +23,17 @@ class Item(object):
     @falcon.before(deserialize)    
     @falcon.before(supply_redis_conn)
     @falcon.after(serialize)
-    @falcon.after(recipe_saved_kafka_item_post_producer)
     @statsd.timer('post_recipes_post')
     def on_post(self, req, resp, id):
         statsd.incr('recipe_saved.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-        pipeline = req.redis_conn.pipeline(True)
-        if req.params['body']['saved']:
-            pipeline.sadd(RECIPE_SAVED+id, req.user_id)
-            pipeline.zadd(USER_SAVED_RECIPES+req.user_id, {RECIPE+id: int(time.time())})
-            pipeline.hincrby(RECIPE+id, "saves_count", amount=1)
-        else:
-            pipeline.srem(RECIPE_SAVED+id, req.user_id)
-            pipeline.zrem(USER_SAVED_RECIPES+req.user_id, RECIPE+id)
-            pipeline.hincrby(RECIPE+id, "saves_count", amount=-1)
-        pipeline.hmget(RECIPE+id, "saves_count")
-        resp.body = {"saves_count": pipeline.execute()[-1][0]}
+        # Event as the kafka producer hook used to send it
+        event = repr([req.user_id, id, falcon.HTTP_OK])
+        changed, saves_count = toggle_save(req.redis_conn, req.user_id, id,
+                                           req.params['body']['saved'], req.kafka_topic_name, event)
+        if not changed:
+            statsd.incr('recipe_saved.unchanged')
+        resp.body = {"saves_count": saves_count}
         resp.body['recipe_id'] = id
         logger.debug(resp.body)
         resp.status = falcon.HTTP_OK
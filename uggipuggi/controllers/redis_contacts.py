@@ -3,19 +3,31 @@
 from __future__ import absolute_import
 import time
 import falcon
+from itertools import islice
 import logging
 from bson import json_util, ObjectId
-from uggipuggi.constants import CONTACTS
-from uggipuggi.services.user import get_user
+from uggipuggi.constants import CONTACTS, MAX_BULK_REQUEST_BODY_SIZE, CONTACTS_CHUNK_SIZE,\
+                                MAX_USER_LIST_LOAD, FEED_CURSOR_HEADER, CONTACTS_SYNC_RETRY_AFTER
+from uggipuggi.libs.error import HTTPBadRequest, HTTPConflict, HTTPTooManyRequests
+from uggipuggi.services.contacts import normalize_number, resolve_numbers, sync_contacts,\
+                                        SyncInProgress
+from uggipuggi.services.user_ids import to_uids
+from uggipuggi.services.user_lists import list_users
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.messaging.contacts_kafka_producers import contacts_kafka_item_post_producer,\
-                                                         contacts_kafka_item_put_producer
+                                                         contacts_kafka_item_put_producer,\
+                                                         contacts_kafka_sync_post_producer
 
 
 logger = init_logger()
 statsd = init_statsd('up.controllers.contacts')
 
+def deserialize_contacts(req, res, resource, params):
+    # Contact uploads can be large, accept them as a stream of phone numbers too
+    deserialize(req, res, resource, params, max_body_size=MAX_BULK_REQUEST_BODY_SIZE,
+                incremental=True)
+
 @falcon.before(supply_redis_conn)
 @falcon.after(serialize)
 class Item(object):
@@ -26,13 +38,21 @@ class Item(object):
     #@falcon.after(contacts_kafka_item_get_producer)
     @statsd.timer('get_contacts_get')
     def on_get(self, req, resp, id):
-        # Get all contacts of user
         if id != req.user_id:
             resp.status = falcon.HTTP_UNAUTHORIZED
         else:    
             req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-            contacts_id_name = CONTACTS + id
-            resp.body = req.redis_conn.smembers(contacts_id_name)
+            # A page of contacts, hydrated with concise views on ?hydrate=true
+            cursor = req.get_param('cursor')
+            limit = min(req.get_param_as_int('limit', min_value=1) or MAX_USER_LIST_LOAD, MAX_USER_LIST_LOAD)
+            try:
+                users, next_cursor = list_users(req.redis_conn, CONTACTS + id, cursor, limit,
+                                                req.get_param_as_bool('hydrate') or False)
+            except ValueError:
+                raise HTTPBadRequest(title='Invalid Value', description='Invalid contacts cursor provided. {}'.format(cursor))
+            if next_cursor is not None:
+                resp.set_header(FEED_CURSOR_HEADER, next_cursor)
+            resp.body = users
             resp.status = falcon.HTTP_OK
         
     @falcon.before(deserialize)
@@ -47,7 +67,10 @@ class Item(object):
             contacts_id_name = CONTACTS + id
             try:
                 # req.params['body']['contact_user_id'] is a list
-                req.redis_conn.srem(contacts_id_name, *req.params['body']['contact_user_id'])
+                uids = [uid for uid in to_uids(req.redis_conn, req.params['body']['contact_user_id'])
+                        if uid is not None]
+                if uids:
+                    req.redis_conn.srem(contacts_id_name, *uids)
                 logger.debug("Deleted member from user contacts in database")
                 resp.status = falcon.HTTP_OK
                 statsd.incr('delete_contact.invocations')
@@ -56,7 +79,7 @@ class Item(object):
                 resp.status = falcon.HTTP_BAD_REQUEST
                 raise falcon.HTTPMissingParam('contact_user_id')
 
-    @falcon.before(deserialize)
+    @falcon.before(deserialize_contacts)
     @falcon.after(contacts_kafka_item_put_producer)
     @statsd.timer('add_contacts_put')
     def on_put(self, req, resp, id):
@@ -65,19 +88,86 @@ class Item(object):
             resp.status = falcon.HTTP_UNAUTHORIZED
         else:
             logger.debug("Adding member to user contacts in database ... %s" %repr(id))
-            if 'contact_user_id' in req.params['body'] and len(req.params['body']['contact_user_id']) > 0:
-                req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-                contacts_id_list = CONTACTS + id
-                # req.params['body']['contact_user_id'] is a LIST of contact phone numbers
-                # So first get user_ids for these phone numbers
-                contact_user_ids = req.redis_conn.mget(req.params['body']['contact_user_id'])
-                # Only add non_none contact ids
-                req.redis_conn.sadd(contacts_id_list, *[i for i in contact_user_ids if i])
-                logger.debug("Added member to user contacts in database: %s"  %repr(req.params['body']['contact_user_id']))
-                resp.status = falcon.HTTP_OK
-                resp.body = contact_user_ids
-                statsd.incr('add_contact.invocations')
+            if 'body_items' in req.params:
+                # application/x-ndjson upload, one contact phone number per line, so
+                # the country code of national numbers comes as ?country_code=
+                phone_numbers = req.params['body_items']
+                country_code = req.get_param('country_code')
             else:
+                phone_numbers = iter(req.params['body'].get('contact_user_id', []))
+                country_code = req.params['body'].get('country_code')
+            req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
+            contacts_id_list = CONTACTS + id
+            # Only counts are kept, a streamed upload is never held in memory as a whole
+            num_numbers = num_found = 0
+            # First get user_ids for these phone numbers, a chunk at a time
+            for chunk in iter(lambda: list(islice(phone_numbers, CONTACTS_CHUNK_SIZE)), []):
+                e164_numbers = [normalize_number(number, country_code) for number in chunk]
+                found = resolve_numbers(req.redis_conn, [n for n in e164_numbers if n])
+                # Only add non_none contact ids, as integer ids
+                found_uids = [i for i in to_uids(req.redis_conn, list(found.values())) if i]
+                if found_uids:
+                    req.redis_conn.sadd(contacts_id_list, *found_uids)
+                num_numbers += len(chunk)
+                num_found += len(found_uids)
+            if not num_numbers:
                 logger.warn("Please provide contact_user_id to add to users contacts")
                 resp.status = falcon.HTTP_BAD_REQUEST
-                raise falcon.HTTPMissingParam('contact_user_id')
\ No newline at end of file
+                raise falcon.HTTPMissingParam('contact_user_id')
+            logger.debug("Added %d of %d numbers to user contacts in database" %(num_found, num_numbers))
+            resp.status = falcon.HTTP_OK
+            # The contacts themselves are read with GET, a page at a time
+            resp.body = {'num_numbers': num_numbers, 'num_contacts_found': num_found}
+            statsd.incr('add_contact.invocations')
+
+
+def deserialize_book(req, res, resource, params):
+    # A full upload carries the whole address book
+    deserialize(req, res, resource, params, max_body_size=MAX_BULK_REQUEST_BODY_SIZE)
+
+@falcon.before(supply_redis_conn)
+@falcon.after(serialize)
+class Sync(object):
+    def __init__(self):
+        self.kafka_topic_name = 'contacts_sync'
+
+    @falcon.before(deserialize_book)
+    @falcon.after(contacts_kafka_sync_post_producer)
+    @statsd.timer('sync_contacts_post')
+    def on_post(self, req, resp, id):
+        """
+        Body: {'digest': returned by the last sync, 'added': [phone numbers],
+        'removed': [phone numbers], 'country_code': of national numbers}, or
+        {'numbers': [the whole address book], 'country_code': ...} for the
+        first sync and after a 409, which means the digest is out of date. A
+        429 means another sync of the book runs, retry after Retry-After.
+        """
+        req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
+        if id != req.user_id:
+            resp.status = falcon.HTTP_UNAUTHORIZED
+            return
+        body = req.params['body']
+        lists = [body.get(name, []) for name in ('added', 'removed')]
+        if 'numbers' in body:
+            lists.append(body['numbers'])
+        if not all(isinstance(numbers, list) for numbers in lists):
+            raise HTTPBadRequest(title='Invalid Value',
+                                 description='added, removed and numbers must be lists of phone numbers')
+        try:
+            result = sync_contacts(req.redis_conn, id, digest=body.get('digest'),
+                                   added=body.get('added', []), removed=body.get('removed', []),
+                                   numbers=body.get('numbers'), country_code=body.get('country_code'))
+        except SyncInProgress:
+            # The book isn't out of sync, the same request can be sent again
+            statsd.incr('sync_contacts.busy')
+            raise HTTPTooManyRequests(title='Address book sync in progress',
+                                      description='Retry the sync shortly',
+                                      retry_after=CONTACTS_SYNC_RETRY_AFTER)
+        if result is None:
+            statsd.incr('sync_contacts.conflict')
+            raise HTTPConflict(title='Address book out of sync',
+                               description='Upload the whole address book as numbers')
+        statsd.incr('sync_contacts.full' if 'numbers' in body else 'sync_contacts.delta')
+        statsd.incr('sync_contacts.joined', len(result['joined_contacts']))
+        resp.body = result
+        resp.status = falcon.HTTP_OK
@@ -3,7 +3,11 @@ import time
 import falcon
 import logging
 from bson import json_util, ObjectId
-from uggipuggi.constants import FOLLOWERS, USER
+from uggipuggi.constants import MAX_USER_LIST_LOAD, FEED_CURSOR_HEADER
+from uggipuggi.helpers.keys import followers_key
+from uggipuggi.libs.error import HTTPBadRequest
+from uggipuggi.services.follows import remove_followers
+from uggipuggi.services.user_lists import list_users
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.messaging.followers_kafka_producers import followers_kafka_item_post_producer
@@ -22,14 +26,22 @@ class Item(object):
     #@falcon.after(group_kafka_item_get_producer)
     @statsd.timer('get_followers_get')
     def on_get(self, req, resp, id):
-        # Get all followers of user
         statsd.incr('get_followers.invocations')
         if id != req.user_id:
             resp.status = falcon.HTTP_UNAUTHORIZED
         else:    
             req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-            followers_list = FOLLOWERS + id
-            resp.body = req.redis_conn.smembers(followers_list)
+            # A page of followers, hydrated with concise views on ?hydrate=true
+            cursor = req.get_param('cursor')
+            limit = min(req.get_param_as_int('limit', min_value=1) or MAX_USER_LIST_LOAD, MAX_USER_LIST_LOAD)
+            try:
+                users, next_cursor = list_users(req.redis_conn, followers_key(id), cursor, limit,
+                                                req.get_param_as_bool('hydrate') or False)
+            except ValueError:
+                raise HTTPBadRequest(title='Invalid Value', description='Invalid followers cursor provided. {}'.format(cursor))
+            if next_cursor is not None:
+                resp.set_header(FEED_CURSOR_HEADER, next_cursor)
+            resp.body = users
             resp.status = falcon.HTTP_OK            
         
     @falcon.before(deserialize)    
@@ -44,16 +56,14 @@ class Item(object):
         else:    
             req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
             logger.debug("Deleting member from user followers in database ...")
-            followers_list = FOLLOWERS + id
             try:
-                # req.params['body']['follower_user_id'] is a list
-                req.redis_conn.srem(followers_list, *req.params['body']['follower_user_id'])
-                
-                # Change the number of followers of the followee in concise user view
-                req.redis_conn.hmset(USER + id, {'num_followers':req.redis_conn.scard(followers_list)})
-                
+                # req.params['body']['follower_user_id'] is a list, their following
+                # sets and counts change too
+                num_followers = remove_followers(req.redis_conn, id,
+                                                 req.params['body']['follower_user_id'])
                 logger.debug("Deleted member from user followers in database")
-                resp.status = falcon.HTTP_OK                
+                resp.body = {'num_followers': num_followers}
+                resp.status = falcon.HTTP_OK
             except KeyError:
                 logger.warn("Please provide follower_user_id to delete from users contact")
                 resp.status = falcon.HTTP_BAD_REQUEST
@@ -5,12 +5,16 @@ import time
 import falcon
 import logging
 from bson import json_util, ObjectId
-from uggipuggi.constants import FOLLOWERS, FOLLOWING, USER
-from uggipuggi.services.user import get_user
+from uggipuggi.constants import MAX_BULK_FOLLOW, MAX_USER_LIST_LOAD, FEED_CURSOR_HEADER
+from uggipuggi.helpers.keys import following_key
+from uggipuggi.libs.error import HTTPBadRequest
+from uggipuggi.services.follows import follow, public_profiles
+from uggipuggi.services.user_lists import list_users
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.messaging.following_kafka_producers import following_kafka_item_post_producer,\
-                                                          following_kafka_item_put_producer
+                                                          following_kafka_item_put_producer,\
+                                                          following_kafka_bulk_put_producer
 
 
 logger = init_logger()
@@ -26,16 +30,24 @@ class Item(object):
     #@falcon.after(group_kafka_item_get_producer)
     @statsd.timer('get_following_get')
     def on_get(self, req, resp, id):
-        # Get all following of user
         statsd.incr('get_following.invocations')
         if id != req.user_id:
             resp.status = falcon.HTTP_UNAUTHORIZED
-        else:    
+        else:
             req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-            user_following_list = FOLLOWING + id
-            resp.body = req.redis_conn.smembers(user_following_list)
+            # A page of following, hydrated with concise views on ?hydrate=true
+            cursor = req.get_param('cursor')
+            limit = min(req.get_param_as_int('limit', min_value=1) or MAX_USER_LIST_LOAD, MAX_USER_LIST_LOAD)
+            try:
+                users, next_cursor = list_users(req.redis_conn, following_key(id), cursor, limit,
+                                                req.get_param_as_bool('hydrate') or False)
+            except ValueError:
+                raise HTTPBadRequest(title='Invalid Value', description='Invalid following cursor provided. {}'.format(cursor))
+            if next_cursor is not None:
+                resp.set_header(FEED_CURSOR_HEADER, next_cursor)
+            resp.body = users
             resp.status = falcon.HTTP_OK
-        
+
     @falcon.before(deserialize)
     @falcon.after(following_kafka_item_post_producer)
     @statsd.timer('delete_following_post')
@@ -43,35 +55,16 @@ class Item(object):
         statsd.incr('delete_following.invocations')
         if id != req.user_id:
             resp.status = falcon.HTTP_UNAUTHORIZED
-        else:    
+        else:
             req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
             logger.debug("Deleting member from user following in database ...")
-            #following_id_name = FOLLOWING + id
             if 'public_user_id' in req.params['body']:
                 # req.params['body']['public_user_id'] is a LIST
-                user_following_list = FOLLOWING + id
-                public_user_id = req.params['body']['public_user_id']
-                req.redis_conn.srem(user_following_list, *public_user_id)
-                # Update the count of following number in the concise view
-                req.redis_conn.hmset(USER + id, 
-                                    {'num_following':req.redis_conn.scard(user_following_list)})
-                
+                # Both users' sets and counts are changed by one script call per user
+                _, num_following = follow(req.redis_conn, id, req.params['body']['public_user_id'],
+                                          add=False)
                 logger.debug("Deleted member from user following list in database")
-                
-                pipeline = req.redis_conn.pipeline(True)
-                for followee in public_user_id:
-                    public_user_followers_list = FOLLOWERS + followee
-                    pipeline.srem(public_user_followers_list, id)
-                    logger.debug("Removed user to public user's followers list in database")                            
-                pipeline.execute()
-                
-                # Change the number of followers of the followee in concise user view
-                for followee in public_user_id:
-                    public_user_followers_list = FOLLOWERS + followee
-                    # Update the count of followers number in the concise view
-                    req.redis_conn.hmset(USER + followee, 
-                                     {'num_followers':req.redis_conn.scard(public_user_followers_list)})                
-
+                resp.body = {'num_following': num_following}
                 resp.status = falcon.HTTP_OK
             else:
                 logger.warn("Please provide public_user_id to delete from users following list")
@@ -82,43 +75,72 @@ class Item(object):
     @falcon.after(following_kafka_item_put_producer)
     @statsd.timer('add_following_put')
     def on_put(self, req, resp, id):
-        # No need for authorization, anyone can follow anyone
         # We need to call this when user follows someone
         statsd.incr('add_following.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-            
+        if id != req.user_id:
+            resp.status = falcon.HTTP_UNAUTHORIZED
+            return
+
         logger.debug("Adding member to user following list in database ... %s" %repr(id))
         if 'public_user_id' in req.params['body']:
             public_user_id = req.params['body']['public_user_id']
-            public_user = get_user('id', public_user_id)
             # If user profile is not public, no followers
-            if not public_user.public_profile:
+            if public_user_id == id or not public_profiles(req.redis_conn, [public_user_id])[0]:
                 logger.warn("Cannot follow this user as the profile is not public")
                 resp.status = falcon.HTTP_FORBIDDEN
                 description = ('Cannot follow this user as the profile is not public')
                 raise falcon.HTTPForbidden('Cannot follow this user as the profile is not public',
                                            description
-                                           )            
-            user_following_list = FOLLOWING + id        
-            # Add celebrity to user's following list
-            req.redis_conn.sadd(user_following_list, public_user_id)
-            # Update the count of following number in the concise view
-            req.redis_conn.hmset(USER + id, 
-                                 {'num_following':req.redis_conn.scard(user_following_list)}) 
-            
-            logger.debug("Added member to user following list in database")
-            
-            # Add user to public user (celebrity) followers list
-            public_user_followers_list = FOLLOWERS + public_user_id
-            req.redis_conn.sadd(public_user_followers_list, id)
-            
-            # Change the number of followers of the followee in concise user view
-            req.redis_conn.hmset(USER + public_user_id, 
-                                 {'num_followers':req.redis_conn.scard(public_user_followers_list)})
-            
-            logger.debug("Added user to following followers in database")            
+                                           )
+            _, num_following = follow(req.redis_conn, id, [public_user_id])
+            logger.debug("Added user to following followers in database")
+            resp.body = {'num_following': num_following}
             resp.status = falcon.HTTP_OK
         else:
             logger.warn("Please provide public_user_id to add to users following")
             resp.status = falcon.HTTP_BAD_REQUEST
             raise falcon.HTTPMissingParam('public_user_id')
+
+
+@falcon.before(supply_redis_conn)
+@falcon.after(serialize)
+class Bulk(object):
+    def __init__(self):
+        self.kafka_topic_name = 'following_bulk'
+
+    @falcon.before(deserialize)
+    @falcon.after(following_kafka_bulk_put_producer)
+    @statsd.timer('bulk_following_put')
+    def on_put(self, req, resp, id):
+        # Follows and unfollows lists of users at once, e.g. when importing
+        # accounts, body: {'follow': [user ids], 'unfollow': [user ids]}
+        statsd.incr('bulk_following.invocations')
+        req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
+        if id != req.user_id:
+            resp.status = falcon.HTTP_UNAUTHORIZED
+            return
+        body = req.params['body']
+        to_follow = body.get('follow', [])
+        to_unfollow = body.get('unfollow', [])
+        if not isinstance(to_follow, list) or not isinstance(to_unfollow, list) or \
+           not all(isinstance(user_id, str) and ObjectId.is_valid(user_id)
+                   for user_id in to_follow + to_unfollow):
+            raise HTTPBadRequest(title='Invalid Value',
+                                 description='follow and unfollow must be lists of user ids')
+        if len(to_follow) + len(to_unfollow) > MAX_BULK_FOLLOW:
+            raise HTTPBadRequest(title='Invalid Value',
+                                 description='At most %d users can be followed or unfollowed at once'
+                                             %MAX_BULK_FOLLOW)
+        to_follow = [user_id for user_id in set(to_follow) if user_id != id]
+        public = public_profiles(req.redis_conn, to_follow)
+        # Private profiles are skipped and reported instead of failing the whole request
+        not_public = [user_id for user_id, is_public in zip(to_follow, public) if not is_public]
+        to_follow = [user_id for user_id, is_public in zip(to_follow, public) if is_public]
+        followed, _ = follow(req.redis_conn, id, to_follow)
+        unfollowed, num_following = follow(req.redis_conn, id, list(set(to_unfollow)), add=False)
+        statsd.incr('bulk_following.followed', followed)
+        statsd.incr('bulk_following.unfollowed', unfollowed)
+        resp.body = {'followed': followed, 'unfollowed': unfollowed,
+                     'num_following': num_following, 'not_public': not_public}
+        resp.status = falcon.HTTP_OK
@@ -12,6 +12,7 @@ from uggipuggi.libs.error import HTTPBadRequest, HTTPInternalServerError
 from uggipuggi.constants import GROUP, GROUP_MEMBERS, USER_GROUPS, GCS_GROUP_BUCKET, \
                                 GAE_IMG_SERVER, IMG_STORE_PATH
 from uggipuggi.controllers.image_store import ImageStore
+from uggipuggi.services.user_ids import to_uids, to_user_ids
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.messaging.group_kafka_producers import group_kafka_item_put_producer, \
@@ -73,7 +74,7 @@ class Collection(object):
             group_name = req.params['body']['group_name']
             group_members_list = req.params['body']['member_id']
             
-        pipeline = req.redis_conn.pipeline(True)        
+        pipeline = req.redis_conn.pipeline(False)        
         pipeline.hmset(group_id_name, {
             'group_name'  : group_name,
             'group_pic'   : img_url,
@@ -83,8 +84,9 @@ class Collection(object):
                         
         # Add admin (current user) to group_members        
         group_members_list.append(req.user_id)
-        # Add members to the groups' members list
-        pipeline.sadd(group_members_id_name, *group_members_list)
+        # Add members to the groups' members list, by integer id
+        member_uids = [uid for uid in to_uids(req.redis_conn, group_members_list) if uid is not None]
+        pipeline.sadd(group_members_id_name, *member_uids)
         
         # Add this group to set of groups a user belongs to
         # Note that now group_members_list include admin
@@ -110,14 +112,16 @@ class Collection(object):
             resp.status = falcon.HTTP_UNAUTHORIZED
             return
         else:
-            group_members_id_name = GROUP_MEMBERS + group_id
-            pipeline = req.redis_conn.pipeline(True)
+            group_members_id_name = GROUP_MEMBERS + req.params['query']['group_id']
+            pipeline = req.redis_conn.pipeline(False)
             group_keys = req.redis_conn.hgetall(group_id_name).keys()
             req.redis_conn.hdel(group_id_name, *group_keys)
             group_members = req.redis_conn.smembers(group_members_id_name)
             
             # Remove this group from all members group list
-            for member in group_members:
+            for member in to_user_ids(req.redis_conn, group_members):
+                if member is None:
+                    continue
                 user_groups_id = USER_GROUPS + member
                 pipeline.srem(user_groups_id, group_id_name)
             
@@ -151,7 +155,7 @@ class Item(object):
         # Should we also get members?                
         # This is a get request, so body in req.params
         if 'members' in req.params['query']:
-            resp.body['members'] = list(req.redis_conn.smembers(group_members_id_name))
+            resp.body['members'] = to_user_ids(req.redis_conn, req.redis_conn.smembers(group_members_id_name))
                 
         resp.status = falcon.HTTP_OK
         
@@ -171,10 +175,13 @@ class Item(object):
             resp.status = falcon.HTTP_UNAUTHORIZED
             return
         else:
-            group_members_id_name = GROUP_MEMBERS + group_id
+            group_members_id_name = GROUP_MEMBERS + id
             logger.debug("Deleting member from group data in database ...")
-            pipeline = req.redis_conn.pipeline(True)                
-            pipeline.srem(group_members_id_name, *req.params['query']['member_id'])
+            pipeline = req.redis_conn.pipeline(False)                
+            member_uids = [uid for uid in to_uids(req.redis_conn, req.params['query']['member_id'])
+                           if uid is not None]
+            if member_uids:
+                pipeline.srem(group_members_id_name, *member_uids)
             # Remove this group from this member's group list
             for group_member in req.params['query']['member_id']:
                 user_groups_id = USER_GROUPS + group_member
@@ -199,7 +206,7 @@ class Item(object):
             resp.status = falcon.HTTP_UNAUTHORIZED
             return
         else:
-            pipeline = req.redis_conn.pipeline(True)
+            pipeline = req.redis_conn.pipeline(False)
             if 'multipart/form-data' in req.content_type:
                 img_data = req.get_param('group_pic')
                 image_name = '_'.join([group_id_name, str(int(time.time())), 'group_pic'])
@@ -234,11 +241,14 @@ class Item(object):
         else:
             group_members_id_name = GROUP_MEMBERS + id
             logger.debug("Adding members to the group: ")
-            pipeline = req.redis_conn.pipeline(True)
-            pipeline.sadd(group_members_id_name, *req.params['body']['member_id'])
+            pipeline = req.redis_conn.pipeline(False)
+            member_uids = [uid for uid in to_uids(req.redis_conn, req.params['body']['member_id'])
+                           if uid is not None]
+            if member_uids:
+                pipeline.sadd(group_members_id_name, *member_uids)
             for member in req.params['body']['member_id']:
                 user_groups_id = USER_GROUPS + member
-                pipeline.srem(user_groups_id, group_id_name)                            
+                pipeline.sadd(user_groups_id, group_id_name)
             pipeline.execute()
         logger.debug("Added members to group in database")
         resp.status = falcon.HTTP_OK
\ No newline at end of file
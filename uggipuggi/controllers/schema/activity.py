@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import colander
+from uggipuggi.constants import TWEET_CHAR_LENGTH
+from uggipuggi.controllers.schema.common import Images, Tags
+
+class ActivityCommentSchema(colander.MappingSchema):
+    user_id = colander.SchemaNode(colander.String())
+    content = colander.SchemaNode(colander.String(), validator=colander.Length(max=TWEET_CHAR_LENGTH))
+
+class CookingActivitySchema(colander.MappingSchema):
+    # user_id, recipe_name, author details and counters are set by the server
+    recipe_id    = colander.SchemaNode(colander.String())
+    description  = colander.SchemaNode(colander.String(), missing='', validator=colander.Length(max=TWEET_CHAR_LENGTH))
+    images       = Images(missing=colander.drop)
+    expose_level = colander.SchemaNode(colander.Int(), missing=colander.drop)
+    recipients   = Tags(missing=colander.drop)
+    tags         = Tags(missing=colander.drop)
+    category     = colander.SchemaNode(colander.String(), missing=colander.drop)
+    prep_time    = colander.SchemaNode(colander.Int(), missing=colander.drop)
+    cook_time    = colander.SchemaNode(colander.Int(), missing=colander.drop)
+
+class CookingActivityUpdateSchema(CookingActivitySchema):
+    comment = ActivityCommentSchema()
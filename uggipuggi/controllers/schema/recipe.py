@@ -7,30 +7,35 @@ from uggipuggi.constants import TWEET_CHAR_LENGTH
 from uggipuggi.controllers.schema.common import Images, Tags, Ingredients,\
      RecipeSteps, IngredientsQuant
 
+class CommentSchema(colander.MappingSchema):
+    user_id   = colander.SchemaNode(colander.String())
+    user_name = colander.SchemaNode(colander.String())
+    content   = colander.SchemaNode(colander.String(), validator=colander.Length(max=TWEET_CHAR_LENGTH))
+
 class RecipeSchema(colander.MappingSchema):
     # timestamp ?
+    # user_id, author details and the likes/saves/comments counters are set
+    # by the server, they are dropped if a client sends them
     recipe_name  = colander.SchemaNode(colander.String())
-    user_id      = colander.SchemaNode(colander.String())
-    user_name    = colander.SchemaNode(colander.String())
     steps = RecipeSteps()
-    likes_count  = colander.SchemaNode(colander.Int())
     ingredients        = Ingredients()
     ingredients_quant  = IngredientsQuant()
     ingredients_metric = Ingredients()
     
-    expose_level     = colander.SchemaNode(colander.Int())    
-    ingredients_imgs = Ingredients()
-    ingredients_ids  = Ingredients()
-    tips = Tags()    
+    expose_level     = colander.SchemaNode(colander.Int(), missing=colander.drop)
+    comments_disabled = colander.SchemaNode(colander.Boolean(), missing=colander.drop)
+    ingredients_imgs = Images(missing=colander.drop)
+    ingredients_ids  = Ingredients(missing=colander.drop)
+    tips = Tags(missing=colander.drop)
     description = colander.SchemaNode(colander.String(), missing='', validator=colander.Length(max=TWEET_CHAR_LENGTH))
-    images = Images()
-    tags = Tags()
-    category = colander.SchemaNode(colander.String()) 
-    rating_count = colander.SchemaNode(colander.Int())
-    shares_count = colander.SchemaNode(colander.Int())    
-    rating_total = colander.SchemaNode(colander.Int())
-    prep_time    = colander.SchemaNode(colander.Int())
-    cook_time    = colander.SchemaNode(colander.Int())
+    images = Images(missing=colander.drop)
+    tags = Tags(missing=colander.drop)
+    category = colander.SchemaNode(colander.Int())
+    ack_category = colander.SchemaNode(colander.Int(), missing=colander.drop)
+    ack_text     = colander.SchemaNode(colander.String(), missing=colander.drop)
+    video_url    = colander.SchemaNode(colander.String(), validator=colander.url, missing=colander.drop)
+    prep_time    = colander.SchemaNode(colander.Int(), missing=colander.drop)
+    cook_time    = colander.SchemaNode(colander.Int(), missing=colander.drop)
     #last_modified = DateTimeField(required=False)
     #comments     = ListField(EmbeddedDocumentField(Comment), required=False)
  
@@ -38,4 +43,7 @@ class Recipes(colander.SequenceSchema):
     recipe = RecipeSchema()
     
 class RecipeCreateSchema(RecipeSchema):
-    recipes = Recipes()    
\ No newline at end of file
+    recipes = Recipes()    
+
+class RecipeUpdateSchema(RecipeSchema):
+    comment = CommentSchema()
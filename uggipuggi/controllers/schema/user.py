@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import colander
+
+
+class UserUpdateSchema(colander.MappingSchema):
+    # Phone, verification, account state and display pic are only changed
+    # through their own flows, so they are not accepted here. Role is, but
+    # only from an admin, which user.Item.on_put checks
+    country_code    = colander.SchemaNode(colander.String(), validator=colander.Length(min=2, max=3))
+    role            = colander.SchemaNode(colander.Int())
+    public_profile  = colander.SchemaNode(colander.Boolean())
+    app_platform    = colander.SchemaNode(colander.String())
+    status          = colander.SchemaNode(colander.String(), validator=colander.Length(max=50))
+    display_name    = colander.SchemaNode(colander.String(), validator=colander.Length(min=4, max=40))
+    email           = colander.SchemaNode(colander.String(), validator=colander.Email())
+    first_name      = colander.SchemaNode(colander.String())
+    last_name       = colander.SchemaNode(colander.String())
+    gender          = colander.SchemaNode(colander.String(), validator=colander.Length(min=4, max=6))
+    facebook_id     = colander.SchemaNode(colander.Int())
+    twitter_id      = colander.SchemaNode(colander.String())
+    instagram_id    = colander.SchemaNode(colander.String())
+    device_registration_id = colander.SchemaNode(colander.String())
+    searchable_by_display_name = colander.SchemaNode(colander.Boolean())
@@ -15,8 +15,13 @@ from mongoengine.errors import DoesNotExist, MultipleObjectsReturned, Validation
 #from manage import config as uggipuggi_config
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.controllers.image_store import ImageStore
+from uggipuggi.controllers.schema.user import UserUpdateSchema
+from uggipuggi.helpers.schema import compile_schema, partial
 from uggipuggi.models.user import User, Role
+from uggipuggi.services.identity import invalidate_identity
+from uggipuggi.services.phone_directory import lookup_phones
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
+from uggipuggi.helpers.concise_view import USER_VIEW
 from uggipuggi.libs.error import HTTPBadRequest, HTTPUnauthorized, HTTPInternalServerError
 from uggipuggi.messaging.user_kafka_producers import user_kafka_item_get_producer,\
                                                      user_kafka_item_put_producer
@@ -25,6 +30,12 @@ from uggipuggi.constants import USER, GCS_ALLOWED_EXTENSION, GCS_USER_BUCKET, IM
                                 BACKEND_ALLOWED_EXTENSIONS, PAGE_LIMIT, GAE_IMG_SERVER
 
 # -------- BEFORE_HOOK functions
+# Schemas are compiled once here instead of being interpreted on every request
+user_update_schema = compile_schema(partial(UserUpdateSchema()))
+
+def deserialize_update(req, res, resource, params):
+    deserialize(req, res, resource, params, schema=user_update_schema)
+
 # -------- END functions
 
 logger = init_logger()
@@ -41,7 +52,7 @@ class ID(object):
         data = req.params.get('body')
         if 'phone_numbers' not in data:
             raise HTTPBadRequest(title='Invalid Value', description='Please provide phone numbers. {}'.format(e))
-        user_ids = req.redis_conn.mget(data['phone_numbers'])
+        user_ids = lookup_phones(req.redis_conn, data['phone_numbers'])
         resp.body = {'items': user_ids, 'count': len(user_ids)}
         resp.status = falcon.HTTP_OK
         
@@ -95,14 +106,20 @@ class Item(object):
         except (ValidationError, DoesNotExist, MultipleObjectsReturned) as e:
             raise HTTPBadRequest(title='Invalid Value', description='Invalid userID provided. {}'.format(e))
 
+    def _check_role_change(self, req, user_data):
+        # Users can't raise their own role, only an admin changes roles
+        if 'role' in user_data and not req.context.identity.role_satisfy(Role.ADMIN):
+            raise HTTPUnauthorized(title='Unauthorized Request',
+                                   description='Only an admin can change the role of a user')
+
     # TODO: handle PUT requests
-    @falcon.before(deserialize)
+    @falcon.before(deserialize_update)
     @falcon.before(supply_redis_conn)
     @falcon.after(user_kafka_item_put_producer)
     @statsd.timer('update_user_put')
     def on_put(self, req, resp, id):
         statsd.incr('user_update.invocations')
-        if req.user_id != id and not User.objects.get(id=req.user_id).role_satisfy(Role.ADMIN):
+        if req.user_id != id and not req.context.identity.role_satisfy(Role.ADMIN):
             raise HTTPUnauthorized(title='Unauthorized Request',
                                    description='Not allowed to alter user resource: {}'.format(id))
 
@@ -124,6 +141,7 @@ class Item(object):
                     else:    
                         user_data[key] = req.get_param(key)
                         
+            self._check_role_change(req, user_data)
             image_name = '_'.join([str(user.id), str(int(time.time())), 'display_pic'])
             try:
                 image_path = self.img_store.save(img_data.file, image_name, img_data.type)
@@ -142,11 +160,17 @@ class Item(object):
         else:
             user_data = req.params.get('body')
             logger.debug(user_data)
+            self._check_role_change(req, user_data)
             # Using dictionary to update fields
             user.update(**user_data)
         
+        if 'role' in user_data:
+            # Role is cached by AuthMiddleware on every worker
+            invalidate_identity(str(user.id), req.redis_conn)
+
         # Update concise view in Redis database
-        concise_view_dict = {key:user_data[key] for key in self.concise_view_fields if key in user_data}
+        concise_view_dict = USER_VIEW.encode({key:user_data[key] for key in self.concise_view_fields
+                                              if key in user_data})
         if len(concise_view_dict) > 0:
             req.redis_conn.hmset(USER+str(user.id), concise_view_dict)
         
@@ -160,7 +184,7 @@ class Item(object):
         statsd.incr('user_delete.invocations')
         logger.debug("Checking if user is authorized to request profile delete ...")
         # ensure requested user profile delete is request from user him/herself or admin        
-        if req.user_id != id and not User.objects.get(id=req.user_id).role_satisfy(Role.ADMIN):
+        if req.user_id != id and not req.context.identity.role_satisfy(Role.ADMIN):
             raise HTTPUnauthorized(title='Unauthorized Request',
                                    description='Not allowed to delete user resource: {}'.format(id))
             
@@ -179,8 +203,8 @@ class Item(object):
     def on_get(self, req, resp, id):
         statsd.incr('get_user_info.invocations')
         # ensure requested user full profile request is from user him/herself or admin                
-        if req.user_id != id and not User.objects.get(id=req.user_id).role_satisfy(Role.ADMIN):
-            resp.body = req.redis_conn.hgetall(USER+id)
+        if req.user_id != id and not req.context.identity.role_satisfy(Role.ADMIN):
+            resp.body = USER_VIEW.decode(req.redis_conn.hgetall(USER+id))
         else:
             user = self._try_get_user(id)
             # Converting MongoEngine User record to dictionary
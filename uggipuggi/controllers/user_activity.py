@@ -5,6 +5,8 @@ import falcon
 import logging
 
 from uggipuggi.constants import ACTIVITY, USER_ACTIVITY, ACTIVITY_CONCISE_VIEW_FIELDS
+from uggipuggi.services.concise_cache import get_concise_values
+from uggipuggi.services.engagement import viewer_flags
 from uggipuggi.controllers.hooks import serialize, supply_redis_conn
 from uggipuggi.libs.error import HTTPBadRequest
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
@@ -28,11 +30,13 @@ class Item(object):
         statsd.incr('get_user_activity.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
         activity_ids = req.redis_conn.zrange(USER_ACTIVITY+id, 0, -1)
-        pipeline = req.redis_conn.pipeline(True)
-        for activity_id in activity_ids:
-            pipeline.hmget(ACTIVITY + activity_id, *ACTIVITY_CONCISE_VIEW_FIELDS)
-        resp.body = {'items': pipeline.execute(),
-                     'fields': ACTIVITY_CONCISE_VIEW_FIELDS, 
+        keys = [ACTIVITY + activity_id for activity_id in activity_ids]
+        items = get_concise_values(req.redis_conn, keys, ACTIVITY_CONCISE_VIEW_FIELDS)
+        # Activities can't be saved
+        for values, (liked, _) in zip(items, viewer_flags(req.redis_conn, req.user_id, keys)):
+            values.append(liked)
+        resp.body = {'items': items,
+                     'fields': ACTIVITY_CONCISE_VIEW_FIELDS + ('liked',),
                     }
         resp.status = falcon.HTTP_OK
         
@@ -4,8 +4,10 @@ from __future__ import absolute_import
 import time
 import falcon
 import logging
-from uggipuggi.constants import USER_FEED, MAX_USER_FEED_LOAD, PUBLIC_RECIPES
+from uggipuggi.constants import MAX_USER_FEED_LOAD, FEED_CURSOR_HEADER
 from uggipuggi.libs.error import HTTPBadRequest
+from uggipuggi.services.feed_fanout import read_feed
+from uggipuggi.services.engagement import viewer_flags
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
 from uggipuggi.controllers.hooks import serialize, supply_redis_conn
 
@@ -24,39 +26,20 @@ class Item(object):
     def on_get(self, req, resp):
         statsd.incr('user_feed.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
-        user_feed_id = USER_FEED + req.user_id
         logger.debug("Getting user feed: %s" %req.user_id)
+        cursor = req.get_param('cursor')
+        limit = min(req.get_param_as_int('limit', min_value=1) or MAX_USER_FEED_LOAD, MAX_USER_FEED_LOAD)
         try:
-            start = req.params['query'].get('start', 0)
-            limit = req.params['query'].get('limit', MAX_USER_FEED_LOAD)
-            end = start + limit
-        except KeyError:
-            start = 0
-            limit = MAX_USER_FEED_LOAD
-            end = start + limit
-        # For the time being get all the feed
-        user_feed_item_ids = req.redis_conn.zrevrange(user_feed_id, start, end)
-        logger.debug("Length of feed: %d" %len(user_feed_item_ids))
-        if len(user_feed_item_ids) < MAX_USER_FEED_LOAD:            
-            num_public_feed_len = MAX_USER_FEED_LOAD - len(user_feed_item_ids)
-            logger.debug("Getting feed from PUBLIC recipes: %d" %num_public_feed_len)
-            
-        pipeline = req.redis_conn.pipeline(True)
-        for feed_id in user_feed_item_ids:
-            pipeline.hgetall(feed_id)
-            
-        start = 0    
-        public_recipe_item_ids = req.redis_conn.zrevrange(PUBLIC_RECIPES, start, num_public_feed_len)
-        for feed_id in public_recipe_item_ids:
-            pipeline.hgetall(feed_id)
-            
-        # Only here we supply the key as well because in feed we have both recipes and activities
-        # and key starting with "r:" and activity starts with "act:"
-        #resp.body = [{k: v} for k, v in zip(user_feed_item_ids, pipeline.execute())]
-        resp.body = pipeline.execute()
-        #resp.body = [dict(i, images=eval(i['images'])) for i in resp.body]
-        # Redis DB stores list as string, so convert back the string to list
-        for i in range(len(resp.body)):
-            resp.body[i]['images'] = eval(resp.body[i]['images'])
-            
+            feed_items, next_cursor = read_feed(req.redis_conn, req.user_id, cursor, limit)
+        except ValueError:
+            raise HTTPBadRequest(title='Invalid Value', description='Invalid feed cursor provided. {}'.format(cursor))
+        logger.debug("Length of feed: %d" %len(feed_items))
+        if next_cursor is not None:
+            resp.set_header(FEED_CURSOR_HEADER, next_cursor)
+        # Feeds have both recipes ("r:" keys) and activities ("act:" keys).
+        # Views are shared with the cache, so flags go on a copy
+        flags = viewer_flags(req.redis_conn, req.user_id, [feed_id for feed_id, _ in feed_items])
+        resp.body = [dict(view, liked=liked, saved=saved)
+                     for (feed_id, view), (liked, saved) in zip(feed_items, flags)]
+
         resp.status = falcon.HTTP_OK
\ No newline at end of file
@@ -5,6 +5,8 @@ import falcon
 import logging
 
 from uggipuggi.constants import RECIPE, USER_RECIPES, RECIPE_VERY_CONCISE_VIEW_FIELDS
+from uggipuggi.services.concise_cache import get_concise_values
+from uggipuggi.services.engagement import viewer_flags
 from uggipuggi.controllers.hooks import serialize, supply_redis_conn
 from uggipuggi.libs.error import HTTPBadRequest, HTTPUnauthorized
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
@@ -28,11 +30,12 @@ class Item(object):
         statsd.incr('get_user_recipes.invocations')
         req.kafka_topic_name = '_'.join([self.kafka_topic_name, req.method.lower()])
         recipe_ids = req.redis_conn.zrange(USER_RECIPES+id, 0, -1)
-        pipeline = req.redis_conn.pipeline(True)
-        for recipe_id in recipe_ids:
-            pipeline.hmget(RECIPE+recipe_id, *RECIPE_VERY_CONCISE_VIEW_FIELDS)
-        resp.body = {'items': pipeline.execute(),                     
-                     'fields': RECIPE_VERY_CONCISE_VIEW_FIELDS, 
+        keys = [RECIPE+recipe_id for recipe_id in recipe_ids]
+        items = get_concise_values(req.redis_conn, keys, RECIPE_VERY_CONCISE_VIEW_FIELDS)
+        for values, flags in zip(items, viewer_flags(req.redis_conn, req.user_id, keys)):
+            values.extend(flags)
+        resp.body = {'items': items,
+                     'fields': RECIPE_VERY_CONCISE_VIEW_FIELDS + ('liked', 'saved'),
                     }
         resp.status = falcon.HTTP_OK
         
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""
+Build information for this service.
+
+Auto-generated during the build process - do not modify
+"""
+
+
+class BuildInfo(object):
+    """Current build info"""
+    repo_name = ''
+    service_type = 'demo'
+    service_name = 'up-be-falcon'
+    version = '19.03.8'
+    commit_hash = '90a46aea7cc558c850a541592e3e43381616c9f3'
+    build_date = 'Sat Oct 17 01:14:39 UTC 2026'
+    build_epoch_sec = 1792199679
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import os
+import time
+import logging
+from collections import OrderedDict
+
+
+class TTLCache(object):
+    """
+    Bounded in-process LRU cache where every entry also carries an expiry time.
+    Entries are dropped when they expire, when they are evicted as least recently
+    used, or when they are explicitly popped (e.g. by an invalidation message).
+    No lock is taken: every mutation is a single OrderedDict call, which is atomic
+    under the GIL, and races between readers and evictions are tolerated.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= self._timer():
+            self._data.pop(key, None)
+            return default
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            # Evicted by another thread in the meantime, value is still valid
+            pass
+        return value
+
+    def set(self, key, value, ttl=None):
+        self._data[key] = (value, self._timer() + (self.ttl if ttl is None else ttl))
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            pass
+        while len(self._data) > self.maxsize:
+            try:
+                self._data.popitem(last=False)
+            except KeyError:
+                break
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+    def __len__(self):
+        return len(self._data)
+
+
+class InvalidationBus(object):
+    """
+    Redis pub/sub subscriber which evicts entries from in-process caches when
+    another worker (or a Celery task) changes the underlying data.
+    The listener thread is started lazily and once per process, so it survives
+    gunicorn forking the workers after the app has been imported.
+    """
+
+    def __init__(self, get_redis_conn):
+        self._get_redis_conn = get_redis_conn
+        self._handlers = {}
+        self._pid = None
+        self._thread = None
+
+    def subscribe(self, channel, callback):
+        self._handlers.setdefault(channel, []).append(callback)
+
+    def publish(self, channel, key, redis_conn=None):
+        try:
+            (redis_conn or self._get_redis_conn()).publish(channel, key)
+        except Exception as e:
+            logging.getLogger(__name__).error("Cache invalidation publish failed: %s" %repr(e))
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or not self._handlers:
+            return
+        self._pid = os.getpid()
+        try:
+            pubsub = self._get_redis_conn().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{channel: self._dispatch for channel in self._handlers})
+            self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+        except Exception as e:
+            # Caches still expire on their TTL, so just retry on the next call
+            self._pid = None
+            logging.getLogger(__name__).error("Cache invalidation listener failed: %s" %repr(e))
+
+    def _dispatch(self, message):
+        for callback in self._handlers.get(message['channel'], []):
+            callback(message['data'])
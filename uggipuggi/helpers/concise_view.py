@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Typed encoding of the recipe, activity and user concise views kept in redis
+hashes. Every write and read of those hashes goes through a ConciseView, so
+list fields are stored as compact JSON and come back as lists, counters come
+back as ints and flags as bools.
+
+Hashes written with the current encoding carry '_v' = CONCISE_VIEW_VERSION.
+Hashes written before it (version 1, lists stored as str(list)) are still
+decoded, without eval, and migrate() rewrites them in place.
+"""
+from __future__ import absolute_import
+import ast
+import json
+from itertools import islice
+
+from uggipuggi.constants import RECIPE, ACTIVITY, USER
+
+CONCISE_VIEW_VERSION = 2
+VERSION_FIELD = '_v'
+
+
+def _encode_list(value):
+    return json.dumps(list(value), separators=(',', ':'))
+
+
+def _decode_list(value):
+    try:
+        return json.loads(value)
+    except ValueError:
+        pass
+    try:
+        # Version 1 hashes hold the repr of a python list
+        value = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else []
+
+
+def _decode_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None if value == '' else value
+
+
+def _decode_bool(value):
+    return value in ('1', 'True', 'true')
+
+
+_ENCODERS = {
+    list: _encode_list,
+    int:  int,
+    bool: int,
+    str:  str,
+}
+
+_DECODERS = {
+    list: _decode_list,
+    int:  _decode_int,
+    bool: _decode_bool,
+    str:  str,
+}
+
+
+class ConciseView(object):
+    """
+    Field types of one kind of concise view hash, keyed by prefix + id.
+    Fields without a declared type are kept as strings.
+    """
+    def __init__(self, prefix, types):
+        self.prefix = prefix
+        self.types = types
+        self.list_fields = tuple(field for field, typ in types.items() if typ is list)
+
+    def encode_field(self, field, value):
+        return _ENCODERS[self.types.get(field, str)](value)
+
+    def decode_field(self, field, value):
+        if value is None:
+            return None
+        return _DECODERS[self.types.get(field, str)](value)
+
+    def encode(self, data):
+        # Mapping for hmset, None values are left out as redis can't store them
+        mapping = {field: self.encode_field(field, value)
+                   for field, value in data.items() if value is not None}
+        # A partial update of a version 1 hash doesn't make it version 2,
+        # unless it rewrites every field whose encoding changed
+        if mapping and all(field in mapping for field in self.list_fields):
+            mapping[VERSION_FIELD] = CONCISE_VIEW_VERSION
+        return mapping
+
+    def decode(self, mapping):
+        # hgetall result -> typed dict
+        return {field: self.decode_field(field, value)
+                for field, value in mapping.items() if field != VERSION_FIELD}
+
+    def decode_values(self, fields, values):
+        # hmget result -> typed list, in the order of fields
+        return [self.decode_field(field, value) for field, value in zip(fields, values)]
+
+
+RECIPE_VIEW = ConciseView(RECIPE, {
+    'images':              list,
+    'recipe_name':         str,
+    'likes_count':         int,
+    'description':         str,
+    'saves_count':         int,
+    'comments_count':      int,
+    'cook_time':           int,
+    'id':                  str,
+    'generation_time':     str,
+    'author_avatar':       str,
+    'user_id':             str,
+    'author_display_name': str,
+    'item_type':           str,
+})
+
+ACTIVITY_VIEW = ConciseView(ACTIVITY, {
+    'images':              list,
+    'recipe_name':         str,
+    'likes_count':         int,
+    'description':         str,
+    'comments_count':      int,
+    'cook_time':           int,
+    'recipe_id':           str,
+    'id':                  str,
+    'item_type':           str,
+    'author_avatar':       str,
+    'user_id':             str,
+    'author_display_name': str,
+    'generation_time':     str,
+})
+
+USER_VIEW = ConciseView(USER, {
+    'status':         str,
+    'display_name':   str,
+    'display_pic':    str,
+    'public_profile': bool,
+    'account_active': bool,
+    'num_followers':  int,
+    'num_following':  int,
+    'uid':            int,
+})
+
+CONCISE_VIEWS = (RECIPE_VIEW, ACTIVITY_VIEW, USER_VIEW)
+
+
+def view_for_key(key):
+    # Feeds mix recipes ('r:') and activities ('act:')
+    for view in CONCISE_VIEWS:
+        if key.startswith(view.prefix):
+            return view
+    return None
+
+
+def decode_hash(key, mapping):
+    view = view_for_key(key)
+    return view.decode(mapping) if view is not None else mapping
+
+
+# Rewrites the list fields of one hash, unless they changed since they were read.
+# ARGV: version, then (field, value read, new value) triples
+_MIGRATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 2, #ARGV, 3 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) ~= ARGV[i + 1] then
+        return 0
+    end
+end
+for i = 2, #ARGV, 3 do
+    redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+end
+redis.call('HSET', KEYS[1], '""" + VERSION_FIELD + """', ARGV[1])
+return 1
+"""
+
+
+def migrate(redis_conn, view, batch_size=500):
+    """
+    Online migration of the view's hashes to the current version: keys are
+    visited with SCAN and rewritten batch by batch while the app keeps
+    serving them. Hashes modified in between are skipped and picked up by
+    the next run. Returns the number of hashes migrated.
+    """
+    script = redis_conn.register_script(_MIGRATE_SCRIPT)
+    keys_iter = redis_conn.scan_iter(match=view.prefix + '*', count=batch_size)
+    migrated = 0
+    while True:
+        keys = list(islice(keys_iter, batch_size))
+        if not keys:
+            return migrated
+        pipeline = redis_conn.pipeline(False)
+        for key in keys:
+            pipeline.type(key)
+            pipeline.hmget(key, VERSION_FIELD, *view.list_fields)
+        results = pipeline.execute(raise_on_error=False)
+
+        pipeline = redis_conn.pipeline(False)
+        for key, key_type, values in zip(keys, results[::2], results[1::2]):
+            if key_type != 'hash' or values[0] == str(CONCISE_VIEW_VERSION):
+                continue
+            args = [CONCISE_VIEW_VERSION]
+            for field, value in zip(view.list_fields, values[1:]):
+                if value is not None:
+                    args.extend([field, value, view.encode_field(field, view.decode_field(field, value))])
+            script(keys=[key], args=args, client=pipeline)
+        migrated += sum(pipeline.execute())
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Single pass JSON encoder for response bodies, and the matching fast decoder
+for plain JSON request bodies.
+
+Produces the same output as bson.json_util.dumps in the legacy mode clients
+already depend on (ObjectId as {"$oid": ...}, datetime as {"$date": millis}),
+but mongoengine Documents, QuerySets and sets are converted while encoding
+instead of rebuilding the whole body first. orjson is used when installed,
+otherwise the standard library json module.
+"""
+from __future__ import absolute_import
+import json
+import calendar
+import datetime
+from bson import json_util, ObjectId
+from mongoengine.base import BaseDocument
+from mongoengine.queryset import QuerySet
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def default(obj):
+    # Only called for types the encoder can't handle itself
+    if isinstance(obj, ObjectId):
+        return {'$oid': str(obj)}
+    if isinstance(obj, datetime.datetime):
+        offset = obj.utcoffset()
+        if offset is not None:
+            obj = obj - offset
+        return {'$date': calendar.timegm(obj.timetuple()) * 1000 + obj.microsecond // 1000}
+    if isinstance(obj, BaseDocument):
+        return obj._data
+    if isinstance(obj, (QuerySet, set, frozenset)):
+        return list(obj)
+    # Any other bson type (DBRef, Binary, Regex ...) exactly as json_util encodes it
+    return json_util.default(obj)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:  # pragma: no cover
+    _json_encoder = json.JSONEncoder(default=default, ensure_ascii=False)
+
+    def dumps(obj):
+        return _json_encoder.encode(obj).encode('utf-8')
+
+    loads = json.loads
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Key names that work on a redis cluster. A cluster puts each key in one of
+16384 slots by a CRC16 of its name, or of the part in {} when it has one,
+and a script or multi key command only runs on keys of a single slot.
+
+Keys that a script uses together with another key carry that key as their
+hash tag, so they hash like it: r_liked{r:<id>} lives with the recipe's
+concise view r:<id>, whose name is a feed member everywhere and stays as
+it is. Everything else is written with non-transactional pipelines, which
+a cluster client splits per node.
+"""
+from __future__ import absolute_import
+from itertools import islice
+from uggipuggi.constants import RECIPE, ACTIVITY, USER, RECIPE_LIKED, RECIPE_SAVED, ACTIVITY_LIKED,\
+                                USER_LIKED, USER_SAVED_RECIPES, USER_FEED, PULLED_FEED, FOLLOWING,\
+                                FOLLOWERS, COUNTER_DELTAS, COUNTER_FLUSH, COUNTER_BATCHES
+
+try:
+    from rediscluster import RedisCluster
+except ImportError:  # pragma: no cover
+    RedisCluster = None
+
+CLUSTER_SLOTS = 16384
+
+# Deletes a lock only if it's still the caller's, it may have expired and been taken
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _crc16(data):
+    # CRC16-CCITT (XMODEM), the checksum redis cluster hashes keys with
+    crc = 0
+    for byte in bytearray(data):
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else crc << 1
+            crc &= 0xffff
+    return crc
+
+
+def hash_tag(key):
+    # The part of the key hashed: the first non empty {...}, else the whole key
+    start = key.find('{')
+    if start != -1:
+        end = key.find('}', start + 1)
+        if end > start + 1:
+            return key[start + 1:end]
+    return key
+
+
+def key_slot(key):
+    return _crc16(hash_tag(key).encode('utf-8')) % CLUSTER_SLOTS
+
+
+def colocated(prefix, anchor):
+    # A key named prefix that lives in the slot of the anchor key
+    return '%s{%s}' % (prefix, anchor)
+
+
+def is_cluster(redis_conn):
+    return RedisCluster is not None and isinstance(redis_conn, RedisCluster)
+
+
+def release_lock(redis_conn, lock, token):
+    # For locks taken with SET lock token NX EX
+    return redis_conn.register_script(_RELEASE_LOCK_SCRIPT)(keys=[lock], args=[token])
+
+
+def item_likes_key(key):
+    # Who liked the 'r:' or 'act:' key, with its concise view
+    prefix = RECIPE_LIKED if key.startswith(RECIPE) else ACTIVITY_LIKED
+    return colocated(prefix, key)
+
+
+def item_saves_key(recipe_id):
+    return colocated(RECIPE_SAVED, RECIPE + recipe_id)
+
+
+def user_liked_key(user_id):
+    # Looked up together with the saved recipes zset
+    return colocated(USER_LIKED, USER_SAVED_RECIPES + user_id)
+
+
+def following_key(user_id):
+    # Changed together with num_following of the user's concise view
+    return colocated(FOLLOWING, USER + user_id)
+
+
+def followers_key(user_id):
+    return colocated(FOLLOWERS, USER + user_id)
+
+
+def pulled_feed_key(user_id):
+    # Read together with the pushed feed
+    return colocated(PULLED_FEED, USER_FEED + user_id)
+
+
+def counter_deltas_key(prefix):
+    return COUNTER_DELTAS + prefix
+
+
+def counter_flush_key(prefix):
+    return colocated(COUNTER_FLUSH, counter_deltas_key(prefix))
+
+
+def counter_batches_key(prefix):
+    return colocated(COUNTER_BATCHES + ':', counter_deltas_key(prefix))
+
+
+# Untagged names used before, each with its tagged name: (match, new name of an old key)
+_LEGACY_SETS = [
+    (RECIPE_LIKED + '*', lambda key: item_likes_key(RECIPE + key[len(RECIPE_LIKED):])),
+    (ACTIVITY_LIKED + '*', lambda key: item_likes_key(ACTIVITY + key[len(ACTIVITY_LIKED):])),
+    (RECIPE_SAVED + '*', lambda key: item_saves_key(key[len(RECIPE_SAVED):])),
+    (USER_LIKED + '*', lambda key: user_liked_key(key[len(USER_LIKED):])),
+    (FOLLOWING + '*', lambda key: following_key(key[len(FOLLOWING):])),
+    (FOLLOWERS + '*', lambda key: followers_key(key[len(FOLLOWERS):])),
+]
+
+
+def migrate_legacy_keys(redis_conn, batch_size=500):
+    """
+    Moves sets and counter batches from their untagged names to the tagged
+    ones, merging into whatever the app already wrote there. Safe to run
+    while serving and to run again. Returns the number of keys moved.
+    """
+    moved = 0
+    for match, new_name in _LEGACY_SETS:
+        keys_iter = redis_conn.scan_iter(match=match, count=batch_size)
+        for key in keys_iter:
+            if '{' in key:
+                continue
+            members = redis_conn.sscan_iter(key, count=batch_size)
+            while True:
+                batch = list(islice(members, batch_size))
+                if not batch:
+                    break
+                redis_conn.sadd(new_name(key), *batch)
+            redis_conn.delete(key)
+            moved += 1
+    # Batch numbers must keep increasing, documents remember the last one applied
+    last_batch = int(redis_conn.get(COUNTER_BATCHES) or 0)
+    for prefix in (RECIPE, ACTIVITY):
+        batches_key = counter_batches_key(prefix)
+        if int(redis_conn.get(batches_key) or 0) < last_batch:
+            redis_conn.set(batches_key, last_batch)
+        # A batch left by a failed flush is applied by the next one
+        batch = redis_conn.hgetall(COUNTER_FLUSH + prefix)
+        if batch and not redis_conn.exists(counter_flush_key(prefix)):
+            redis_conn.hmset(counter_flush_key(prefix), batch)
+            redis_conn.delete(COUNTER_FLUSH + prefix)
+            moved += 1
+    return moved
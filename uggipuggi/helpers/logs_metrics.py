@@ -1,9 +1,146 @@
+import os
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
 import logstash
 from jaeger_client import Config
 from statsd import StatsClient
 
-from uggipuggi.constants import SERVER_RUN_MODE
+from uggipuggi.constants import SERVER_RUN_MODE, LOG_QUEUE_SIZE, LOG_BATCH_SIZE
+
+# Request id of the request being handled by the current thread (or greenlet
+# once gevent has patched threading), set by RequestIdMiddleware
+_request_context = threading.local()
+
+
+def set_request_id(request_id):
+    _request_context.request_id = request_id
+
+
+def get_request_id():
+    return getattr(_request_context, 'request_id', None)
+
+
+class RequestIdFilter(logging.Filter):
+    # Tags every record with the correlation id of the current request
+    def filter(self, record):
+        record.request_id = get_request_id()
+        return True
+
+
+class lazy(object):
+    """
+    Defers building an expensive log argument until a handler formats the
+    record, e.g. logger.debug("%s", lazy(lambda: recipe.to_mongo().to_dict()))
+    costs nothing while DEBUG is disabled.
+    """
+    __slots__ = ('func', 'args', 'kwargs')
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+    def __repr__(self):
+        return repr(self.func(*self.args, **self.kwargs))
+
+
+class LogShipper(object):
+    """
+    Drains the log queue on a background thread and sends whatever has
+    piled up as a single write to the logstash handler. Records it dropped
+    are counted to statsd as log_shipper.dropped.
+    """
+    def __init__(self, handler, maxsize=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, statsd=None):
+        self.handler = handler
+        self.queue = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        self.statsd = statsd
+        self.dropped = 0
+        self._reported = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        # Threads don't survive a fork, so every worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Don't write to the parent's logstash connection
+                self.handler.sock = None
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, name='log-shipper')
+            thread.daemon = True
+            thread.start()
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _next_batch(self, block=True):
+        batch = [self.queue.get(block)]
+        try:
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def ship(self, batch):
+        try:
+            self.handler.send(b''.join(self.handler.makePickle(record) for record in batch))
+        except Exception:
+            # Losing log records must never take the worker down
+            self.dropped += len(batch)
+
+    def report_dropped(self):
+        # Records are dropped while the queue is full, so the shipper is busy and reports them
+        dropped = self.dropped
+        if self.statsd is not None and dropped > self._reported:
+            self.statsd.incr('log_shipper.dropped', dropped - self._reported)
+            self._reported = dropped
+
+    def flush(self):
+        try:
+            while True:
+                self.ship(self._next_batch(block=False))
+        except queue.Empty:
+            pass
+        self.report_dropped()
+
+    def _run(self):
+        while True:
+            self.ship(self._next_batch())
+            self.report_dropped()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks the caller: records are dropped once the shipper falls behind
+    def __init__(self, shipper):
+        super(DroppingQueueHandler, self).__init__(shipper.queue)
+        self.shipper = shipper
+
+    def prepare(self, record):
+        # Not formatted here, the logstash handler does that on the shipper thread
+        return record
+
+    def enqueue(self, record):
+        self.shipper.ensure_started()
+        self.shipper.put(record)
+
+
+_log_handler = None
+_log_handler_lock = threading.Lock()
 
 
 def init_statsd(prefix=None, host='statsd', port=8125):
@@ -12,8 +149,19 @@ def init_statsd(prefix=None, host='statsd', port=8125):
 
 
 def init_logger(log_level=logging.INFO):
+    # Safe to call from every module, the root logger gets a single queue
+    # handler and records are shipped to logstash off the request thread
+    global _log_handler
     logger = logging.getLogger()
-    logger.addHandler(logstash.TCPLogstashHandler('logstash', 5000, version=1))
+    with _log_handler_lock:
+        if _log_handler is None:
+            shipper = LogShipper(logstash.TCPLogstashHandler('logstash', 5000, version=1),
+                                 statsd=init_statsd('up.helpers.logs_metrics'))
+            atexit.register(shipper.flush)
+            _log_handler = DroppingQueueHandler(shipper)
+            _log_handler.addFilter(RequestIdFilter())
+        if _log_handler not in logger.handlers:
+            logger.addHandler(_log_handler)
     if SERVER_RUN_MODE == 'DEBUG':
         logger.setLevel(logging.DEBUG)
     else:
@@ -21,22 +169,31 @@ def init_logger(log_level=logging.INFO):
     return logger
 
 
-def init_tracer(service):
+def init_tracer(service, tracing_config=None):
+    """
+    Jaeger tracer configured from the [tracing] section of conf/*.ini.
+    Samples a fraction of requests (probabilistic) or at most sampler_param
+    traces per second (ratelimiting), spans are reported in batches.
+    """
+    tracing_config = tracing_config or {}
     config = Config(
         config={
             'sampler': {
-                'type': 'const',
-                'param': 1,
+                'type': tracing_config.get('sampler_type', 'probabilistic'),
+                'param': float(tracing_config.get('sampler_param', 0.01)),
             },
             'local_agent': {
-                'reporting_host': "jaeger",
-                'reporting_port': 5775,
+                'reporting_host': tracing_config.get('agent_host', "jaeger"),
+                'reporting_port': int(tracing_config.get('agent_port', 5775)),
             },
-            'logging': True,
-            'reporter_batch_size': 1,
+            'logging': False,
+            'reporter_batch_size': int(tracing_config.get('reporter_batch_size', 50)),
+            'reporter_queue_size': int(tracing_config.get('reporter_queue_size', 1000)),
+            'reporter_flush_interval': float(tracing_config.get('reporter_flush_interval', 1)),
         },
 
         service_name=service,
+        validate=True,
     )
 
     # this call also sets opentracing.tracer
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import
+import copy
 import colander
 
 
@@ -27,3 +28,170 @@ class CommaIntList(CommaList):
             if not isinstance(item, int):
                 raise colander.Invalid(node, error_msg)
 
+
+
+def partial(schema):
+    """
+    Returns a copy of the schema where every top level field may be left out,
+    e.g. for PUT requests which only carry the fields being updated.
+    """
+    schema = schema.clone()
+    for child in schema.children:
+        child.missing = colander.drop
+    return schema
+
+
+class CompiledSchema(object):
+    """
+    A colander schema compiled once into nested closures, used in place of the
+    schema itself: CompiledSchema(RecipeSchema()).deserialize(cstruct).
+
+    Mapping, Sequence, String, Int, Float and Boolean nodes are type checked
+    inline. Whenever a value is not of the expected python type (strings which
+    need converting, null/missing values, anything invalid) the node's own
+    deserialize is called, so results and colander.Invalid errors are the same
+    as for the interpreted schema. Node types without a compiled form, and
+    nodes with preparers or deferreds, always use node.deserialize.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.deserialize = _compile_node(schema)
+
+
+def compile_schema(schema):
+    return CompiledSchema(schema)
+
+
+def _compile_node(node):
+    if node.preparer is not None or isinstance(node.validator, colander.deferred) or \
+       isinstance(node.missing, colander.deferred):
+        return node.deserialize
+    typ = type(node.typ)
+    if typ is colander.Mapping and node.typ.unknown != 'raise':
+        return _compile_mapping(node)
+    if typ is colander.Sequence and not node.typ.accept_scalar:
+        return _compile_sequence(node)
+    if typ is colander.String and node.typ.encoding is None and not node.typ.allow_empty:
+        return _compile_scalar(node, (str,))
+    if typ is colander.Int:
+        return _compile_scalar(node, (int,))
+    if typ is colander.Float:
+        return _compile_scalar(node, (float,), convert={int: float})
+    if typ is colander.Boolean:
+        return _compile_scalar(node, (bool,))
+    return node.deserialize
+
+
+def _compile_scalar(node, types, convert=None):
+    slow = node.deserialize
+    validator = node.validator
+    convert = convert or {}
+
+    def deserialize(cstruct):
+        cls = cstruct.__class__
+        if cls in types and (cstruct or cls is not str):
+            value = cstruct
+        elif cls in convert:
+            value = convert[cls](cstruct)
+        else:
+            return slow(cstruct)
+        if validator is not None:
+            validator(node, value)
+        return value
+    # Lets sequences of plain values check all items in one loop
+    deserialize.types = types if validator is None else None
+    return deserialize
+
+
+def _compile_mapping(node):
+    slow = node.deserialize
+    validator = node.validator
+    preserve = node.typ.unknown == 'preserve'
+    names = frozenset(child.name for child in node.children)
+    children = []
+    for num, child in enumerate(node.children):
+        compiled = _compile_node(child)
+        # A left out value resolves straight to child.missing, unless the child
+        # is not compiled and its type may turn null into something else
+        missing = colander.required if compiled is child.deserialize else child.missing
+        children.append((num, child.name, child.default is colander.drop, missing, compiled))
+    null, drop, required = colander.null, colander.drop, colander.required
+
+    def deserialize(cstruct):
+        if cstruct.__class__ is not dict:
+            return slow(cstruct)
+        result = {}
+        error = None
+        for num, name, default_drop, missing, child in children:
+            subval = cstruct.get(name, null)
+            if subval is drop or (subval is null and default_drop):
+                continue
+            if subval is null and missing is not required:
+                # Left out field, colander returns missing without validating it
+                if missing is not drop:
+                    result[name] = missing
+                continue
+            try:
+                sub_result = child(subval)
+            except colander.Invalid as e:
+                if error is None:
+                    error = colander.Invalid(node)
+                error.add(e, num)
+            else:
+                if sub_result is not drop:
+                    result[name] = sub_result
+        if preserve:
+            result.update(copy.deepcopy({k: v for k, v in cstruct.items() if k not in names}))
+        if error is not None:
+            raise error
+        if validator is not None:
+            validator(node, result)
+        return result
+    return deserialize
+
+
+def _compile_sequence(node):
+    slow = node.deserialize
+    validator = node.validator
+    subnode = node.children[0]
+    child = _compile_node(subnode)
+    default_drop = subnode.default is colander.drop
+    item_types = getattr(child, 'types', None)
+    null, drop = colander.null, colander.drop
+
+    def deserialize(cstruct):
+        cls = cstruct.__class__
+        if cls is not list and cls is not tuple:
+            return slow(cstruct)
+        if item_types is not None:
+            for subval in cstruct:
+                cls = subval.__class__
+                if cls not in item_types or (cls is str and not subval):
+                    break
+            else:
+                # Every item is already of the right type and needs no validation
+                result = list(cstruct)
+                if validator is not None:
+                    validator(node, result)
+                return result
+        result = []
+        error = None
+        for num, subval in enumerate(cstruct):
+            if subval is drop or (subval is null and default_drop):
+                continue
+            try:
+                sub_result = child(subval)
+            except colander.Invalid as e:
+                if error is None:
+                    error = colander.Invalid(node)
+                error.add(e, num)
+            else:
+                if sub_result is not drop:
+                    result.append(sub_result)
+        if error is not None:
+            raise error
+        if validator is not None:
+            validator(node, result)
+        return result
+    return deserialize
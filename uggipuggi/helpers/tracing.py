@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Child spans around the I/O a request does: redis commands and pipelines,
+pymongo commands, Kafka produce/flush and image uploads. They are only
+created when the request's span was sampled, so unsampled requests pay no
+more than an attribute lookup per call.
+"""
+from __future__ import absolute_import
+import redis
+import opentracing
+from contextlib import contextmanager
+from confluent_kafka import Producer
+from opentracing.ext import tags
+from pymongo import monitoring
+
+
+def sampled_parent():
+    # The active span of this thread, None when there isn't one or it won't be reported
+    tracer = opentracing.global_tracer()
+    if type(tracer) is opentracing.Tracer:
+        # Tracing is disabled, only the no-op tracer is installed
+        return None
+    span = tracer.active_span
+    if span is None:
+        return None
+    is_sampled = getattr(span, 'is_sampled', None)
+    if is_sampled is not None and not is_sampled():
+        return None
+    return span
+
+
+@contextmanager
+def child_span(operation_name, tags=None):
+    parent = sampled_parent()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.start_active_span(operation_name, child_of=parent, tags=tags) as scope:
+        yield scope.span
+
+
+class TracedPipeline(redis.client.Pipeline):
+    # The whole pipeline is one round trip, so it gets one span
+    def execute(self, raise_on_error=True):
+        with child_span('redis.pipeline', tags={tags.DATABASE_TYPE: 'redis',
+                                                'redis.commands': len(self.command_stack)}):
+            return super(TracedPipeline, self).execute(raise_on_error)
+
+
+class TracedRedis(redis.Redis):
+
+    def execute_command(self, *args, **options):
+        with child_span('redis.' + args[0].lower(), tags={tags.DATABASE_TYPE: 'redis'}):
+            return super(TracedRedis, self).execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return TracedPipeline(self.connection_pool, self.response_callbacks,
+                              transaction, shard_hint)
+
+
+class TracedProducer(Producer):
+
+    def produce(self, topic, *args, **kwargs):
+        with child_span('kafka.produce', tags={tags.MESSAGE_BUS_DESTINATION: topic}):
+            return super(TracedProducer, self).produce(topic, *args, **kwargs)
+
+    def flush(self, *args):
+        with child_span('kafka.flush'):
+            return super(TracedProducer, self).flush(*args)
+
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """
+    pymongo calls started() in the thread running the command, which is where
+    the request's span is active. Register it before connecting:
+    monitoring.register(MongoCommandTracer())
+    """
+    def __init__(self):
+        self._spans = {}
+
+    def started(self, event):
+        parent = sampled_parent()
+        if parent is None:
+            return
+        span = parent.tracer.start_span('mongo.' + event.command_name, child_of=parent,
+                                        tags={tags.DATABASE_TYPE: 'mongodb',
+                                              tags.DATABASE_INSTANCE: event.database_name,
+                                              'mongo.collection': str(event.command.get(event.command_name))})
+        self._spans[(event.connection_id, event.request_id)] = span
+
+    def succeeded(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.finish()
+
+    def failed(self, event):
+        span = self._spans.pop((event.connection_id, event.request_id), None)
+        if span is not None:
+            span.set_tag(tags.ERROR, True)
+            span.log_kv({'event': 'error', 'message': str(event.failure)})
+            span.finish()
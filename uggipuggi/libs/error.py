@@ -28,6 +28,30 @@ class HTTPNotAcceptable(falcon.HTTPNotAcceptable):
     pass
 
 
+class HTTPConflict(falcon.HTTPConflict):
+    """
+    wrapper for HTTP Conflict response
+    status code: 409
+    """
+    pass
+
+
+class HTTPTooManyRequests(falcon.HTTPTooManyRequests):
+    """
+    wrapper for HTTP Too Many Requests response
+    status code: 429
+    """
+    pass
+
+
+class HTTPPayloadTooLarge(falcon.HTTPPayloadTooLarge):
+    """
+    wrapper for HTTP Payload Too Large response
+    status code: 413
+    """
+    pass
+
+
 class HTTPServiceUnavailable(falcon.HTTPServiceUnavailable):
     """
     wrapper for HTTP Service Unavailable response
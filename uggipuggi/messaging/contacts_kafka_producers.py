@@ -1,15 +1,11 @@
-import os
 from conf import get_config
-from confluent_kafka import Producer
+from uggipuggi.services.connections import connections
 
 from uggipuggi.helpers.logs_metrics import init_logger
 
 
 logger = init_logger()
 
-# load config via env
-kafka_bootstrap_servers = os.environ.get('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
-contacts_producer = Producer({'bootstrap.servers': kafka_bootstrap_servers})
 
 def contacts_kafka_item_get_producer(req, resp, resource):
     # This might be useful for number of views for recipe
@@ -17,12 +13,12 @@ def contacts_kafka_item_get_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("CONTACTS_KAFKA_ITEM_GET_PRODUCER: %s" %req.kafka_topic_name)
     logger.debug("----------------------")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    contacts_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    contacts_producer.flush()
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
 
 def contacts_kafka_item_post_producer(req, resp, resource):
     # Recipe updated, night not be useful
@@ -30,22 +26,34 @@ def contacts_kafka_item_post_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("CONTACTS_KAFKA_ITEM_POST_PRODUCER: %s" %req.kafka_topic_name)
     logger.debug("----------------------")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    contacts_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    contacts_producer.flush()
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
         
 def contacts_kafka_item_put_producer(req, resp, resource):
-    parameters = [req.user_id, req.params['body']['contact_user_id'], resp.status]
+    # Counts only, an upload can hold a whole address book
+    counts = resp.body if isinstance(resp.body, dict) else {}
+    parameters = [req.user_id, counts.get('num_numbers'), counts.get('num_contacts_found'), resp.status]
     logger.debug("++++++++++++++++++++++")
     logger.debug("CONTACTS_KAFKA_ITEM_PUT_PRODUCER: %s" %req.kafka_topic_name)
     logger.debug("----------------------")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")
-    contacts_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    contacts_producer.flush()
-    
\ No newline at end of file
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
+
+def contacts_kafka_sync_post_producer(req, resp, resource):
+    # Contacts that changed, the address book itself stays here
+    changes = resp.body if isinstance(resp.body, dict) else {}
+    parameters = [req.user_id, changes.get('added_contacts'), changes.get('removed_contacts'),
+                  changes.get('joined_contacts'), resp.status]
+    logger.debug("CONTACTS_KAFKA_SYNC_POST_PRODUCER: %s %r" %(req.kafka_topic_name, parameters))
+    connections.kafka_producer.produce(topic=req.kafka_topic_name,
+                                       value=repr(parameters),
+                                       key=req.user_id)
+    connections.kafka_producer.flush()
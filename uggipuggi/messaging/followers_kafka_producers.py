@@ -1,11 +1,7 @@
-import os
 import logging
 from conf import get_config
-from confluent_kafka import Producer
+from uggipuggi.services.connections import connections
 
-# load config via env
-kafka_bootstrap_servers = os.environ.get('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
-followers_producer = Producer({'bootstrap.servers': kafka_bootstrap_servers})
 
 def followers_kafka_item_get_producer(req, resp, resource):
     # This might be useful for number of views for recipe
@@ -15,10 +11,10 @@ def followers_kafka_item_get_producer(req, resp, resource):
     logging.debug("----------------------")
     logging.debug(repr(parameters))
     logging.debug("++++++++++++++++++++++")    
-    followers_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    followers_producer.flush()
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
        
 def followers_kafka_item_post_producer(req, resp, resource):
     parameters = [req.user_id, resp.status]
@@ -27,8 +23,8 @@ def followers_kafka_item_post_producer(req, resp, resource):
     logging.debug("----------------------")
     logging.debug(repr(parameters))
     logging.debug("++++++++++++++++++++++")
-    followers_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    followers_producer.flush()
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
     
\ No newline at end of file
@@ -1,11 +1,8 @@
-import os
 import logging
 from conf import get_config
-from confluent_kafka import Producer
+from uggipuggi.services.connections import connections
 from uggipuggi.models import ExposeLevel
 
-kafka_bootstrap_servers = os.environ.get('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
-recipe_producer = Producer({'bootstrap.servers': kafka_bootstrap_servers})
 
 def recipe_kafka_collection_post_producer(req, resp, resource):
     # Publish that a recipe has been added
@@ -27,10 +24,10 @@ def recipe_kafka_collection_post_producer(req, resp, resource):
         logging.debug("----------------------")
         logging.debug(repr(parameters))
         logging.debug("++++++++++++++++++++++")    
-        recipe_producer.produce(topic=req.kafka_topic_name, 
-                                value=repr(parameters),
-                                key=req.user_id) #req.encode('utf-8'))
-        recipe_producer.flush()
+        connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                           value=repr(parameters),
+                                           key=req.user_id) #req.encode('utf-8'))
+        connections.kafka_producer.flush()
     
 def recipe_kafka_item_get_producer(req, resp, resource):
     # This might be useful for number of views for recipe
@@ -40,10 +37,10 @@ def recipe_kafka_item_get_producer(req, resp, resource):
     logging.debug("----------------------")
     logging.debug(repr(parameters))
     logging.debug("++++++++++++++++++++++")    
-    recipe_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    recipe_producer.flush()
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
     
 def recipe_kafka_item_put_producer(req, resp, resource):
     # Publish that a comment has been added to recipe
@@ -55,10 +52,10 @@ def recipe_kafka_item_put_producer(req, resp, resource):
         logging.debug("----------------------")
         logging.debug(repr(parameters))
         logging.debug("++++++++++++++++++++++")    
-        recipe_producer.produce(topic=req.kafka_topic_name, 
-                                value=repr(parameters),
-                                key=req.user_id) #req.encode('utf-8'))
-        recipe_producer.flush()
+        connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                           value=repr(parameters),
+                                           key=req.user_id) #req.encode('utf-8'))
+        connections.kafka_producer.flush()
     
 def recipe_kafka_item_delete_producer(req, resp, resource):
     parameters = [req.user_id, resp.body["recipe_id"], resp.status]
@@ -67,31 +64,7 @@ def recipe_kafka_item_delete_producer(req, resp, resource):
     logging.debug("----------------------")
     logging.debug(repr(parameters))
     logging.debug("++++++++++++++++++++++")
-    recipe_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    recipe_producer.flush()
-    
-def recipe_saved_kafka_item_post_producer(req, resp, resource):    
-    parameters = [req.user_id, resp.body["recipe_id"], resp.status]
-    logging.debug("++++++++++++++++++++++")
-    logging.debug("RECIPE_SAVED_KAFKA_ITEM_POST_PRODUCER: %s" %req.kafka_topic_name)
-    logging.debug("----------------------")
-    logging.debug(repr(parameters))
-    logging.debug("++++++++++++++++++++++")
-    recipe_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    recipe_producer.flush()
-
-def recipe_liked_kafka_item_post_producer(req, resp, resource):    
-    parameters = [req.user_id, resp.body["recipe_id"], resp.status]
-    logging.debug("++++++++++++++++++++++")
-    logging.debug("RECIPE_LIKED_KAFKA_ITEM_POST_PRODUCER: %s" %req.kafka_topic_name)
-    logging.debug("----------------------")
-    logging.debug(repr(parameters))
-    logging.debug("++++++++++++++++++++++")
-    recipe_producer.produce(topic=req.kafka_topic_name, 
-                            value=repr(parameters),
-                            key=req.user_id) #req.encode('utf-8'))
-    recipe_producer.flush()    
\ No newline at end of file
+    connections.kafka_producer.produce(topic=req.kafka_topic_name, 
+                                       value=repr(parameters),
+                                       key=req.user_id) #req.encode('utf-8'))
+    connections.kafka_producer.flush()
@@ -1,11 +1,8 @@
-import os
 from conf import get_config
-from confluent_kafka import Producer
+from uggipuggi.services.connections import connections
 
 from uggipuggi.helpers.logs_metrics import init_logger
 
-# load config via env
-kafka_bootstrap_servers = os.environ.get('KAFKA_BOOTSTRAP_SERVERS', 'kafka:9092')
 logger = init_logger()   
    
 def user_kafka_item_get_producer(req, resp, resource):
@@ -13,9 +10,9 @@ def user_kafka_item_get_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("USER_KAFKA_ITEM_GET_PRODUCER")
     logger.debug("++++++++++++++++++++++")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    p = Producer({'bootstrap.servers': kafka_bootstrap_servers})
+    p = connections.kafka_producer
     p.produce(req.kafka_topic_name, repr(parameters)) #req.encode('utf-8'))
     p.flush()
     
@@ -27,9 +24,9 @@ def user_kafka_item_put_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("USER_KAFKA_ITEM_PUT_PRODUCER")
     logger.debug("++++++++++++++++++++++")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    p = Producer({'bootstrap.servers': kafka_bootstrap_servers})
+    p = connections.kafka_producer
     p.produce(req.kafka_topic_name, repr(parameters)) #req.encode('utf-8'))
     p.flush()
     
@@ -38,9 +35,9 @@ def user_recipes_kafka_item_get_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("USER_RECIPES_KAFKA_ITEM_GET_PRODUCER")
     logger.debug("++++++++++++++++++++++")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    p = Producer({'bootstrap.servers': kafka_bootstrap_servers})
+    p = connections.kafka_producer
     p.produce(req.kafka_topic_name, repr(parameters)) #req.encode('utf-8'))
     p.flush()
     
@@ -49,9 +46,9 @@ def user_saved_kafka_item_get_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("USER_SAVED_KAFKA_ITEM_GET_PRODUCER")
     logger.debug("++++++++++++++++++++++")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    p = Producer({'bootstrap.servers': kafka_bootstrap_servers})
+    p = connections.kafka_producer
     p.produce(req.kafka_topic_name, repr(parameters)) #req.encode('utf-8'))
     p.flush()
     
@@ -60,8 +57,8 @@ def user_activity_kafka_item_get_producer(req, resp, resource):
     logger.debug("++++++++++++++++++++++")
     logger.debug("USER_ACTIVITY_KAFKA_ITEM_GET_PRODUCER")
     logger.debug("++++++++++++++++++++++")
-    logger.debug(repr(parameters))
+    logger.debug("%r", parameters)
     logger.debug("++++++++++++++++++++++")    
-    p = Producer({'bootstrap.servers': kafka_bootstrap_servers})
+    p = connections.kafka_producer
     p.produce(req.kafka_topic_name, repr(parameters)) #req.encode('utf-8'))
     p.flush()    
\ No newline at end of file
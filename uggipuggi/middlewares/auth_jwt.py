@@ -13,13 +13,17 @@ from bson import json_util, ObjectId
 from datetime import datetime, timedelta
 from passlib.hash import bcrypt as crypt
 
-from uggipuggi.constants import OTP, OTP_LENGTH, USER, USER_RECIPES, USER_FEED,\
-                                PUBLIC_RECIPES, SERVER_RUN_MODE
-from uggipuggi.models.user import Role, User, VerifyPhone
-from uggipuggi.controllers import Ping
-from uggipuggi.middlewares.prometheus_middleware import PrometheusMiddleware
+from uggipuggi.constants import OTP, OTP_LENGTH, USER, USER_RECIPES, SERVER_RUN_MODE
+from uggipuggi.models.user import User, VerifyPhone
+from uggipuggi.services.identity import get_identity, invalidate_identity
+from uggipuggi.services.phone_directory import set_phone
+from uggipuggi.services.user_ids import allocate_uid
+from uggipuggi.tasks.user_tasks import add_joined_contacts
+from uggipuggi.middlewares.policy import get_route_policy
+from uggipuggi.middlewares.token_cache import decode_token, token_digest, revoke_token
 from uggipuggi.controllers.hooks import deserialize, serialize, supply_redis_conn
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd, init_tracer
+from uggipuggi.helpers.concise_view import USER_VIEW
 from uggipuggi.messaging.authentication_kafka_producers import kafka_verify_producer,\
                      kafka_register_producer, kafka_login_producer, kafka_logout_producer,\
                      kafka_forgotpassword_producer, kafka_passwordchange_producer
@@ -41,103 +45,6 @@ if not SERVER_RUN_MODE == 'DEBUG':
     sms_auth_token = os.environ["SMS_AUTH_TOKEN"]
     sms = plivo.RestAPI(sms_auth_id, sms_auth_token)
 
-# role-based permission control
-ACL_MAP = {
-    '/images/+': {
-        'get':  Role.USER,
-    },    
-    '/recipes': {
-        'get':  Role.USER,
-        'post': Role.USER
-    },
-    '/recipes/+': {
-        'get' :   Role.USER,
-        'put' :   Role.USER,
-        'delete': Role.USER
-    },
-    '/activity': {
-        'get' : Role.USER,
-        'post': Role.USER
-    },
-    '/activity/+': {
-        'get':    Role.USER,
-        'put':    Role.USER,
-        'delete': Role.USER
-    },    
-    '/users': {
-        'get':  Role.USER,
-        'post': Role.USER,
-    },
-    '/users/+': {
-        'get':    Role.USER,
-        'put':    Role.USER,
-        'delete': Role.USER
-    },
-    '/user_recipes/+': {
-        'get': Role.USER,
-    },    
-    '/saved_recipes/+': {
-        'get': Role.USER,
-    },        
-    '/user_activity/+': {
-        'get': Role.USER,
-    },
-    '/recipe_liked/+':{
-        'post': Role.USER,
-    },
-    '/recipe_saved/+':{
-        'post': Role.USER,
-    },
-    '/activity_liked/+':{
-        'post': Role.USER,
-    },
-    '/get_userid': {
-        'post': Role.USER
-    },    
-    '/feed': {
-        'get':  Role.USER,
-    },    
-    '/groups': {
-        'get':  Role.USER,
-        'post': Role.USER,
-    },
-    '/groups/+': {
-        'get':    Role.USER,
-        'put':    Role.USER,
-        'delete': Role.USER
-    },
-    '/group_recipes/+': {
-        'get':    Role.USER,
-    },            
-    '/contacts/+': {
-        'get':    Role.USER,
-        'put':    Role.USER,
-        'delete': Role.USER
-    },
-    '/followers/+': {
-        'get':    Role.USER,
-        'put':    Role.USER,
-        'delete': Role.USER
-    },
-    '/following/+': {
-        'get':    Role.USER,
-        'put':    Role.USER,
-        'delete': Role.USER
-    },    
-    '/verify': {
-        'get':  Role.USER,
-        'post': Role.USER,
-    },    
-    '/login': {
-        'get':  Role.USER,
-        'post': Role.USER,
-    },
-    '/register': {
-        'get':  Role.USER,
-        'post': Role.USER,
-    },     
-}
-
       
 @falcon.before(supply_redis_conn)      
 @falcon.before(deserialize)
@@ -149,7 +56,7 @@ class VerifyPhoneResource(object):
         self.get_user = get_user
         self.secret = secret
         self.token_expiration_seconds = token_expiration_seconds
-        self.token_opts = token_opts or DEFAULT_TOKEN_OPTS
+        self.token_opts = dict(token_opts or DEFAULT_TOKEN_OPTS)
         logger.debug(token_opts)
         
     @falcon.after(kafka_verify_producer)
@@ -182,7 +89,8 @@ class VerifyPhoneResource(object):
                                                 description,
                                                 href='http://docs.example.com/auth')
 
-        if not self._token_is_valid(resp, token):
+        claims = self._decode_token(token)
+        if claims is None:
             description = ('The provided auth token is not valid. '
                            'Please request a new token and try again.')
             raise falcon.HTTPUnauthorized('Authentication required',
@@ -190,7 +98,8 @@ class VerifyPhoneResource(object):
                                           challenges,
                                           href='http://docs.example.com/auth')
         
-        phone_number = self.decoded.pop("user_identifier")        
+        req.context.auth_claims = claims
+        phone_number = claims["user_identifier"]
         req.user_id = phone_number
         user_otp = req.redis_conn.get(OTP+phone_number)
         
@@ -210,29 +119,20 @@ class VerifyPhoneResource(object):
                                     'account_active': True,
                                     'phone_last_verified':str(current_time)} # This gives error if we use datetime type instead of str
                                  )
+                # Cached identity still holds the old phone_last_verified
+                invalidate_identity(str(full_user.id), req.redis_conn)
                 # Store phone to MongoDB mapping in Redis database
-                pipeline = req.redis_conn.pipeline(True)
-                pipeline.set(phone_number, str(full_user.id))
-                # For redis we can't use bool, so using ints
-                pipeline.hmset(USER+str(full_user.id), {'account_active':1,
-                                                        'public_profile':0})                
+                pipeline = req.redis_conn.pipeline(False)
+                set_phone(pipeline, phone_number, str(full_user.id))
+                # Follows check public_profile here, keep the one set at registration
+                pipeline.hmset(USER+str(full_user.id), USER_VIEW.encode({'account_active': True,
+                                                                         'public_profile': full_user.public_profile}))
                 pipeline.execute()
-                
-                # Add some public recipes to user feed if the user is new
-                user_feed = USER_FEED + str(full_user.id)
-                if not req.redis_conn.exists(user_feed):
-                    # Get public recipe list along with time stamp
-                    recipes_scored_list = req.redis_conn.zrange(PUBLIC_RECIPES, 0, 50, withscores=True)
-                    recipes_scored_dict = dict(recipes_scored_list)
-                    if len(recipes_scored_dict) > 0:
-                        logger.debug("Adding following public recipes to user feed:")
-                        logger.debug(recipes_scored_dict)
-                        req.redis_conn.zadd(user_feed, recipes_scored_dict)
-                    else:    
-                        logger.warn("No public recipes available to add user feed!")
-                else: 
-                    logger.info("User is a returning user!")
-                    
+                # Sets of users, e.g. followers, hold this integer id instead of the user id
+                allocate_uid(req.redis_conn, full_user)
+                # Address books holding the number get the new user as a contact
+                add_joined_contacts.delay(str(full_user.id), phone_number)
+                # New users' feeds need no seeding, public recipes are merged in on read
                 logger.info("User verification: Success")
                 self.add_new_jwtoken(resp, str(full_user.id), phone_last_verified=current_time)
                 resp.status = falcon.HTTP_ACCEPTED
@@ -242,14 +142,14 @@ class VerifyPhoneResource(object):
                 raise falcon.HTTPNotAcceptable(description,
                                                href='http://docs.example.com/auth')                
                        
-    def _token_is_valid(self, resp, token):
+    def _decode_token(self, token):
+        # Returns the verified claims, or None if the token is invalid or expired
         try:
             options = {'verify_exp': True}
-            self.decoded = jwt.decode(token, self.secret, verify='True', algorithms=['HS256'], options=options)
-            return True
-        except jwt.DecodeError as err:
+            return jwt.decode(token, self.secret, verify='True', algorithms=['HS256'], options=options)
+        except jwt.InvalidTokenError as err:
             logger.debug("Token validation failed Error :{}".format(str(err)))
-            return False        
+            return None
 
     def add_new_jwtoken(self, resp, user_identifier=None, phone_last_verified=None):
         # add a JSON web token to the response headers
@@ -266,13 +166,14 @@ class VerifyPhoneResource(object):
                             self.secret,
                             algorithm='HS256').decode("utf-8")
         logger.debug("Setting TOKEN!")
-        self.token_opts["value"] = token
-        logger.debug(self.token_opts)
+        # Resources are shared by all requests (and threads), never store the token on self
+        token_opts = dict(self.token_opts, value=token)
+        logger.debug(token_opts)
         
-        if self.token_opts.get('location', 'cookie') == 'cookie': # default to cookie
-            resp.set_cookie(**self.token_opts)
-        elif self.token_opts['location'] == 'header':
-            resp.body.update({self.token_opts['name'] : self.token_opts['value'],
+        if token_opts.get('location', 'cookie') == 'cookie': # default to cookie
+            resp.set_cookie(**token_opts)
+        elif token_opts['location'] == 'header':
+            resp.body.update({token_opts['name'] : token_opts['value'],
                               "user_identifier": user_identifier})
         else:
             resp.status = falcon.HTTP_INTERNAL_SERVER_ERROR
@@ -287,7 +188,7 @@ class RegisterResource(object):
     def __init__(self, get_user, secret, verify_phone_token_expiration_seconds, **token_opts):
         self.get_user = get_user
         self.secret = secret
-        self.token_opts = token_opts or DEFAULT_TOKEN_OPTS
+        self.token_opts = dict(token_opts or DEFAULT_TOKEN_OPTS)
         self.verify_phone_token_expiration_seconds = verify_phone_token_expiration_seconds        
        
     @falcon.after(kafka_register_producer)
@@ -362,12 +263,13 @@ class RegisterResource(object):
                             self.secret,
                             algorithm='HS256').decode("utf-8")
         logger.debug("Setting TOKEN!")
-        self.token_opts["value"] = token
-        logger.debug(self.token_opts)
-        if self.token_opts.get('location', 'cookie') == 'cookie': # default to cookie
-            resp.set_cookie(**self.token_opts)
-        elif self.token_opts['location'] == 'header':
-            resp.body.update({self.token_opts['name'] : self.token_opts['value']})
+        # Resources are shared by all requests (and threads), never store the token on self
+        token_opts = dict(self.token_opts, value=token)
+        logger.debug(token_opts)
+        if token_opts.get('location', 'cookie') == 'cookie': # default to cookie
+            resp.set_cookie(**token_opts)
+        elif token_opts['location'] == 'header':
+            resp.body.update({token_opts['name'] : token_opts['value']})
             #resp.body = json_util.dumps(resp.body)
         else:
             raise falcon.HTTPInternalServerError('Unrecognized jwt token location specifier')
@@ -382,7 +284,7 @@ class LoginResource(object):
         self.get_user = get_user
         self.secret = secret
         self.token_expiration_seconds = token_expiration_seconds
-        self.token_opts = token_opts or DEFAULT_TOKEN_OPTS
+        self.token_opts = dict(token_opts or DEFAULT_TOKEN_OPTS)
         logger.debug(token_opts)
 
     @falcon.after(kafka_login_producer)
@@ -436,13 +338,14 @@ class LoginResource(object):
                             self.secret,
                             algorithm='HS256').decode("utf-8")
         logger.debug("Setting TOKEN!")
-        self.token_opts["value"] = token
-        logger.debug(self.token_opts)
+        # Resources are shared by all requests (and threads), never store the token on self
+        token_opts = dict(self.token_opts, value=token)
+        logger.debug(token_opts)
         
-        if self.token_opts.get('location', 'cookie') == 'cookie': # default to cookie
-            resp.set_cookie(**self.token_opts)
-        elif self.token_opts['location'] == 'header':
-            resp.body.update({self.token_opts['name'] : self.token_opts['value'],
+        if token_opts.get('location', 'cookie') == 'cookie': # default to cookie
+            resp.set_cookie(**token_opts)
+        elif token_opts['location'] == 'header':
+            resp.body.update({token_opts['name'] : token_opts['value'],
                               "user_identifier": user_identifier})
         else:
             resp.status = falcon.HTTP_INTERNAL_SERVER_ERROR
@@ -470,6 +373,9 @@ class LogoutResource(object):
                                               'User did not verify phone.',
                                               ['Hello="World!"']) 
             user.update(phone_last_verified=datetime.utcnow())
+            # Tokens issued before logout must stop working on every worker
+            invalidate_identity(str(user.id))
+            revoke_token(req.context.auth_token_digest)
             resp.status = falcon.HTTP_OK
         else:
             raise falcon.HTTPUnauthorized('Logout Failed',
@@ -525,7 +431,7 @@ class PasswordChangeResource(object):
         self.get_user = get_user
         self.secret = secret
         self.token_expiration_seconds = token_expiration_seconds
-        self.token_opts = token_opts or DEFAULT_TOKEN_OPTS
+        self.token_opts = dict(token_opts or DEFAULT_TOKEN_OPTS)
         logger.debug(token_opts)
         
     @falcon.after(kafka_passwordchange_producer)
@@ -579,13 +485,14 @@ class PasswordChangeResource(object):
                             self.secret,
                             algorithm='HS256').decode("utf-8")
         logger.debug("Setting TOKEN!")
-        self.token_opts["value"] = token
-        logger.debug(self.token_opts)
+        # Resources are shared by all requests (and threads), never store the token on self
+        token_opts = dict(self.token_opts, value=token)
+        logger.debug(token_opts)
         
-        if self.token_opts.get('location', 'cookie') == 'cookie': # default to cookie
-            resp.set_cookie(**self.token_opts)
-        elif self.token_opts['location'] == 'header':
-            resp.body = {self.token_opts['name'] : self.token_opts['value'],
+        if token_opts.get('location', 'cookie') == 'cookie': # default to cookie
+            resp.set_cookie(**token_opts)
+        elif token_opts['location'] == 'header':
+            resp.body = {token_opts['name'] : token_opts['value'],
                          "user_identifier": user_identifier
                         }
         else:
@@ -599,17 +506,20 @@ class AuthMiddleware(object):
     def __init__(self, get_user, secret, **token_opts):
         self.secret = secret
         self.get_user = get_user
-        self.token_opts = token_opts or DEFAULT_TOKEN_OPTS
+        self.token_opts = dict(token_opts or DEFAULT_TOKEN_OPTS)
 
     def process_resource(self, req, resp, resource, params): # pylint: disable=unused-argument
         logger.debug("Req URL: " + req.url)
         logger.debug("Req method: " + req.method.lower())
-        if isinstance(resource, RegisterResource) or \
-           isinstance(resource, VerifyPhoneResource) or \
-           isinstance(resource, PasswordChangeResource) or \
-           isinstance(resource, ForgotPasswordResource) or \
-           isinstance(resource, PrometheusMiddleware) or \
-           isinstance(resource, Ping) or ("/images/" in req.url and req.method.lower()=='get'):
+        # Policies are compiled per route template and method when the routes are loaded
+        policy = get_route_policy(req, resource)
+        if policy is None:
+            logger.error("No route policy for %s %s, access denied" %(req.method, req.path))
+            raise falcon.HTTPUnauthorized(
+                title='Authorization Failed',
+                description='User does not have privilege/permission to view requested resource.'
+            )
+        if not policy.token_required:
             logger.debug("DON'T NEED TOKEN")
             return
         
@@ -631,7 +541,8 @@ class AuthMiddleware(object):
                                                 description,
                                                 href='http://docs.example.com/auth')
         
-        if not self._token_is_valid(resp, token):
+        claims = self._decode_token(resp, token)
+        if claims is None:
             logger.debug(token)
             logger.error('The provided auth token is not valid. Please request a new token and try again.')
             description = ('The provided auth token is not valid. '
@@ -643,15 +554,20 @@ class AuthMiddleware(object):
                                           href='http://docs.example.com/auth')
         
         logger.debug("Token looks fine")
+        # All per request auth state lives on the request, the middleware itself
+        # is shared by every thread/greenlet of the worker.
+        req.context.auth_claims = claims
+        req.context.auth_token_digest = token_digest(token)
         # we used user mongo object id as user identifier
-        user_id = self.decoded.pop("user_identifier")
+        user_id = claims["user_identifier"]
+        req.context.user_id = user_id
         req.user_id = user_id
-        logger.debug("User id decoded from auth_token: %s" %repr(user_id))
-        phone_last_verified = self.decoded.pop("phone_last_verified")
+        logger.debug("User id decoded from auth_token: %r", user_id)
+        phone_last_verified = claims.get("phone_last_verified")
         logger.debug("Password last changed recovered from auth_token:")
         logger.debug(phone_last_verified)
         # check if user is authorized to this request
-        if not self._is_user_authorized(req, user_id, phone_last_verified, user_id_type='id'):
+        if not self._is_user_authorized(req, policy, user_id, phone_last_verified):
             resp.status = falcon.HTTP_UNAUTHORIZED
             logger.error("Authorization Failed: User does not have privilege/permission or supplied expired token.")
             raise falcon.HTTPUnauthorized(
@@ -659,44 +575,35 @@ class AuthMiddleware(object):
                 description='User does not have privilege/permission to view requested resource.'
             )
 
-    def _token_is_valid(self, resp, token):
+    def _decode_token(self, resp, token):
+        # Returns the verified claims, or None if the token is invalid or expired.
+        # Signatures are only verified once per token and worker, see token_cache.
         try:
-            options = {'verify_exp': True}
-            self.decoded = jwt.decode(token, self.secret, verify='True', algorithms=['HS256'], options=options)
+            claims = decode_token(token, self.secret)
             resp.status = falcon.HTTP_ACCEPTED
-            return True
-        except jwt.DecodeError as err:
+            return claims
+        except jwt.InvalidTokenError as err:
             resp.status = falcon.HTTP_UNAUTHORIZED
             logger.error("Token validation failed Error :{}".format(str(err)))
-            return False
+            return None
 
-    def _access_allowed(self, req, user):
-        logger.debug("Checking if user is allowed access or not ...")
-        method = req.method.lower() or 'get'
-        path = req.path.lower()
-        logger.debug("method: %s" %repr(method))
-        logger.debug("path: %s" %repr(path))
-        
-        if path not in ACL_MAP:
-            # try replacing :id value with `+`
-            sub_path, _, id = path.rpartition('/')
-            if not sub_path:
-                return False  # unable to find a logical path for ACL checking
-            path = "{}/+".format(sub_path)
-            if path not in ACL_MAP:
-                return False
-            
-        logger.debug("Required role: %s" %repr(ACL_MAP[path].get(method, Role.USER)))
-        return user.role_satisfy(ACL_MAP[path].get(method, Role.USER))  # defaults to minimal role if method not found
+    def _access_allowed(self, policy, identity):
+        logger.debug("Required role for %s: %r", policy.template, policy.min_role)
+        return identity.role_satisfy(policy.min_role)
 
-    def _is_user_authorized(self, req, user_id, phone_last_verified, user_id_type='phone'):
-        user = self.get_user(user_id_type, user_id)
-        if user.phone_last_verified != phone_last_verified:
-            logger.error(user.phone_last_verified)
+    def _is_user_authorized(self, req, policy, user_id, phone_last_verified):
+        # Role and phone_last_verified come from the per worker identity cache,
+        # Mongo is only hit on a miss or after an invalidation
+        identity = get_identity(user_id, self.get_user)
+        if identity is None:
+            return False
+        if identity.phone_last_verified != phone_last_verified:
+            logger.error(identity.phone_last_verified)
             logger.error(phone_last_verified)
             logger.error("Supplied authentication token is expired. Please supply new token.")
             return False
-        return user is not None and self._access_allowed(req, user)
+        req.context.identity = identity
+        return self._access_allowed(policy, identity)
 
 def get_auth_objects(get_user, secret, token_expiration_seconds, verify_phone_token_expiration_seconds, token_opts=DEFAULT_TOKEN_OPTS): # pylint: disable=dangerous-default-value
     return ForgotPasswordResource(get_user),\
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import falcon
+
+from uggipuggi.models.user import Role
+
+# role-based permission control, keyed by route template.
+# Methods which are not listed default to the minimal role.
+ACL_MAP = {
+    '/recipes': {
+        'get':  Role.USER,
+        'post': Role.USER
+    },
+    '/recipes/{id}': {
+        'get' :   Role.USER,
+        'put' :   Role.USER,
+        'delete': Role.USER
+    },
+    '/activity': {
+        'get' : Role.USER,
+        'post': Role.USER
+    },
+    '/activity/{id}': {
+        'get':    Role.USER,
+        'put':    Role.USER,
+        'delete': Role.USER
+    },
+    '/users': {
+        'get':  Role.USER,
+        'post': Role.USER,
+    },
+    '/users/{id}': {
+        'get':    Role.USER,
+        'put':    Role.USER,
+        'delete': Role.USER
+    },
+    '/user_recipes/{id}': {
+        'get': Role.USER,
+    },
+    '/saved_recipes/{id}': {
+        'get': Role.USER,
+    },
+    '/user_activity/{id}': {
+        'get': Role.USER,
+    },
+    '/recipe_liked/{id}':{
+        'post': Role.USER,
+    },
+    '/recipe_saved/{id}':{
+        'post': Role.USER,
+    },
+    '/activity_liked/{id}':{
+        'post': Role.USER,
+    },
+    '/get_userid': {
+        'post': Role.USER
+    },
+    '/feed': {
+        'get':  Role.USER,
+    },
+    '/groups': {
+        'get':  Role.USER,
+        'post': Role.USER,
+    },
+    '/groups/{id}': {
+        'get':    Role.USER,
+        'put':    Role.USER,
+        'delete': Role.USER
+    },
+    '/group_recipes/{id}': {
+        'get':    Role.USER,
+    },
+    '/contacts/{id}': {
+        'get':    Role.USER,
+        'put':    Role.USER,
+        'delete': Role.USER
+    },
+    '/contacts/{id}/sync': {
+        'post':   Role.USER,
+    },
+    '/followers/{id}': {
+        'get':    Role.USER,
+        'put':    Role.USER,
+        'delete': Role.USER
+    },
+    '/following/{id}': {
+        'get':    Role.USER,
+        'put':    Role.USER,
+        'delete': Role.USER
+    },
+    '/following/{id}/bulk': {
+        'put':    Role.USER,
+    },
+    '/logout': {
+        'post': Role.USER,
+    },
+}
+
+# Routes served without an auth token, either for every method or only the listed ones
+PUBLIC_ROUTES = {
+    '/ping':            falcon.HTTP_METHODS,
+    '/metrics':         falcon.HTTP_METHODS,
+    '/register':        falcon.HTTP_METHODS,
+    '/verify':          falcon.HTTP_METHODS,
+    '/forgot_password': falcon.HTTP_METHODS,
+    '/password_change': falcon.HTTP_METHODS,
+    '/images/{id}':     ('GET',),
+}
+
+
+class RoutePolicy(object):
+    # What AuthMiddleware needs to know about a single route and method
+    __slots__ = ('template', 'min_role', 'token_required')
+
+    def __init__(self, template, min_role=Role.USER, token_required=True):
+        self.template = template
+        self.min_role = min_role
+        self.token_required = token_required
+
+    def __repr__(self):
+        return 'RoutePolicy(%r, min_role=%r, token_required=%r)' %(self.template,
+                                                                   self.min_role,
+                                                                   self.token_required)
+
+
+def compile_route_policy(template, acl_map=ACL_MAP, public_routes=PUBLIC_ROUTES):
+    """
+    Returns {HTTP method: RoutePolicy} for the route template. Methods of
+    templates that are neither public nor in the ACL get no policy, which
+    AuthMiddleware treats as access denied.
+    """
+    policies = {}
+    public_methods = public_routes.get(template, ())
+    acl = acl_map.get(template)
+    for method in falcon.HTTP_METHODS:
+        if method in public_methods:
+            policies[method] = RoutePolicy(template, token_required=False)
+        elif acl is not None:
+            policies[method] = RoutePolicy(template, acl.get(method.lower(), Role.USER))
+    return policies
+
+
+def attach_route_policy(resource, template, **kwargs):
+    # Several templates may share a resource, so policies are kept per template
+    route_policies = getattr(resource, 'route_policy', None)
+    if route_policies is None:
+        route_policies = resource.route_policy = {}
+    route_policies.update({(template, method): policy for method, policy in
+                           compile_route_policy(template, **kwargs).items()})
+    return route_policies
+
+
+def get_route_policy(req, resource):
+    # Single dict lookup per request, None means there is no policy: fail closed
+    try:
+        return resource.route_policy.get((req.uri_template, req.method))
+    except AttributeError:
+        return None
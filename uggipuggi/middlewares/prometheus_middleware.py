@@ -1,21 +1,96 @@
-from prometheus_client import CollectorRegistry, Counter, generate_latest
+import os
+import time
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest,\
+                              CONTENT_TYPE_LATEST, multiprocess
+
+# Set in the environment of every gunicorn worker, each worker then writes its
+# samples to files in this directory and /metrics adds them all up.
+# See conf/gunicorn_conf.py
+MULTIPROC_DIR_ENV = 'prometheus_multiproc_dir'
+
+# Shared by every module which exports metrics on /metrics
+registry = CollectorRegistry()
+
+# Collectors reporting on the state of the answering process, which can't be
+# written to the multiprocess files (e.g. connection pool usage)
+process_collectors = []
+
+RESPONSE_SIZE_BUCKETS = (100, 1000, 10000, 50000, 100000, 500000, 1000000, 5000000, float('inf'))
+
+# Requests which didn't match any route are labelled with this instead of their path
+UNMATCHED_ROUTE = 'unmatched'
+
+http_requests = Counter(
+    'http_total_request',
+    'Counter of total HTTP requests',
+    ['method', 'route', 'status'],
+    registry=registry)
+
+http_request_latency = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency in seconds, including all middlewares',
+    ['method', 'route'],
+    registry=registry)
+
+http_response_size = Histogram(
+    'http_response_size_bytes',
+    'HTTP response body size in bytes',
+    ['method', 'route'],
+    buckets=RESPONSE_SIZE_BUCKETS,
+    registry=registry)
+
+http_requests_in_flight = Gauge(
+    'http_requests_in_flight',
+    'HTTP requests currently being handled',
+    registry=registry,
+    multiprocess_mode='livesum')
+
+
+def register_process_collector(collector):
+    registry.register(collector)
+    process_collectors.append(collector)
+
+
+def _response_size(resp):
+    if resp.data is not None:
+        return len(resp.data)
+    if resp.body is not None:
+        return len(resp.body)
+    return resp.content_length or 0
 
 
 class PrometheusMiddleware(object):
     def __init__(self):
-        self.registry = CollectorRegistry()
-        self.requests = Counter(
-            'http_total_request',
-            'Counter of total HTTP requests',
-            ['method', 'path', 'status'],
-            registry=self.registry)
-
-    def process_response(self, req, resp, resource, req_succeeded):    
-        self.requests.labels(method=req.method, 
-                             path=req.path, 
-                             status=resp.status).inc()
+        self.registry = registry
+        self.requests = http_requests
+
+    def process_request(self, req, resp):
+        req.context.prometheus_start = time.time()
+        http_requests_in_flight.inc()
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        # Labelled by route template, so that ids in the path don't create new series
+        route = req.uri_template or UNMATCHED_ROUTE
+        self.requests.labels(method=req.method,
+                             route=route,
+                             status=resp.status[:3]).inc()
+        http_response_size.labels(method=req.method, route=route).observe(_response_size(resp))
+        start = req.context.get('prometheus_start')
+        if start is not None:
+            http_request_latency.labels(method=req.method, route=route).observe(time.time() - start)
+            http_requests_in_flight.dec()
+
+    def collect(self):
+        # With several gunicorn workers a scrape has to see the samples of all
+        # of them, not just of the worker which happens to answer it
+        if os.environ.get(MULTIPROC_DIR_ENV):
+            collected = CollectorRegistry()
+            multiprocess.MultiProcessCollector(collected)
+            for collector in process_collectors:
+                collected.register(collector)
+            return generate_latest(collected)
+        return generate_latest(self.registry)
 
     def on_get(self, req, resp):
-        data = generate_latest(self.registry)
-        resp.content_type = 'text/plain; version=0.0.4; charset=utf-8'
-        resp.body = str(data.decode('utf-8'))
\ No newline at end of file
+        resp.content_type = CONTENT_TYPE_LATEST
+        resp.data = self.collect()
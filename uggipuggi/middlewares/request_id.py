@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import uuid
+
+from uggipuggi.constants import REQUEST_ID_HEADER
+from uggipuggi.helpers.logs_metrics import set_request_id
+
+# Ids supplied by clients or proxies longer than this are cut down
+MAX_REQUEST_ID_LENGTH = 64
+
+
+class RequestIdMiddleware(object):
+    """
+    Gives every request a correlation id, taken from the X-Request-ID header
+    when the client or load balancer sent one. It is kept on req.context,
+    echoed back in the response and added to every log record of the request.
+    """
+    def process_request(self, req, resp):
+        request_id = req.get_header(REQUEST_ID_HEADER)
+        if request_id:
+            request_id = request_id[:MAX_REQUEST_ID_LENGTH]
+        else:
+            request_id = uuid.uuid4().hex
+        req.context.request_id = request_id
+        set_request_id(request_id)
+        resp.set_header(REQUEST_ID_HEADER, request_id)
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        set_request_id(None)
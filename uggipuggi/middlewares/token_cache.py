@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import jwt
+import time
+import hashlib
+from prometheus_client import Counter
+
+from uggipuggi.helpers.cache import TTLCache
+from uggipuggi.services.invalidation import invalidation_bus
+from uggipuggi.middlewares.prometheus_middleware import registry
+from uggipuggi.constants import TOKEN_CACHE_SIZE, TOKEN_EXPIRATION_SECS,\
+                                TOKEN_REVOCATION_CHANNEL
+
+
+token_cache_hits = Counter('auth_token_cache_hit',
+                           'Auth tokens served from the decoded claims cache',
+                           registry=registry)
+token_cache_misses = Counter('auth_token_cache_miss',
+                             'Auth tokens which had to be verified with jwt.decode',
+                             registry=registry)
+
+# token digest -> verified claims, every entry expires together with its token
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE, ttl=TOKEN_EXPIRATION_SECS)
+invalidation_bus.subscribe(TOKEN_REVOCATION_CHANNEL, token_cache.pop)
+
+
+def token_digest(token):
+    if isinstance(token, str):
+        token = token.encode('utf-8')
+    return hashlib.sha256(token).hexdigest()
+
+
+def decode_token(token, secret):
+    # Returns the verified claims, raises jwt.InvalidTokenError like jwt.decode.
+    # The returned dict is shared between requests and must not be modified.
+    invalidation_bus.ensure_started()
+    digest = token_digest(token)
+    claims = token_cache.get(digest)
+    if claims is not None:
+        token_cache_hits.inc()
+        return claims
+    token_cache_misses.inc()
+    claims = jwt.decode(token, secret, verify='True', algorithms=['HS256'],
+                        options={'verify_exp': True})
+    ttl = None
+    if 'exp' in claims:
+        ttl = claims['exp'] - time.time()
+    if ttl is None or ttl > 0:
+        token_cache.set(digest, claims, ttl=ttl)
+    return claims
+
+
+def revoke_token(digest, redis_conn=None):
+    # Drop locally straight away, other workers get it via pub/sub
+    token_cache.pop(digest)
+    invalidation_bus.publish(TOKEN_REVOCATION_CHANNEL, digest, redis_conn)
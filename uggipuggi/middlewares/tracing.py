@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from opentracing import Format, InvalidCarrierException, SpanContextCorruptedException
+from opentracing.ext import tags
+
+
+class TracingMiddleware(object):
+    """
+    Starts a server span for every request, continuing the caller's trace
+    when it sent one. The span is active for the whole request, so the
+    redis, mongo, Kafka and upload spans of helpers.tracing become its children.
+    """
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    def process_request(self, req, resp):
+        try:
+            parent = self.tracer.extract(Format.HTTP_HEADERS, req.headers)
+        except (InvalidCarrierException, SpanContextCorruptedException):
+            parent = None
+        req.context.trace_scope = self.tracer.start_active_span(
+            req.method, child_of=parent,
+            tags={tags.SPAN_KIND: tags.SPAN_KIND_RPC_SERVER,
+                  tags.HTTP_METHOD: req.method,
+                  tags.HTTP_URL: req.path,
+                  'request_id': req.context.get('request_id')})
+
+    def process_resource(self, req, resp, resource, params):
+        # Named by route template so that spans of the same endpoint group together
+        scope = req.context.get('trace_scope')
+        if scope is not None:
+            scope.span.set_operation_name(' '.join([req.method, req.uri_template]))
+
+    def process_response(self, req, resp, resource, req_succeeded):
+        scope = req.context.get('trace_scope')
+        if scope is None:
+            return
+        req.context.trace_scope = None
+        scope.span.set_tag(tags.HTTP_STATUS_CODE, resp.status[:3])
+        if not req_succeeded:
+            scope.span.set_tag(tags.ERROR, True)
+        scope.close()
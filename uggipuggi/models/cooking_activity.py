@@ -22,6 +22,7 @@ class CookingActivity(Document):
     recipe_name  = StringField(required=True)
     likes_count  = IntField(required=True, default=0)
     comments_count = IntField(required=True, default=0)
+    counters_batch = IntField(required=False) # Last counter batch applied, see services.counters
     author_display_name = StringField(required=True)   
     description  = StringField(required=True, default="", max_length=TWEET_CHAR_LENGTH)
     item_type    = StringField(required=True, default="activity")
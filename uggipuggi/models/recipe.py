@@ -33,6 +33,7 @@ class Recipe(Document):
     likes_count        = IntField(required=True, default=0)    
     comments_count     = IntField(required=True, default=0)
     saves_count        = IntField(required=True, default=0)
+    counters_batch     = IntField(required=False) # Last counter batch applied, see services.counters
     prep_time          = IntField(required=True, default=15) # In minutes   
     cook_time          = IntField(required=True, default=15) # In minutes   
     description        = StringField(required=True, default="", max_length=TWEET_CHAR_LENGTH)
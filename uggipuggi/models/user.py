@@ -55,6 +55,8 @@ class User(Document):
     app_platform    = StringField(required=True, default="android")
     subscription    = IntField(required=True, default=Subscription.FREE)
     status          = StringField(required=True, default=DEFAULT_USER_STATUS, max_length=50)
+    # Dense integer id allocated at verification, sets of users in redis hold it
+    uid             = IntField(required=False, unique=True, sparse=True)
     
     # Not mandatory
     #phone_last_verified = DateTimeField(required=False)    
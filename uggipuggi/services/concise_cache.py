@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from prometheus_client import Counter
+from uggipuggi.helpers.cache import TTLCache
+from uggipuggi.helpers.concise_view import decode_hash
+from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
+from uggipuggi.middlewares.prometheus_middleware import registry
+from uggipuggi.services.invalidation import invalidation_bus
+from uggipuggi.constants import PUBLIC_RECIPES, CONCISE_CACHE_SIZE, CONCISE_CACHE_TTL,\
+                                CONCISE_CACHE_WARM_UP, CONCISE_INVALIDATION_CHANNEL
+
+logger = init_logger()
+statsd = init_statsd('up.services.concise_cache')
+
+concise_cache_lookups = Counter(
+    'concise_cache_lookups_total',
+    'Concise view lookups by result, hit ratio is hit / (hit + miss)',
+    ['result'],
+    registry=registry)
+
+concise_cache = TTLCache(maxsize=CONCISE_CACHE_SIZE, ttl=CONCISE_CACHE_TTL)
+# Bumped by every invalidation, views read from redis while it changed aren't cached
+_generation = [0]
+
+
+def _evict(key):
+    _generation[0] += 1
+    concise_cache.pop(key)
+
+invalidation_bus.subscribe(CONCISE_INVALIDATION_CHANNEL, _evict)
+
+
+def get_concise_views(redis_conn, keys):
+    """
+    Decoded concise views of the 'r:' and 'act:' keys, from this worker's
+    cache or else from redis in one pipeline. Views are shared between
+    requests, don't modify them. Deleted items come back as {}.
+    """
+    invalidation_bus.ensure_started()
+    views = {}
+    missing = []
+    for key in keys:
+        view = concise_cache.get(key)
+        if view is None:
+            missing.append(key)
+        else:
+            views[key] = view
+    hits = len(views)
+    statsd.incr('concise_cache.hit', hits)
+    statsd.incr('concise_cache.miss', len(missing))
+    concise_cache_lookups.labels(result='hit').inc(hits)
+    concise_cache_lookups.labels(result='miss').inc(len(missing))
+    if not missing:
+        return views
+    generation = _generation[0]
+    pipeline = redis_conn.pipeline(False)
+    for key in missing:
+        pipeline.hgetall(key)
+    mappings = pipeline.execute()
+    cacheable = generation == _generation[0]
+    for key, mapping in zip(missing, mappings):
+        views[key] = decode_hash(key, mapping)
+        if mapping and cacheable:
+            concise_cache.set(key, views[key])
+    return views
+
+
+def get_concise_values(redis_conn, keys, fields):
+    # Like an hmget of fields per key, as decoded values
+    views = get_concise_views(redis_conn, keys)
+    return [[views[key].get(field) for field in fields] for key in keys]
+
+
+def invalidate_concise_view(key, redis_conn=None, published=False):
+    # Call after changing the hash, other workers drop it via pub/sub, published
+    # when a script already did that
+    _evict(key)
+    if not published:
+        invalidation_bus.publish(CONCISE_INVALIDATION_CHANNEL, key, redis_conn)
+
+
+def warm_up(redis_conn, count=CONCISE_CACHE_WARM_UP):
+    # Newest public recipes, which show up in every feed
+    try:
+        get_concise_views(redis_conn, redis_conn.zrevrange(PUBLIC_RECIPES, 0, count - 1))
+    except Exception as e:
+        logger.error("Concise view cache warm up failed: %s" %repr(e))
+        return
+    logger.info("Concise view cache warmed up with %d views" %len(concise_cache))
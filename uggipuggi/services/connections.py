@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Redis, Kafka and MongoDB clients, one pooled client of each kind per process.
+
+Nothing connects at import. Clients are created on first use in the process
+which uses them and are forgotten, without closing the sockets they share
+with the parent, once the process forks. gunicorn's post_fork and celery's
+worker_process_init call after_fork(), the pid check covers any other fork.
+Pool sizes and timeouts come from the [redis], [kafka] and [mongodb]
+sections of conf/*.ini. Setting cluster_nodes in [redis], or the
+REDIS_CLUSTER_NODES environment variable, connects to a redis cluster.
+"""
+from __future__ import absolute_import
+import os
+import threading
+import redis
+from prometheus_client.core import GaugeMetricFamily
+from mongoengine import connection as mongo_connection
+
+from uggipuggi.helpers.keys import RedisCluster
+from uggipuggi.helpers.tracing import TracedRedis, TracedProducer
+from uggipuggi.middlewares.prometheus_middleware import register_process_collector
+
+
+class ConnectionManager(object):
+
+    def __init__(self, config=None):
+        self._lock = threading.RLock()
+        self.configure(config or {})
+
+    def configure(self, config):
+        # config is the dict returned by conf.get_config
+        with self._lock:
+            self.config = config
+            self.reset()
+
+    def reset(self):
+        # Closing the parent's clients would close (or write to) its sockets too
+        self._pid = os.getpid()
+        self._redis = None
+        self._kafka_producer = None
+        self._mongo_connected = False
+
+    def after_fork(self):
+        # mongoengine keeps its client globally, so models need a fresh one straight away
+        with self._lock:
+            mongo_was_connected = self._mongo_connected
+            self.reset()
+            if mongo_was_connected:
+                self.connect_mongo()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self.after_fork()
+
+    def _section(self, name):
+        return self.config.get(name, {})
+
+    @property
+    def redis(self):
+        self._check_pid()
+        if self._redis is None:
+            with self._lock:
+                if self._redis is None:
+                    self._redis = self._create_redis()
+        return self._redis
+
+    @property
+    def kafka_producer(self):
+        self._check_pid()
+        if self._kafka_producer is None:
+            with self._lock:
+                if self._kafka_producer is None:
+                    self._kafka_producer = self._create_kafka_producer()
+        return self._kafka_producer
+
+    def connect_mongo(self):
+        # Models reach the client through mongoengine's 'default' alias
+        self._check_pid()
+        with self._lock:
+            if not self._mongo_connected:
+                self._connect_mongo()
+                self._mongo_connected = True
+        return mongo_connection.get_connection()
+
+    def _create_redis(self):
+        redis_config = self._section('redis')
+        cluster_nodes = os.environ.get('REDIS_CLUSTER_NODES', redis_config.get('cluster_nodes'))
+        if cluster_nodes:
+            return self._create_redis_cluster(redis_config, cluster_nodes)
+        pool = redis.BlockingConnectionPool(
+            host=redis_config.get('host', 'redis'),
+            port=int(redis_config.get('port', 6379)),
+            db=int(redis_config.get('db', 0)),
+            max_connections=int(redis_config.get('max_connections', 50)),
+            # seconds to wait for a free connection before raising ConnectionError
+            timeout=float(redis_config.get('pool_timeout', 5)),
+            socket_timeout=float(redis_config.get('socket_timeout', 5)),
+            socket_connect_timeout=float(redis_config.get('socket_connect_timeout', 2)),
+            encoding='utf-8',
+            decode_responses=True)
+        return TracedRedis(connection_pool=pool)
+
+    def _create_redis_cluster(self, redis_config, cluster_nodes):
+        # cluster_nodes is host:port,host:port..., the other nodes are discovered from them
+        if RedisCluster is None:
+            raise RuntimeError('Redis cluster_nodes is set but redis-py-cluster is not installed')
+        startup_nodes = [{'host': host, 'port': int(port)}
+                         for host, port in (node.strip().rsplit(':', 1) for node in cluster_nodes.split(','))]
+        return RedisCluster(
+            startup_nodes=startup_nodes,
+            # per node, a cluster pool doesn't block when it runs out
+            max_connections=int(redis_config.get('max_connections', 50)),
+            max_connections_per_node=True,
+            socket_timeout=float(redis_config.get('socket_timeout', 5)),
+            socket_connect_timeout=float(redis_config.get('socket_connect_timeout', 2)),
+            decode_responses=True)
+
+    def _create_kafka_producer(self):
+        kafka_config = self._section('kafka')
+        bootstrap_servers = os.environ.get('KAFKA_BOOTSTRAP_SERVERS',
+                                           kafka_config.get('kafka_bootstrap_servers', 'kafka:9092'))
+        return TracedProducer({
+            'bootstrap.servers': bootstrap_servers,
+            'linger.ms': int(kafka_config.get('linger_ms', 5)),
+            'queue.buffering.max.messages': int(kafka_config.get('queue_buffering_max_messages', 100000)),
+            'message.timeout.ms': int(kafka_config.get('message_timeout_ms', 30000)),
+        })
+
+    def _connect_mongo(self):
+        db_config = self._section('mongodb')
+        attr_map = {'host': str, 'port': int, 'username': str, 'password': str}
+        kwargs = {}
+        for key, typ in attr_map.items():
+            kwargs[key] = typ(db_config.get(key)) if db_config.get(key) else None
+        mongo_connection.disconnect('default')  # disconnect previous default connection if any
+        # connect=False: sockets are opened by the first query, never before a fork
+        mongo_connection.connect(db_config.get('name'), connect=False,
+                                 maxPoolSize=int(db_config.get('max_pool_size', 100)),
+                                 serverSelectionTimeoutMS=int(db_config.get('server_selection_timeout_ms', 5000)),
+                                 connectTimeoutMS=int(db_config.get('connect_timeout_ms', 2000)),
+                                 socketTimeoutMS=int(db_config.get('socket_timeout_ms', 10000)),
+                                 **kwargs)
+
+    def pool_stats(self):
+        # Only clients this process created, nothing is connected to report on them
+        stats = {}
+        if self._pid != os.getpid():
+            return stats
+        if self._redis is not None:
+            pool = self._redis.connection_pool
+            if hasattr(pool, 'pool'):
+                idle = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+                in_use = len(pool._connections) - idle
+            else:
+                # Cluster pool, connections are kept per node
+                idle = sum(len(conns) for conns in list(pool._available_connections.values()))
+                in_use = sum(len(conns) for conns in list(pool._in_use_connections.values()))
+            stats['redis'] = {'in_use': in_use,
+                              'idle': idle,
+                              'max': pool.max_connections}
+        if self._kafka_producer is not None:
+            stats['kafka'] = {'queued': len(self._kafka_producer)}
+        return stats
+
+
+class ConnectionPoolCollector(object):
+    # Pool usage of the worker answering /metrics, labelled with its pid
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    def collect(self):
+        pid = str(os.getpid())
+        stats = self.manager.pool_stats()
+        redis_connections = GaugeMetricFamily('redis_pool_connections',
+                                              'Redis pool connections by state',
+                                              labels=['pid', 'state'])
+        redis_max = GaugeMetricFamily('redis_pool_max_connections',
+                                      'Redis pool size', labels=['pid'])
+        kafka_queued = GaugeMetricFamily('kafka_producer_queued_messages',
+                                         'Messages waiting for delivery in the Kafka producer',
+                                         labels=['pid'])
+        if 'redis' in stats:
+            redis_connections.add_metric([pid, 'in_use'], stats['redis']['in_use'])
+            redis_connections.add_metric([pid, 'idle'], stats['redis']['idle'])
+            redis_max.add_metric([pid], stats['redis']['max'])
+        if 'kafka' in stats:
+            kafka_queued.add_metric([pid], stats['kafka']['queued'])
+        return [redis_connections, redis_max, kafka_queued]
+
+
+connections = ConnectionManager()
+register_process_collector(ConnectionPoolCollector(connections))
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+Address book sync. Besides the contacts set, which holds the integer ids
+of the people in a user's address book who use the app, the numbers of the
+book are kept in E.164 form, with those nobody has registered yet in a
+pending set. A sync then only carries the numbers added and removed since
+the last one, and its cost is in their count, not in the size of the book.
+Each pending number indexes the books that hold it, so when its owner
+verifies, add_joined_user adds them to those books' contacts and the next
+sync of each reports them as joined.
+
+Every sync returns a digest of the book it left, which it updates from the
+numbers it adds and removes. The client sends it back with the next sync:
+if it isn't the stored one, e.g. the client missed a response, the copies
+may have drifted apart and the client uploads its whole book again.
+"""
+from __future__ import absolute_import
+import re
+import uuid
+import hashlib
+from itertools import islice
+from uggipuggi.constants import CONTACTS, CONTACTS_BOOK, CONTACTS_PENDING, CONTACTS_DIGEST,\
+                                CONTACTS_SYNC_LOCK, CONTACTS_CHUNK_SIZE, CONTACTS_SYNC_LOCK_TTL,\
+                                CONTACTS_WAITING, CONTACTS_JOINED
+from uggipuggi.helpers.keys import release_lock
+from uggipuggi.services.phone_directory import lookup_phones
+from uggipuggi.services.user_ids import to_uids
+
+# Characters people write phone numbers with
+_SEPARATORS = re.compile(r'[\s().\-/]')
+# Country code and subscriber number, E.164 allows at most 15 digits
+_E164_DIGITS = re.compile(r'[1-9][0-9]{6,14}$')
+
+
+class SyncInProgress(Exception):
+    # Another sync of the address book holds the lock, retry shortly
+    pass
+
+
+def normalize_number(number, country_code=None):
+    """
+    E.164 form, '+<country code><number>', of a number written as +44...,
+    0044... or, given the country code of the address book, as a national
+    number with or without its leading 0. None when it isn't a phone number.
+    """
+    number = _SEPARATORS.sub('', str(number))
+    if number.startswith('+'):
+        digits = number[1:]
+    elif number.startswith('00'):
+        digits = number[2:]
+    elif country_code:
+        digits = str(country_code).lstrip('+') + (number[1:] if number.startswith('0') else number)
+    else:
+        return None
+    return '+' + digits if _E164_DIGITS.match(digits) else None
+
+
+def normalize_numbers(numbers, country_code=None):
+    # Valid numbers in E.164 form, each once, and the ones that aren't numbers
+    normalized, invalid = set(), []
+    for number in numbers:
+        e164 = normalize_number(number, country_code)
+        if e164 is None:
+            invalid.append(number)
+        else:
+            normalized.add(e164)
+    return normalized, invalid
+
+
+def resolve_numbers(redis_conn, numbers, chunk_size=CONTACTS_CHUNK_SIZE):
+    # {number: user id} of the E.164 numbers that belong to users, one pipeline per chunk
+    numbers = list(numbers)
+    user_ids = lookup_phones(redis_conn, numbers, chunk_size)
+    return {number: user_id for number, user_id in zip(numbers, user_ids) if user_id}
+
+
+def _number_hash(number):
+    return int(hashlib.sha1(number.encode('utf-8')).hexdigest(), 16)
+
+
+def book_digest(numbers, digest=None):
+    # XOR of the numbers' hashes, toggled into digest: doesn't depend on their
+    # order, and a sync updates it from the numbers it adds and removes alone
+    value = int(digest, 16) if digest else 0
+    for number in numbers:
+        value ^= _number_hash(number)
+    return '%040x' % value
+
+
+def _in_book(redis_conn, book, numbers, chunk_size):
+    # Whether each number is in the book, one pipeline per chunk
+    found = []
+    for start in range(0, len(numbers), chunk_size):
+        pipeline = redis_conn.pipeline(False)
+        for number in numbers[start:start + chunk_size]:
+            pipeline.sismember(book, number)
+        found.extend(pipeline.execute())
+    return found
+
+
+def _pop_joined(redis_conn, user_id):
+    # Users who registered a pending number of the book since the last sync,
+    # read and cleared at once as add_joined_user may add more meanwhile
+    pipeline = redis_conn.pipeline()
+    pipeline.smembers(CONTACTS_JOINED + user_id)
+    pipeline.delete(CONTACTS_JOINED + user_id)
+    return list(pipeline.execute()[0])
+
+
+def _apply(redis_conn, user_id, digest, added, removed, chunk_size):
+    # Costs are in the size of the delta, not of the book
+    book, pending, contacts = CONTACTS_BOOK + user_id, CONTACTS_PENDING + user_id, CONTACTS + user_id
+    in_book = _in_book(redis_conn, book, added + removed, chunk_size)
+    # Numbers already in the book, or not in it when removed, change nothing
+    added, removed = ([number for number, found in zip(added, in_book) if not found],
+                      [number for number, found in zip(removed, in_book[len(added):]) if found])
+    removed_users = resolve_numbers(redis_conn, removed, chunk_size)
+    added_users = resolve_numbers(redis_conn, added, chunk_size)
+    pipeline = redis_conn.pipeline(False)
+    for start in range(0, len(removed), chunk_size):
+        chunk = removed[start:start + chunk_size]
+        pipeline.srem(book, *chunk)
+        pipeline.srem(pending, *chunk)
+    for number in removed:
+        if number not in removed_users:
+            pipeline.srem(CONTACTS_WAITING + number, user_id)
+    removed_ids = [removed_users[number] for number in removed if number in removed_users]
+    removed_uids = [uid for uid in to_uids(redis_conn, removed_ids) if uid is not None]
+    if removed_uids:
+        pipeline.srem(contacts, *removed_uids)
+    for start in range(0, len(added), chunk_size):
+        pipeline.sadd(book, *added[start:start + chunk_size])
+    unresolved = [number for number in added if number not in added_users]
+    for start in range(0, len(unresolved), chunk_size):
+        pipeline.sadd(pending, *unresolved[start:start + chunk_size])
+    for number in unresolved:
+        # add_joined_user finds the book when the number is registered
+        pipeline.sadd(CONTACTS_WAITING + number, user_id)
+    added_uids = [uid for uid in to_uids(redis_conn, list(added_users.values())) if uid is not None]
+    if added_uids:
+        pipeline.sadd(contacts, *added_uids)
+    digest = book_digest(added + removed, digest)
+    pipeline.set(CONTACTS_DIGEST + user_id, digest)
+    pipeline.execute()
+    return {'digest': digest,
+            'added_contacts': list(added_users.values()),
+            'removed_contacts': removed_ids,
+            'joined_contacts': _pop_joined(redis_conn, user_id)}
+
+
+def sync_contacts(redis_conn, user_id, digest=None, added=(), removed=(), numbers=None,
+                  country_code=None, chunk_size=CONTACTS_CHUNK_SIZE):
+    """
+    Applies the numbers added to and removed from the user's address book
+    since the sync that returned digest, or with numbers, replaces the whole
+    book. Returns the new digest, the user ids of contacts added, removed and
+    joined since the last sync, and the numbers that couldn't be read, None
+    when the digest isn't the stored one. Raises SyncInProgress while another
+    sync of the book runs.
+    """
+    lock, token = CONTACTS_SYNC_LOCK + user_id, uuid.uuid4().hex
+    if not redis_conn.set(lock, token, nx=True, ex=CONTACTS_SYNC_LOCK_TTL):
+        raise SyncInProgress(user_id)
+    try:
+        if numbers is not None:
+            book, invalid = normalize_numbers(numbers, country_code)
+            synced = set(redis_conn.sscan_iter(CONTACTS_BOOK + user_id, count=chunk_size))
+            added, removed = book - synced, synced - book
+            # The stored digest may be of another book, e.g. older clients' or an older format
+            digest = book_digest(synced)
+        elif digest is None or digest != redis_conn.get(CONTACTS_DIGEST + user_id):
+            return None
+        else:
+            added, invalid = normalize_numbers(added, country_code)
+            removed, _ = normalize_numbers(removed, country_code)
+            # Removed and added again, still in the book
+            removed -= added
+        result = _apply(redis_conn, user_id, digest, sorted(added), sorted(removed), chunk_size)
+        result['invalid'] = invalid
+        return result
+    finally:
+        release_lock(redis_conn, lock, token)
+
+
+def add_joined_user(redis_conn, user_id, phone, chunk_size=CONTACTS_CHUNK_SIZE):
+    """
+    Adds a user who verified their number to the contacts of everyone whose
+    address book holds it, their next sync reports them as joined. Returns
+    the number of address books.
+    """
+    number = normalize_number(phone)
+    uid = to_uids(redis_conn, [user_id])[0]
+    if number is None or uid is None:
+        return 0
+    waiting = CONTACTS_WAITING + number
+    owners = redis_conn.sscan_iter(waiting, count=chunk_size)
+    books = 0
+    for chunk in iter(lambda: list(islice(owners, chunk_size)), []):
+        pipeline = redis_conn.pipeline(False)
+        for owner_id in chunk:
+            if owner_id != user_id:
+                pipeline.sadd(CONTACTS + owner_id, uid)
+                pipeline.sadd(CONTACTS_JOINED + owner_id, user_id)
+            pipeline.srem(CONTACTS_PENDING + owner_id, number)
+        pipeline.execute()
+        books += len(chunk)
+    redis_conn.delete(waiting)
+    return books
+
+
+def index_pending_numbers(redis_conn, chunk_size=CONTACTS_CHUNK_SIZE):
+    """
+    Builds the index add_joined_user reads from the pending sets of address
+    books synced before it, numbers registered since become joined contacts.
+    Safe to run while serving and to run again. Returns the number of
+    pending numbers indexed.
+    """
+    indexed = 0
+    for pending in redis_conn.scan_iter(match=CONTACTS_PENDING + '*', count=chunk_size):
+        owner_id = pending[len(CONTACTS_PENDING):]
+        numbers = redis_conn.sscan_iter(pending, count=chunk_size)
+        for chunk in iter(lambda: list(islice(numbers, chunk_size)), []):
+            joined = resolve_numbers(redis_conn, chunk, chunk_size)
+            joined_uids = [uid for uid in to_uids(redis_conn, list(joined.values())) if uid is not None]
+            pipeline = redis_conn.pipeline(False)
+            for number in chunk:
+                if number not in joined:
+                    pipeline.sadd(CONTACTS_WAITING + number, owner_id)
+            if joined:
+                pipeline.srem(pending, *joined)
+                pipeline.sadd(CONTACTS_JOINED + owner_id, *joined.values())
+            if joined_uids:
+                pipeline.sadd(CONTACTS + owner_id, *joined_uids)
+            pipeline.execute()
+            indexed += len(chunk) - len(joined)
+    return indexed
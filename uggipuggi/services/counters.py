@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Like, save and comment counts are changed in the redis concise views on the
+request path and written behind to mongo. Every change is also added to a
+delta hash per collection, in the same pipeline, and flush() periodically
+moves the deltas into a batch and applies it with bulk_write $inc.
+
+A batch is only deleted once applied. Each document records the last batch
+applied to it, and the update skips documents that already have it, so a
+batch retried after a failed flush isn't counted twice.
+"""
+from __future__ import absolute_import
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+
+from uggipuggi.constants import RECIPE, ACTIVITY, COUNTER_FLUSH_BATCH
+from uggipuggi.helpers.keys import counter_deltas_key, counter_flush_key, counter_batches_key
+from uggipuggi.models.recipe import Recipe
+from uggipuggi.models.cooking_activity import CookingActivity
+
+COUNTED_MODELS = {
+    RECIPE:   Recipe,
+    ACTIVITY: CookingActivity,
+}
+
+# Fields of a delta hash which aren't deltas
+BATCH_FIELD = '_batch'
+SINCE_FIELD = '_since'
+
+# Moves the deltas into the batch to flush, unless a previous batch is still there.
+# KEYS: deltas, batch, batch sequence, all in one slot
+_TAKE_BATCH_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call('RENAME', KEYS[1], KEYS[2])
+    redis.call('HSET', KEYS[2], '""" + BATCH_FIELD + """', redis.call('INCR', KEYS[3]))
+end
+return redis.call('HGETALL', KEYS[2])
+"""
+
+
+def delta_entry(key, field):
+    # The delta hash and field of a count of a concise view key, e.g. 'r:<id>'
+    prefix, item_id = key.split(':', 1)
+    return counter_deltas_key(prefix + ':'), ':'.join([item_id, field])
+
+
+def record_delta(pipeline, key, field, amount):
+    # For a count already changed in the view
+    deltas, delta_field = delta_entry(key, field)
+    pipeline.hincrby(deltas, delta_field, amount)
+    pipeline.hsetnx(deltas, SINCE_FIELD, time.time())
+
+
+def incr_counter(pipeline, key, field, amount=1):
+    # Queued on the caller's pipeline
+    pipeline.hincrby(key, field, amount)
+    record_delta(pipeline, key, field, amount)
+
+
+def batch_updates(batch):
+    """
+    UpdateOne per document of a batch read with HGETALL, and the time its
+    oldest delta was recorded
+    """
+    batch_id = int(batch.pop(BATCH_FIELD))
+    since = float(batch.pop(SINCE_FIELD, time.time()))
+    increments = {}
+    for delta_field, delta in batch.items():
+        item_id, field = delta_field.rsplit(':', 1)
+        if int(delta) != 0:
+            increments.setdefault(item_id, {})[field] = int(delta)
+    updates = []
+    for item_id, inc in increments.items():
+        try:
+            _id = ObjectId(item_id)
+        except InvalidId:
+            continue
+        updates.append(UpdateOne({'_id': _id, 'counters_batch': {'$ne': batch_id}},
+                                 {'$inc': inc, '$set': {'counters_batch': batch_id}}))
+    return updates, since
+
+
+def flush(redis_conn, prefix, batch_size=COUNTER_FLUSH_BATCH):
+    """
+    Applies the pending deltas of one collection, given by its concise view
+    prefix, to mongo. Returns the number of documents updated and the age in
+    seconds of the oldest delta flushed, None when there was nothing to flush.
+    """
+    batch_key = counter_flush_key(prefix)
+    script = redis_conn.register_script(_TAKE_BATCH_SCRIPT)
+    values = script(keys=[counter_deltas_key(prefix), batch_key, counter_batches_key(prefix)])
+    if not values:
+        return 0, None
+    updates, since = batch_updates(dict(zip(values[::2], values[1::2])))
+    collection = COUNTED_MODELS[prefix]._get_collection()
+    updated = 0
+    for start in range(0, len(updates), batch_size):
+        result = collection.bulk_write(updates[start:start + batch_size], ordered=False)
+        updated += result.modified_count
+    redis_conn.delete(batch_key)
+    return updated, time.time() - since
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+What a user liked and saved, kept per user: u_liked:{usr:<user id>} is the
+set of 'r:' and 'act:' keys they liked, usr:<user id> the zset of 'r:' keys
+they saved, both in one slot. List endpoints look up the flags of a whole
+page in one script call on the viewer's own keys, instead of one SISMEMBER
+per item on per item sets which popular items make hot. The per item sets,
+r_liked{r:<id>}, a_liked{act:<id>} and r_saved{r:<id>}, still record who
+liked and saved an item, by integer user id.
+
+Liking and saving are toggled by a script which changes the count only
+when membership changes, so repeated likes or unlikes are no-ops. Only then
+does it also write the user's index, the write-behind delta and the event,
+for forward_events() to hand to kafka off the request path, all in one
+atomic call. On a redis cluster those keys are in other slots than the
+item's, so the script only toggles and counts on the item's slot and the
+rest follows in a pipeline.
+"""
+from __future__ import absolute_import
+import time
+import uuid
+from itertools import islice
+from uggipuggi.constants import RECIPE, RECIPE_LIKED, ACTIVITY_LIKED, USER_SAVED_RECIPES,\
+                                ENGAGEMENT_EVENTS, ENGAGEMENT_FORWARD_LOCK, ENGAGEMENT_STREAM_MAXLEN,\
+                                ENGAGEMENT_FORWARD_BATCH, CONCISE_INVALIDATION_CHANNEL
+from uggipuggi.helpers.keys import hash_tag, is_cluster, item_likes_key, item_saves_key, user_liked_key,\
+                                  release_lock
+from uggipuggi.services.concise_cache import invalidate_concise_view
+from uggipuggi.services.counters import SINCE_FIELD, delta_entry, record_delta
+from uggipuggi.services.user_ids import require_uid, to_user_ids
+
+# KEYS: viewer's liked items, viewer's saved recipes; ARGV: item keys
+# Returns liked, saved pairs of 0/1
+_FLAGS_SCRIPT = """
+local flags = {}
+for _, item in ipairs(ARGV) do
+    flags[#flags + 1] = redis.call('SISMEMBER', KEYS[1], item)
+    flags[#flags + 1] = redis.call('ZSCORE', KEYS[2], item) and 1 or 0
+end
+return flags
+"""
+
+
+# KEYS: item's likes or saves, item's concise view, in one slot
+# ARGV: user's integer id, '1' to add or '0' to remove, count field
+# Returns whether membership changed and the count after it
+_TOGGLE_SCRIPT = """
+local changed = redis.call(ARGV[2] == '1' and 'SADD' or 'SREM', KEYS[1], ARGV[1])
+if changed == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[3], ARGV[2] == '1' and 1 or -1)
+end
+return {changed, tonumber(redis.call('HGET', KEYS[2], ARGV[3])) or 0}
+"""
+
+# As _TOGGLE_SCRIPT, and when membership changed also the user's side, for a single node
+# KEYS: item's likes or saves, item's concise view, delta hash, user's liked set or
+# saved zset, events stream
+# ARGV: user's integer id, '1' to add or '0' to remove, count field, delta field,
+# since field, time, score in the user's zset or '' for a set, stream maxlen, topic,
+# user id, event value, invalidation channel
+_ENGAGE_SCRIPT = """
+local add = ARGV[2] == '1'
+local changed = redis.call(add and 'SADD' or 'SREM', KEYS[1], ARGV[1])
+if changed == 1 then
+    local amount = add and 1 or -1
+    redis.call('HINCRBY', KEYS[2], ARGV[3], amount)
+    redis.call('HINCRBY', KEYS[3], ARGV[4], amount)
+    redis.call('HSETNX', KEYS[3], ARGV[5], ARGV[6])
+    if ARGV[7] == '' then
+        redis.call(add and 'SADD' or 'SREM', KEYS[4], KEYS[2])
+    elseif add then
+        redis.call('ZADD', KEYS[4], ARGV[7], KEYS[2])
+    else
+        redis.call('ZREM', KEYS[4], KEYS[2])
+    end
+    redis.call('XADD', KEYS[5], 'MAXLEN', '~', ARGV[8], '*', 'topic', ARGV[9], 'key', ARGV[10], 'value', ARGV[11])
+    redis.call('PUBLISH', ARGV[12], KEYS[2])
+end
+return {changed, tonumber(redis.call('HGET', KEYS[2], ARGV[3])) or 0}
+"""
+
+
+def _toggle(redis_conn, user_id, key, add, item_set, count_field, user_key, score, topic, value):
+    """
+    Adds or removes the user to or from the item's set and, only when that
+    changed membership, updates the count, the write-behind delta, the
+    user's liked set (score None) or saved zset and queues the event.
+    Returns whether membership changed and the count.
+    """
+    uid = require_uid(redis_conn, user_id)
+    if not is_cluster(redis_conn):
+        # All of it in one call, so nothing is lost if the worker dies halfway
+        deltas, delta_field = delta_entry(key, count_field)
+        script = redis_conn.register_script(_ENGAGE_SCRIPT)
+        changed, count = script(keys=[item_set, key, deltas, user_key, ENGAGEMENT_EVENTS],
+                                args=[uid, int(bool(add)), count_field, delta_field, SINCE_FIELD,
+                                      time.time(), '' if score is None else score,
+                                      ENGAGEMENT_STREAM_MAXLEN, topic, user_id, value,
+                                      CONCISE_INVALIDATION_CHANNEL])
+        if changed:
+            invalidate_concise_view(key, published=True)
+        return bool(changed), count
+    # The item's and the user's keys are in different slots, the user's side
+    # follows the toggle in a pipeline
+    script = redis_conn.register_script(_TOGGLE_SCRIPT)
+    changed, count = script(keys=[item_set, key], args=[uid, int(bool(add)), count_field])
+    if not changed:
+        return False, count
+    pipeline = redis_conn.pipeline(False)
+    record_delta(pipeline, key, count_field, 1 if add else -1)
+    if score is None:
+        (pipeline.sadd if add else pipeline.srem)(user_key, key)
+    elif add:
+        pipeline.zadd(user_key, {key: score})
+    else:
+        pipeline.zrem(user_key, key)
+    pipeline.xadd(ENGAGEMENT_EVENTS, {'topic': topic, 'key': user_id, 'value': value},
+                  maxlen=ENGAGEMENT_STREAM_MAXLEN)
+    invalidate_concise_view(key, pipeline)
+    pipeline.execute()
+    return True, count
+
+
+def toggle_like(redis_conn, user_id, key, liked, topic, value):
+    """
+    Likes or unlikes the 'r:' or 'act:' key for the user and queues the event
+    value for the kafka topic when that changed anything. Returns whether it
+    did and the likes count.
+    """
+    return _toggle(redis_conn, user_id, key, liked, item_likes_key(key), 'likes_count',
+                   user_liked_key(user_id), None, topic, value)
+
+
+def toggle_save(redis_conn, user_id, recipe_id, saved, topic, value):
+    # Like toggle_like, saved recipes are listed newest first by the time saved
+    key = RECIPE + recipe_id
+    return _toggle(redis_conn, user_id, key, saved, item_saves_key(recipe_id), 'saves_count',
+                   USER_SAVED_RECIPES + user_id, int(time.time()), topic, value)
+
+
+def viewer_flags(redis_conn, user_id, keys):
+    """
+    (liked, saved) of each of the 'r:' and 'act:' keys for the user, in one
+    round trip
+    """
+    if not keys:
+        return []
+    script = redis_conn.register_script(_FLAGS_SCRIPT)
+    flags = script(keys=[user_liked_key(user_id), USER_SAVED_RECIPES + user_id], args=keys)
+    return [(bool(liked), bool(saved)) for liked, saved in zip(flags[::2], flags[1::2])]
+
+
+def backfill_liked(redis_conn, batch_size=500):
+    """
+    Builds the per user liked sets from the per item sets, for likes recorded
+    before them. Run after migrate_legacy_keys(), safe to run again and while
+    serving. Returns the number of likes copied.
+    """
+    copied = 0
+    for item_likes in (RECIPE_LIKED, ACTIVITY_LIKED):
+        for item_set in redis_conn.scan_iter(match=item_likes + '{*', count=batch_size):
+            key = hash_tag(item_set)
+            uids = redis_conn.sscan_iter(item_set, count=batch_size)
+            while True:
+                batch = list(islice(uids, batch_size))
+                if not batch:
+                    break
+                pipeline = redis_conn.pipeline(False)
+                for user_id in to_user_ids(redis_conn, batch):
+                    if user_id is not None:
+                        pipeline.sadd(user_liked_key(user_id), key)
+                pipeline.execute()
+                copied += len(batch)
+    return copied
+
+
+def _delivery_callback(delivered, event_id):
+    # Called from flush() once the broker acknowledged the message or it failed
+    def on_delivery(err, msg):
+        if err is None:
+            delivered.append(event_id)
+    return on_delivery
+
+
+def forward_events(redis_conn, producer, batch_size=ENGAGEMENT_FORWARD_BATCH, lock_timeout=60):
+    """
+    Produces the queued events to kafka, oldest first, and deletes from the
+    stream only those the broker acknowledged. Events are delivered at least
+    once: the rest stay queued and are produced again by the next run.
+    Returns the number forwarded, None when another forwarder holds the lock.
+    """
+    lock_token = uuid.uuid4().hex
+    if not redis_conn.set(ENGAGEMENT_FORWARD_LOCK, lock_token, nx=True, ex=lock_timeout):
+        return None
+    forwarded = 0
+    try:
+        while True:
+            events = redis_conn.xrange(ENGAGEMENT_EVENTS, count=batch_size)
+            if not events:
+                break
+            delivered = []
+            for event_id, event in events:
+                producer.produce(topic=event['topic'], value=event['value'], key=event['key'],
+                                 on_delivery=_delivery_callback(delivered, event_id))
+            # The number of messages still queued, flush() doesn't raise on failed deliveries
+            queued = producer.flush(lock_timeout)
+            if delivered:
+                redis_conn.xdel(ENGAGEMENT_EVENTS, *delivered)
+            forwarded += len(delivered)
+            # Undelivered events would be read again right away, leave them to the next run
+            if queued or len(delivered) < len(events) or len(events) < batch_size:
+                break
+    finally:
+        release_lock(redis_conn, ENGAGEMENT_FORWARD_LOCK, lock_token)
+    return forwarded
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Feeds are pushed and pulled. A new recipe or activity is added to the feeds
+of its author's contacts and followers: recipients are streamed from their
+sets with SSCAN in bounded chunks, and a chunk is applied by a script which
+adds the item to, and trims, many feeds per call. Sets hold integer user
+ids, which are translated to the user ids feeds are named by per chunk.
+
+Public posts also go to the author's timeline. Once an author has
+CELEBRITY_FOLLOWERS followers their posts are no longer pushed to followers,
+who merge the timelines of the celebrities they follow into their feed
+when reading it instead, so posting costs the same whatever the audience.
+Public recipes are merged in on read as well. A page is listed by a script
+over the user's feeds and one over public recipes, sent in one pipeline,
+continues from a cursor and is filled in from the concise view cache, which
+reads the views it misses in one more round trip. Rebuilding an expired
+pulled feed costs two more.
+
+On a redis cluster feeds are in different slots, so fan-out and the pulled
+feed merge use plain pipelines, which the cluster client sends per node,
+instead of scripts and ZUNIONSTORE across slots.
+"""
+from __future__ import absolute_import
+from uggipuggi.constants import USER_FEED, USER_TIMELINE, CELEBRITIES, CONTACTS, PUBLIC_RECIPES,\
+                                MAX_USER_FEED_LENGTH, MAX_USER_FEED_LOAD, FANOUT_CHUNK_SIZE,\
+                                FANOUT_SCRIPT_BATCH, CELEBRITY_FOLLOWERS, MAX_PULLED_TIMELINES,\
+                                PULLED_FEED_TTL
+from uggipuggi.helpers.keys import is_cluster, following_key, followers_key, pulled_feed_key
+from uggipuggi.services.concise_cache import get_concise_views
+from uggipuggi.services.user_ids import to_user_ids, require_uid
+
+# Member of every cached pulled feed, so that following no celebrity is cached too
+_EMPTY_MARKER = ''
+
+# KEYS: feeds, ARGV: score, item, feed length
+_FANOUT_SCRIPT = """
+local trim = -tonumber(ARGV[3]) - 1
+for i = 1, #KEYS do
+    redis.call('ZADD', KEYS[i], ARGV[1], ARGV[2])
+    redis.call('ZREMRANGEBYRANK', KEYS[i], 0, trim)
+end
+return #KEYS
+"""
+
+
+def recipient_chunks(redis_conn, set_keys, chunk_size=FANOUT_CHUNK_SIZE):
+    """
+    Lists of at most chunk_size recipients from the union of set_keys, read
+    without loading any set whole. Someone both a contact and a follower, or
+    returned twice by SSCAN, may end up in two chunks: adding the same item
+    with the same score twice leaves the feed unchanged.
+    """
+    chunk = []
+    seen = set()
+    for set_key in set_keys:
+        for recipient in redis_conn.sscan_iter(set_key, count=chunk_size):
+            if recipient in seen:
+                continue
+            seen.add(recipient)
+            chunk.append(recipient)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+                seen = set()
+    if chunk:
+        yield chunk
+
+
+def fan_out(redis_conn, recipients, item, score, feed_length=MAX_USER_FEED_LENGTH,
+            batch_size=FANOUT_SCRIPT_BATCH):
+    # Recipients are integer user ids, each script call blocks redis while it runs,
+    # batch_size bounds it
+    script = redis_conn.register_script(_FANOUT_SCRIPT)
+    cluster = is_cluster(redis_conn)
+    updated = 0
+    user_ids = [user_id for user_id in to_user_ids(redis_conn, recipients) if user_id is not None]
+    for start in range(0, len(user_ids), batch_size):
+        feeds = [USER_FEED + user_id for user_id in user_ids[start:start + batch_size]]
+        if cluster:
+            pipeline = redis_conn.pipeline(False)
+            for feed in feeds:
+                pipeline.zadd(feed, {item: score})
+                pipeline.zremrangebyrank(feed, 0, -feed_length - 1)
+            pipeline.execute()
+            updated += len(feeds)
+        else:
+            updated += script(keys=feeds, args=[score, item, feed_length])
+    return updated
+
+
+def update_celebrity(redis_conn, user_id):
+    # Checked when the author posts, returns whether followers pull the post
+    uid = require_uid(redis_conn, user_id)
+    if redis_conn.scard(followers_key(user_id)) >= CELEBRITY_FOLLOWERS:
+        redis_conn.sadd(CELEBRITIES, uid)
+        return True
+    redis_conn.srem(CELEBRITIES, uid)
+    return False
+
+
+def push_sets(user_id, public, celebrity):
+    # Sets of user ids whose feed gets the author's new post pushed to it
+    if public and not celebrity:
+        return [CONTACTS + user_id, followers_key(user_id)]
+    return [CONTACTS + user_id]
+
+
+def add_to_timeline(pipeline, user_id, item, score):
+    pipeline.zadd(USER_TIMELINE + user_id, {item: score})
+    pipeline.zremrangebyrank(USER_TIMELINE + user_id, 0, -MAX_USER_FEED_LENGTH - 1)
+
+
+def _merge_timelines(redis_conn, timelines):
+    # ZUNIONSTORE ... AGGREGATE MAX and the trim, done here as timelines are on many nodes
+    pipeline = redis_conn.pipeline(False)
+    for timeline in timelines:
+        pipeline.zrevrange(timeline, 0, MAX_USER_FEED_LENGTH - 1, withscores=True)
+    merged = {}
+    for timeline_items in pipeline.execute():
+        for item, score in timeline_items:
+            merged[item] = max(score, merged.get(item, score))
+    newest = sorted(merged.items(), key=lambda item_score: item_score[1], reverse=True)
+    return dict(newest[:MAX_USER_FEED_LENGTH])
+
+
+def build_pulled_feed(redis_conn, user_id):
+    """
+    Caches the union of the timelines of the celebrities the user follows
+    for PULLED_FEED_TTL seconds, a celebrity's post reaches followers' feeds
+    at most that much later.
+    """
+    pulled_feed_id = pulled_feed_key(user_id)
+    celebrities = sorted(redis_conn.sinter(following_key(user_id), CELEBRITIES), key=int)
+    timelines = [USER_TIMELINE + celebrity for celebrity in
+                 to_user_ids(redis_conn, celebrities[:MAX_PULLED_TIMELINES]) if celebrity is not None]
+    if timelines and is_cluster(redis_conn):
+        merged = _merge_timelines(redis_conn, timelines)
+        pipeline = redis_conn.pipeline(False)
+        pipeline.delete(pulled_feed_id)
+        if merged:
+            pipeline.zadd(pulled_feed_id, merged)
+    else:
+        pipeline = redis_conn.pipeline(False)
+        if timelines:
+            pipeline.zunionstore(pulled_feed_id, timelines, aggregate='MAX')
+            pipeline.zremrangebyrank(pulled_feed_id, 0, -MAX_USER_FEED_LENGTH - 1)
+    pipeline.zadd(pulled_feed_id, {_EMPTY_MARKER: float('-inf')})
+    pipeline.expire(pulled_feed_id, PULLED_FEED_TTL)
+    pipeline.execute()
+
+
+# Reads one page of sorted sets of one slot merged newest first.
+# KEYS: pushed feed and pulled feed, or public recipes
+# ARGV: score of the previous page's last item ('+inf' for the first page), that
+#       item ('' for the first page), page size
+# Returns {} when the pulled feed needs building, else 1 followed by item, score pairs
+_FEED_PAGE_SCRIPT = """
+if #KEYS > 1 and redis.call('EXISTS', KEYS[2]) == 0 then
+    return {}
+end
+local max_score, last, limit = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local cursor_score = tonumber(max_score)
+local candidates = {}
+for _, key in ipairs(KEYS) do
+    local found, offset = 0, 0
+    while found < limit do
+        local batch = redis.call('ZREVRANGEBYSCORE', key, max_score, '-inf',
+                                 'WITHSCORES', 'LIMIT', offset, limit)
+        if #batch == 0 then
+            break
+        end
+        for i = 1, #batch, 2 do
+            local item, score = batch[i], batch[i + 1]
+            local seen = tonumber(score) == cursor_score and last ~= '' and item >= last
+            if item ~= '' and not seen then
+                candidates[#candidates + 1] = {item, score}
+                found = found + 1
+            end
+        end
+        offset = offset + #batch / 2
+    end
+end
+table.sort(candidates, function(a, b)
+    local score_a, score_b = tonumber(a[2]), tonumber(b[2])
+    if score_a ~= score_b then
+        return score_a > score_b
+    end
+    return a[1] > b[1]
+end)
+local page, added = {1}, {}
+for _, candidate in ipairs(candidates) do
+    if #page > 2 * limit then
+        break
+    end
+    if not added[candidate[1]] then
+        added[candidate[1]] = true
+        page[#page + 1] = candidate[1]
+        page[#page + 1] = candidate[2]
+    end
+end
+return page
+"""
+
+
+def _merge_pages(pairs, limit):
+    # Item, score pairs of pages read separately, in the order the script sorts them
+    candidates = sorted(zip(pairs[::2], pairs[1::2]),
+                        key=lambda item_score: (float(item_score[1]), item_score[0]), reverse=True)
+    items, scores, added = [], [], set()
+    for item, score in candidates:
+        if len(items) == limit:
+            break
+        if item not in added:
+            added.add(item)
+            items.append(item)
+            scores.append(score)
+    return items, scores
+
+
+def encode_cursor(item, score):
+    return '%s:%s' % (score, item)
+
+
+def decode_cursor(cursor):
+    # Raises ValueError when the cursor wasn't made by encode_cursor
+    score, item = cursor.split(':', 1)
+    float(score)
+    return score, item
+
+
+def read_feed(redis_conn, user_id, cursor=None, limit=MAX_USER_FEED_LOAD):
+    """
+    A page of the user's feed, newest first: items pushed to their feed, on
+    the timelines of celebrities they follow and public recipes, each once.
+    The cursor of the last item of a page gets the next one, which new posts
+    don't shift. Returns (item, decoded concise view) pairs and the next
+    cursor, None after the last page.
+    """
+    max_score, last = decode_cursor(cursor) if cursor else ('+inf', '')
+    script = redis_conn.register_script(_FEED_PAGE_SCRIPT)
+    # The user's feeds share a slot, public recipes are anywhere
+    keys, args = [USER_FEED + user_id, pulled_feed_key(user_id)], [max_score, last, limit]
+    if is_cluster(redis_conn):
+        page = script(keys=keys, args=args)
+        public = script(keys=[PUBLIC_RECIPES], args=args)
+    else:
+        pipeline = redis_conn.pipeline(False)
+        script(keys=keys, args=args, client=pipeline)
+        script(keys=[PUBLIC_RECIPES], args=args, client=pipeline)
+        page, public = pipeline.execute()
+    if not page:
+        build_pulled_feed(redis_conn, user_id)
+        page = script(keys=keys, args=args)
+    page += public[1:]
+    items, scores = _merge_pages(page[1:], limit)
+    next_cursor = encode_cursor(items[-1], scores[-1]) if len(items) == limit else None
+    views = get_concise_views(redis_conn, items)
+    # Items deleted since they were added to a feed come back empty
+    return [(item, views[item]) for item in items if views[item]], next_cursor
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Follow graph mutations. A follow changes two users: the follower's
+following set and num_following, and the followee's followers set and
+num_followers. Each side is one script call on that user's slot, the set
+and count always change together, and all sides are sent in one pipeline
+however many accounts are followed at once. On a single node the pipeline
+is a MULTI/EXEC transaction, so a follow is applied whole or not at all.
+On a redis cluster the sides are in different slots and run one by one;
+following is idempotent, so a side whose call failed there is fixed by
+doing the same request again. Sets hold integer user ids, users without
+one don't exist and are left out.
+"""
+from __future__ import absolute_import
+from uggipuggi.constants import USER
+from uggipuggi.helpers.concise_view import USER_VIEW
+from uggipuggi.helpers.keys import following_key, followers_key, is_cluster
+from uggipuggi.services.user_ids import to_uids, require_uid
+
+# KEYS: a user's following or followers set, the user's concise view, in one slot
+# ARGV: '1' to add or '0' to remove, count field, integer user ids
+# Returns the number of ids added or removed and the count after it
+_FOLLOW_SCRIPT = """
+local command = ARGV[1] == '1' and 'SADD' or 'SREM'
+local changed = 0
+for i = 3, #ARGV do
+    changed = changed + redis.call(command, KEYS[1], ARGV[i])
+end
+local count = redis.call('SCARD', KEYS[1])
+redis.call('HSET', KEYS[2], ARGV[2], count)
+return {changed, count}
+"""
+
+
+def public_profiles(redis_conn, user_ids):
+    # From the cached concise views, a user without one can't be followed
+    pipeline = redis_conn.pipeline(False)
+    for user_id in user_ids:
+        pipeline.hget(USER + user_id, 'public_profile')
+    return [bool(USER_VIEW.decode_field('public_profile', value)) for value in pipeline.execute()]
+
+
+def _with_uids(redis_conn, user_ids):
+    # (user id, integer id) of the users that have one
+    user_ids = list(user_ids)
+    return [(user_id, uid) for user_id, uid in zip(user_ids, to_uids(redis_conn, user_ids))
+            if uid is not None]
+
+
+def _set_follows(redis_conn, add, follower_ids, followee_ids):
+    # Every follower follows (or stops following) every followee, one of the lists has one id
+    followers = _with_uids(redis_conn, follower_ids)
+    followees = _with_uids(redis_conn, followee_ids)
+    script = redis_conn.register_script(_FOLLOW_SCRIPT)
+    pipeline = redis_conn.pipeline(not is_cluster(redis_conn))
+    for follower_id, _ in followers:
+        script(keys=[following_key(follower_id), USER + follower_id],
+               args=[int(add), 'num_following'] + [uid for _, uid in followees], client=pipeline)
+    for followee_id, _ in followees:
+        script(keys=[followers_key(followee_id), USER + followee_id],
+               args=[int(add), 'num_followers'] + [uid for _, uid in followers], client=pipeline)
+    return pipeline.execute()
+
+
+def follow(redis_conn, user_id, followee_ids, add=True):
+    """
+    The user follows, or with add=False unfollows, the followees. Public
+    profiles aren't checked here. Returns the number of followees added or
+    removed and the user's num_following.
+    """
+    if not followee_ids:
+        return 0, redis_conn.scard(following_key(user_id))
+    require_uid(redis_conn, user_id)
+    changed, num_following = _set_follows(redis_conn, add, [user_id], followee_ids)[0]
+    return changed, num_following
+
+
+def remove_followers(redis_conn, user_id, follower_ids):
+    # The followers stop following the user, returns the user's num_followers
+    if not follower_ids:
+        return redis_conn.scard(followers_key(user_id))
+    require_uid(redis_conn, user_id)
+    return _set_follows(redis_conn, False, follower_ids, [user_id])[-1][1]
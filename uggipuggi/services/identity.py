@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from uggipuggi.models.user import Role
+from uggipuggi.services.user import get_user
+from uggipuggi.helpers.cache import TTLCache
+from uggipuggi.helpers.logs_metrics import init_statsd
+from uggipuggi.services.invalidation import invalidation_bus
+from uggipuggi.constants import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL,\
+                                IDENTITY_INVALIDATION_CHANNEL
+
+statsd = init_statsd('up.services.identity')
+
+
+class Identity(object):
+    # The part of a user the auth middleware and controllers need on every request
+    __slots__ = ('user_id', 'role', 'phone_last_verified')
+
+    def __init__(self, user_id, role=Role.USER, phone_last_verified=None):
+        self.user_id = user_id
+        self.role = role
+        self.phone_last_verified = phone_last_verified
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(str(user.id), user.role, user.phone_last_verified)
+
+    def role_satisfy(self, role):
+        return self.role >= role
+
+
+identity_cache = TTLCache(maxsize=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
+invalidation_bus.subscribe(IDENTITY_INVALIDATION_CHANNEL, identity_cache.pop)
+
+
+def get_identity(user_id, get_user=get_user):
+    invalidation_bus.ensure_started()
+    identity = identity_cache.get(user_id)
+    if identity is not None:
+        statsd.incr('identity_cache.hit')
+        return identity
+    statsd.incr('identity_cache.miss')
+    user = get_user('id', user_id)
+    if user is None:
+        return None
+    identity = Identity.from_user(user)
+    identity_cache.set(user_id, identity)
+    return identity
+
+
+def invalidate_identity(user_id, redis_conn=None):
+    # Drop locally straight away, other workers get it via pub/sub
+    identity_cache.pop(user_id)
+    invalidation_bus.publish(IDENTITY_INVALIDATION_CHANNEL, user_id, redis_conn)
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from uggipuggi.helpers.cache import InvalidationBus
+from uggipuggi.controllers.hooks import get_redis_conn
+
+# One pub/sub listener per worker process shared by all in-process caches
+invalidation_bus = InvalidationBus(get_redis_conn)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Phone number to user id directory. Instead of a top level key per user,
+numbers are spread over PHONE_DIRECTORY_BUCKETS hashes, 'pdir:<bucket>',
+by the number modulo the bucket count, and the field is the number divided
+by it. Small hashes are stored as ziplists and integer fields as integers,
+so an entry takes a fraction of the memory of a key, see
+tests/benchmarks/bench_phone_directory.py.
+"""
+from __future__ import absolute_import
+from itertools import islice
+from uggipuggi.constants import PHONE_DIRECTORY, PHONE_DIRECTORY_BUCKETS,\
+                                PHONE_DIRECTORY_LEGACY_LOOKUP, CONTACTS_CHUNK_SIZE
+
+
+def _digits(phone):
+    # Numbers are registered as 00<country code><number>, and E.164 is +<country code><number>
+    if phone.startswith('+'):
+        return phone[1:]
+    if phone.startswith('00'):
+        return phone[2:]
+    return phone
+
+
+def legacy_key(phone):
+    # The key that held the user id before the directory
+    return '00' + _digits(phone)
+
+
+def directory_entry(phone, buckets=PHONE_DIRECTORY_BUCKETS):
+    # The hash and field of a number
+    number = int(_digits(phone))
+    return PHONE_DIRECTORY + str(number % buckets), str(number // buckets)
+
+
+def set_phone(pipeline, phone, user_id):
+    pipeline.hset(*(directory_entry(phone) + (user_id,)))
+
+
+def lookup_phones(redis_conn, phones, chunk_size=CONTACTS_CHUNK_SIZE,
+                  legacy_lookup=PHONE_DIRECTORY_LEGACY_LOOKUP):
+    """
+    User ids of the numbers, in their order, None for numbers no user has
+    or that aren't numbers. One pipeline per chunk_size numbers.
+    """
+    phones = iter(phones)
+    user_ids = []
+    for chunk in iter(lambda: list(islice(phones, chunk_size)), []):
+        pipeline = redis_conn.pipeline(False)
+        valid = []
+        for phone in chunk:
+            try:
+                entry = directory_entry(phone)
+            except ValueError:
+                valid.append(False)
+                continue
+            valid.append(True)
+            pipeline.hget(*entry)
+            if legacy_lookup:
+                pipeline.get(legacy_key(phone))
+        found = iter(pipeline.execute())
+        for is_valid in valid:
+            user_id = next(found) if is_valid else None
+            if is_valid and legacy_lookup:
+                # Read even on a hit, it's the next result otherwise
+                legacy = next(found)
+                user_id = user_id or legacy
+            user_ids.append(user_id)
+    return user_ids
+
+
+def migrate_legacy_phones(redis_conn, batch_size=CONTACTS_CHUNK_SIZE):
+    """
+    Moves the top level keys of numbers to the directory, safe to run while
+    serving and to run again. Returns the number of numbers moved.
+    """
+    moved = 0
+    keys = redis_conn.scan_iter(match='00[1-9]*', count=batch_size)
+    for batch in iter(lambda: list(islice(keys, batch_size)), []):
+        phones = [key for key in batch if key.isdigit()]
+        if not phones:
+            continue
+        pipeline = redis_conn.pipeline(False)
+        for phone in phones:
+            pipeline.get(phone)
+        user_ids = pipeline.execute()
+        for phone, user_id in zip(phones, user_ids):
+            if user_id is not None:
+                # Set since, e.g. by verifying again, is newer
+                pipeline.hsetnx(*(directory_entry(phone) + (user_id,)))
+                moved += 1
+        # One key per DEL, the numbers are in different slots of a cluster
+        for phone in phones:
+            pipeline.delete(phone)
+        pipeline.execute()
+    return moved
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Dense integer ids of users. Sets of users in redis, i.e. contacts,
+followers, following, group members, celebrities and who liked or saved
+an item, hold these instead of 24 character ObjectId strings: a set of
+integers is kept as an intset, a few bytes a member, while it's small, and
+the ids are short strings beyond that. Keys are still named by ObjectId,
+ids are translated where members come in and go out.
+
+An id is allocated from a sequence in mongo when a user verifies their
+phone and never changes, so both directions are cached per worker without
+invalidation. In redis, the id is the 'uid' field of the user's concise
+view, and ids map back in hashes of UID_BUCKET_SIZE ids.
+"""
+from __future__ import absolute_import
+from itertools import islice
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from uggipuggi.constants import USER, USER_UIDS, UID_BUCKET_SIZE, USER_ID_CACHE_SIZE,\
+                                USER_ID_CACHE_TTL, CONTACTS, FOLLOWING, FOLLOWERS, GROUP_MEMBERS,\
+                                RECIPE_LIKED, ACTIVITY_LIKED, RECIPE_SAVED, CELEBRITIES
+from uggipuggi.helpers.cache import TTLCache
+from uggipuggi.helpers.logs_metrics import init_statsd
+from uggipuggi.models.user import User
+
+statsd = init_statsd('up.services.user_ids')
+
+UID_SEQUENCE = 'user_uid'
+
+# user id -> uid and back
+uid_cache = TTLCache(maxsize=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+user_id_cache = TTLCache(maxsize=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+
+
+def _uid_entry(uid):
+    # The hash and field mapping the uid back
+    return USER_UIDS + str(uid // UID_BUCKET_SIZE), str(uid % UID_BUCKET_SIZE)
+
+
+def cache_uid(pipeline, user_id, uid):
+    pipeline.hset(USER + user_id, 'uid', uid)
+    pipeline.hset(*(_uid_entry(uid) + (user_id,)))
+
+
+def next_uids(count=1):
+    # The last of count new ids, the sequence is in mongo so a flushed redis can't reuse ids
+    counters = User._get_db()['counters']
+    return counters.find_one_and_update({'_id': UID_SEQUENCE}, {'$inc': {'seq': count}},
+                                        upsert=True, return_document=ReturnDocument.AFTER)['seq']
+
+
+def allocate_uid(redis_conn, user):
+    # Idempotent, concurrent verifications of a user end up with the same id
+    if user.uid is None:
+        User.objects(id=user.id, uid=None).update_one(set__uid=next_uids())
+        user.reload('uid')
+    pipeline = redis_conn.pipeline(False)
+    cache_uid(pipeline, str(user.id), user.uid)
+    pipeline.execute()
+    return user.uid
+
+
+def _load_uids(redis_conn, user_ids):
+    pipeline = redis_conn.pipeline(False)
+    for user_id in user_ids:
+        pipeline.hget(USER + user_id, 'uid')
+    uids = [int(uid) if uid is not None else None for uid in pipeline.execute()]
+    missing = [user_id for user_id, uid in zip(user_ids, uids) if uid is None and ObjectId.is_valid(user_id)]
+    if not missing:
+        return uids
+    # Not in redis, e.g. after a flush
+    statsd.incr('user_ids.mongo', len(missing))
+    found = {str(user.id): user.uid for user in User.objects(id__in=missing, uid__ne=None).only('uid')}
+    if found:
+        pipeline = redis_conn.pipeline(False)
+        for user_id, uid in found.items():
+            cache_uid(pipeline, user_id, uid)
+        pipeline.execute()
+    return [uid if uid is not None else found.get(user_id) for user_id, uid in zip(user_ids, uids)]
+
+
+def _load_user_ids(redis_conn, uids):
+    pipeline = redis_conn.pipeline(False)
+    for uid in uids:
+        pipeline.hget(*_uid_entry(uid))
+    user_ids = pipeline.execute()
+    missing = [uid for uid, user_id in zip(uids, user_ids) if user_id is None]
+    if not missing:
+        return user_ids
+    statsd.incr('user_ids.mongo', len(missing))
+    found = {user.uid: str(user.id) for user in User.objects(uid__in=missing).only('uid')}
+    if found:
+        pipeline = redis_conn.pipeline(False)
+        for uid, user_id in found.items():
+            cache_uid(pipeline, user_id, uid)
+        pipeline.execute()
+    return [user_id if user_id is not None else found.get(uid) for uid, user_id in zip(uids, user_ids)]
+
+
+def _translate(values, cache, reverse_cache, load):
+    mapped = {}
+    missing = []
+    for value in values:
+        cached = cache.get(value)
+        if cached is not None:
+            mapped[value] = cached
+        elif value not in mapped:
+            mapped[value] = None
+            missing.append(value)
+    statsd.incr('user_ids_cache.hit', len(values) - len(missing))
+    statsd.incr('user_ids_cache.miss', len(missing))
+    if missing:
+        for value, result in zip(missing, load(missing)):
+            if result is not None:
+                mapped[value] = result
+                cache.set(value, result)
+                reverse_cache.set(result, value)
+    return [mapped[value] for value in values]
+
+
+def to_uids(redis_conn, user_ids):
+    # Integer ids of the users, in order, None for users without one
+    return _translate(list(user_ids), uid_cache, user_id_cache,
+                      lambda missing: _load_uids(redis_conn, missing))
+
+
+def to_user_ids(redis_conn, uids):
+    # User ids of the integer ids, which may be set members read as strings
+    return _translate([int(uid) for uid in uids], user_id_cache, uid_cache,
+                      lambda missing: _load_user_ids(redis_conn, missing))
+
+
+def require_uid(redis_conn, user_id):
+    # The acting user's id, allocated if they verified before ids were
+    uid = to_uids(redis_conn, [user_id])[0]
+    if uid is None:
+        uid = allocate_uid(redis_conn, User.objects.get(id=user_id))
+    return uid
+
+
+# Sets whose members are users
+USER_SETS = (CONTACTS + '*', FOLLOWING + '{*', FOLLOWERS + '{*', GROUP_MEMBERS + '*',
+             RECIPE_LIKED + '{*', ACTIVITY_LIKED + '{*', RECIPE_SAVED + '{*', CELEBRITIES)
+
+
+def number_users(redis_conn, batch_size=1000):
+    # Allocates ids for all users without one, oldest first, and caches every user's id
+    numbered = 0
+    collection = User._get_collection()
+    users = collection.find({'uid': None}, {'_id': 1}).sort('_id', 1)
+    for batch in iter(lambda: list(islice(users, batch_size)), []):
+        last = next_uids(len(batch))
+        updates = [UpdateOne({'_id': user['_id'], 'uid': None}, {'$set': {'uid': uid}})
+                   for user, uid in zip(batch, range(last - len(batch) + 1, last + 1))]
+        numbered += collection.bulk_write(updates, ordered=False).modified_count
+    users = collection.find({'uid': {'$ne': None}}, {'uid': 1})
+    for batch in iter(lambda: list(islice(users, batch_size)), []):
+        pipeline = redis_conn.pipeline(False)
+        for user in batch:
+            cache_uid(pipeline, str(user['_id']), user['uid'])
+        pipeline.execute()
+    return numbered
+
+
+def migrate_user_sets(redis_conn, batch_size=1000):
+    """
+    Replaces the ObjectId members of all sets of users by integer ids, after
+    number_users(). Run with the app stopped: a like or follow meanwhile
+    could be counted twice. Members of users who no longer exist are
+    dropped. Safe to run again. Returns the number of members replaced.
+    """
+    replaced = 0
+    for match in USER_SETS:
+        for key in redis_conn.scan_iter(match=match, count=batch_size):
+            if redis_conn.type(key) != 'set':
+                continue
+            members = redis_conn.sscan_iter(key, count=batch_size)
+            # Members are read in full first, SSCAN may miss members added while it runs
+            # An ObjectId can be all digits, a uid is never 24 of them
+            old = [member for member in members if len(member) == 24 or not member.isdigit()]
+            for start in range(0, len(old), batch_size):
+                batch = old[start:start + batch_size]
+                uids = [uid for uid in to_uids(redis_conn, batch) if uid is not None]
+                pipeline = redis_conn.pipeline(False)
+                if uids:
+                    pipeline.sadd(key, *uids)
+                pipeline.srem(key, *batch)
+                pipeline.execute()
+                replaced += len(uids)
+    return replaced
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Paged lists of the users in a set, i.e. followers, following and contacts.
+A page is one SSCAN call, so a set of any size is read without blocking
+redis. Its integer ids are mapped back to user ids, mostly from the worker's
+cache, and, to hydrate the page, the users' concise views are read with one
+pipeline. The user hashes are only known once the set is scanned, so they
+can't be declared to a script, and are in other slots than the set on a
+redis cluster.
+"""
+from __future__ import absolute_import
+from uggipuggi.constants import USER, MAX_USER_LIST_LOAD, USER_LIST_VIEW_FIELDS
+from uggipuggi.helpers.concise_view import USER_VIEW
+from uggipuggi.services.user_ids import to_user_ids
+
+
+def _read_views(redis_conn, user_ids, fields):
+    pipeline = redis_conn.pipeline(False)
+    for user_id in user_ids:
+        pipeline.hmget(USER + user_id, fields)
+    return pipeline.execute()
+
+
+def list_users(redis_conn, set_key, cursor=None, count=MAX_USER_LIST_LOAD, hydrate=False):
+    """
+    A page of the users in the set: their user ids or, hydrated, their
+    concise views with their id, and the cursor of the next page, None after
+    the last. count is a hint, SSCAN may return fewer or, for a small set,
+    all of it, and a user may be on two pages if the set changed meanwhile.
+    Raises ValueError when the cursor isn't one SSCAN returned.
+    """
+    cursor = int(cursor or 0)
+    if cursor < 0:
+        raise ValueError(cursor)
+    next_cursor, uids = redis_conn.sscan(set_key, cursor, count=count)
+    user_ids = to_user_ids(redis_conn, uids)
+    # Users deleted since they were added aren't listed
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+    next_cursor = None if int(next_cursor) == 0 else str(next_cursor)
+    if not hydrate:
+        return user_ids, next_cursor
+    fields = list(USER_LIST_VIEW_FIELDS)
+    return [dict(zip(fields, USER_VIEW.decode_values(fields, values)), id=user_id)
+            for user_id, values in zip(user_ids, _read_views(redis_conn, user_ids, fields))], next_cursor
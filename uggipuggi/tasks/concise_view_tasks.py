@@ -0,0 +1,21 @@
+from celery.utils.log import get_task_logger
+
+from uggipuggi.celery.celery import celery
+from uggipuggi.helpers.logs_metrics import init_statsd
+from uggipuggi.helpers.concise_view import CONCISE_VIEWS, migrate
+from uggipuggi.controllers.hooks import get_redis_conn
+
+logger = get_task_logger(__name__)
+statsd = init_statsd('up.tasks.concise_view_tasks')
+
+
+@celery.task
+@statsd.timer('migrate_concise_views')
+def migrate_concise_views():
+    # Safe to run while serving and to run again, hashes already migrated are skipped:
+    # celery call uggipuggi.tasks.concise_view_tasks.migrate_concise_views
+    redis_conn = get_redis_conn()
+    for view in CONCISE_VIEWS:
+        migrated = migrate(redis_conn, view)
+        statsd.incr('migrate_concise_views.migrated', migrated)
+        logger.info('Migrated %d concise view hashes %s*' % (migrated, view.prefix))
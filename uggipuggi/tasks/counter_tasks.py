@@ -0,0 +1,27 @@
+from celery.utils.log import get_task_logger
+
+from uggipuggi.celery.celery import celery
+from uggipuggi.constants import RECIPE, ACTIVITY
+from uggipuggi.helpers.logs_metrics import init_statsd
+from uggipuggi.services.counters import flush
+from uggipuggi.services.db_service import get_mongodb_connection
+from uggipuggi.controllers.hooks import get_redis_conn
+
+logger = get_task_logger(__name__)
+statsd = init_statsd('up.tasks.counter_tasks')
+
+
+@celery.task
+@statsd.timer('flush_counters')
+def flush_counters():
+    # Run every COUNTER_FLUSH_INTERVAL seconds by celery beat, see conf/celeryconfig.py
+    redis_conn = get_redis_conn()
+    get_mongodb_connection()
+    for prefix in (RECIPE, ACTIVITY):
+        updated, lag = flush(redis_conn, prefix)
+        if lag is None:
+            continue
+        # How long the oldest count in the batch waited to reach mongo
+        statsd.timing('flush_counters.lag.' + prefix[:-1], int(lag * 1000))
+        statsd.incr('flush_counters.updated.' + prefix[:-1], updated)
+        logger.info('Flushed counters of %d documents %s*, lag %.1fs' % (updated, prefix, lag))
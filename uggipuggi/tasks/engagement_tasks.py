@@ -0,0 +1,31 @@
+from celery.utils.log import get_task_logger
+
+from uggipuggi.celery.celery import celery
+from uggipuggi.helpers.logs_metrics import init_statsd
+from uggipuggi.services.connections import connections
+from uggipuggi.services.engagement import backfill_liked, forward_events
+from uggipuggi.controllers.hooks import get_redis_conn
+
+logger = get_task_logger(__name__)
+statsd = init_statsd('up.tasks.engagement_tasks')
+
+
+@celery.task
+@statsd.timer('backfill_liked')
+def backfill_user_liked():
+    # Run once after deploying the per user liked sets, safe to run again:
+    # celery call uggipuggi.tasks.engagement_tasks.backfill_user_liked
+    copied = backfill_liked(get_redis_conn())
+    statsd.incr('backfill_liked.copied', copied)
+    logger.info('Copied %d likes to the per user liked sets' % copied)
+
+
+@celery.task
+@statsd.timer('forward_events')
+def forward_engagement_events():
+    # Run every ENGAGEMENT_FORWARD_INTERVAL seconds by celery beat, see conf/celeryconfig.py
+    forwarded = forward_events(get_redis_conn(), connections.kafka_producer)
+    if forwarded is None:
+        logger.info('Engagement events already being forwarded')
+        return
+    statsd.incr('forward_events.forwarded', forwarded)
@@ -0,0 +1,55 @@
+from celery.utils.log import get_task_logger
+
+from uggipuggi.celery.celery import celery
+from uggipuggi.helpers.logs_metrics import init_statsd
+from uggipuggi.helpers.keys import migrate_legacy_keys
+from uggipuggi.services.contacts import index_pending_numbers
+from uggipuggi.services.phone_directory import migrate_legacy_phones
+from uggipuggi.services.user_ids import number_users, migrate_user_sets
+from uggipuggi.controllers.hooks import get_redis_conn
+
+logger = get_task_logger(__name__)
+statsd = init_statsd('up.tasks.key_tasks')
+
+
+@celery.task
+@statsd.timer('migrate_legacy_keys')
+def migrate_cluster_keys():
+    # Run once after deploying the hash tagged key names, before backfill_user_liked:
+    # celery call uggipuggi.tasks.key_tasks.migrate_cluster_keys
+    moved = migrate_legacy_keys(get_redis_conn())
+    statsd.incr('migrate_legacy_keys.moved', moved)
+    logger.info('Moved %d keys to their hash tagged names' % moved)
+
+
+@celery.task
+@statsd.timer('migrate_legacy_phones')
+def migrate_phone_directory():
+    # Run once after deploying the phone directory, then set PHONE_DIRECTORY_LEGACY_LOOKUP
+    # to False: celery call uggipuggi.tasks.key_tasks.migrate_phone_directory
+    moved = migrate_legacy_phones(get_redis_conn())
+    statsd.incr('migrate_legacy_phones.moved', moved)
+    logger.info('Moved %d phone numbers to the phone directory' % moved)
+
+
+@celery.task
+@statsd.timer('migrate_user_ids')
+def migrate_user_ids():
+    # Offline, with the app stopped, after migrate_cluster_keys:
+    # celery call uggipuggi.tasks.key_tasks.migrate_user_ids
+    redis_conn = get_redis_conn()
+    numbered = number_users(redis_conn)
+    replaced = migrate_user_sets(redis_conn)
+    statsd.incr('migrate_user_ids.numbered', numbered)
+    statsd.incr('migrate_user_ids.replaced', replaced)
+    logger.info('Allocated %d user ids, replaced %d set members by them' % (numbered, replaced))
+
+
+@celery.task
+@statsd.timer('index_pending_contacts')
+def index_pending_contacts():
+    # Run once after deploying the joined contacts index, after migrate_user_ids:
+    # celery call uggipuggi.tasks.key_tasks.index_pending_contacts
+    indexed = index_pending_numbers(get_redis_conn())
+    statsd.incr('index_pending_contacts.indexed', indexed)
+    logger.info('Indexed %d pending contact numbers' % indexed)
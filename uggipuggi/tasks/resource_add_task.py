@@ -1,6 +1,7 @@
 import os
 import sys
 import time
+from itertools import chain
 import falcon
 import requests
 from bson import json_util
@@ -15,17 +16,55 @@ from uggipuggi.models.recipe import Comment, Recipe
 from uggipuggi.models.cooking_activity import CookingActivity
 from uggipuggi.controllers.hooks import get_redis_conn
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
+from uggipuggi.helpers.concise_view import RECIPE_VIEW, ACTIVITY_VIEW
+from uggipuggi.services.concise_cache import invalidate_concise_view
+from uggipuggi.services.feed_fanout import recipient_chunks, fan_out, push_sets, update_celebrity,\
+                                            add_to_timeline
 
 from uggipuggi.services.db_service import get_mongodb_connection
 from uggipuggi.controllers.utils.gcloud_utils import upload_image_to_gcs
-from uggipuggi.constants import CONTACTS, FOLLOWERS, USER_FEED, USER_NOTIFICATION_FEED,\
-    RECIPE_COMMENTORS, RECIPE, ACTIVITY, USER, MAX_USER_FEED_LENGTH,\
+from uggipuggi.constants import USER_NOTIFICATION_FEED,\
+    RECIPE_COMMENTORS, RECIPE, ACTIVITY, USER,\
     GCS_RECIPE_BUCKET, GCS_ACTIVITY_BUCKET, GAE_IMG_SERVER, PUBLIC_RECIPES
 
 logger = get_task_logger(__name__)
 statsd = init_statsd('up.tasks.resource_add_task')
 
 
+def feed_fan_out(redis_conn, user_id, expose_level, item, score):
+    if int(expose_level) not in (ExposeLevel.FRIENDS, ExposeLevel.PUBLIC):
+        return
+    public = int(expose_level) == ExposeLevel.PUBLIC
+    celebrity = False
+    if public:
+        celebrity = update_celebrity(redis_conn, user_id)
+        pipeline = redis_conn.pipeline(False)
+        add_to_timeline(pipeline, user_id, item, score)
+        pipeline.execute()
+    # Small audiences are done right here, large ones are spread over workers
+    chunks = recipient_chunks(redis_conn, push_sets(user_id, public, celebrity))
+    first_chunk = next(chunks, [])
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+        statsd.incr('feed_fan_out.recipients', len(first_chunk))
+        fan_out(redis_conn, first_chunk, item, score)
+        return
+    num_chunks = 0
+    for chunk in chain([first_chunk, second_chunk], chunks):
+        user_feed_fan_out_chunk.delay(item, score, chunk)
+        num_chunks += 1
+    statsd.incr('feed_fan_out.chunks', num_chunks)
+    logger.info('Feed fan-out of %s queued in %d chunks' % (item, num_chunks))
+
+
+@celery.task
+@statsd.timer('user_feed_fan_out_chunk')
+def user_feed_fan_out_chunk(item, score, recipients):
+    redis_conn = get_redis_conn()
+    statsd.incr('feed_fan_out.recipients', len(recipients))
+    fan_out(redis_conn, recipients, item, score)
+
+
 @celery.task
 @statsd.timer('user_feed_add_recipe')
 def user_feed_add_recipe(message):
@@ -33,7 +72,7 @@ def user_feed_add_recipe(message):
     user_id, expose_level, recipe_id, status, recipe_imgs = json_util.loads(message.strip("'<>() ").replace('\'', '\"'))
 
     redis_conn = get_redis_conn()
-    pipeline = redis_conn.pipeline(True)
+    pipeline = redis_conn.pipeline(False)
     recipe_id_name = RECIPE + recipe_id
     img_urls = []
     for img_file in recipe_imgs:
@@ -43,18 +82,13 @@ def user_feed_add_recipe(message):
         else:
             logger.error('Image upload to cloud server failed with status code: %s' % status_code)
 
-    # Redis hmset can't store list, so convert list to string
-    pipeline.hmset(recipe_id_name, {'images': str(img_urls)})
-
-    # Get all contacts and followers userids
-    contacts_id_name = CONTACTS + user_id
+    pipeline.hmset(recipe_id_name, RECIPE_VIEW.encode({'images': img_urls}))
+    invalidate_concise_view(recipe_id_name, pipeline)
 
-    if int(expose_level) == ExposeLevel.FRIENDS:
-        recipients = redis_conn.smembers(contacts_id_name)
-    elif int(expose_level) == ExposeLevel.PUBLIC:
-        followers_id_name = FOLLOWERS + user_id
-        recipients = redis_conn.sunion(contacts_id_name, followers_id_name)
-        pipeline.zadd(PUBLIC_RECIPES, {recipe_id_name: int(time.time())})
+    # The public and the feed copies share a score, a page boundary can't split them
+    score = time.time()
+    if int(expose_level) == ExposeLevel.PUBLIC:
+        pipeline.zadd(PUBLIC_RECIPES, {recipe_id_name: score})
 
     # Add the author to recipe commentor list, so we can notify
     # him when others comments on this recipe
@@ -62,15 +96,8 @@ def user_feed_add_recipe(message):
     pipeline.sadd(recipe_commentors_id, user_id)
 
     logger.debug('################# I am executed in celery worker START ###################')
-    logger.debug(recipients)
-    for recipient in recipients:
-        # Use the count of this user feed bucket for notification
-        user_feed = USER_FEED + recipient
-        pipeline.zadd(user_feed, {recipe_id_name: time.time()})
-        # Remove old feed if the feed is bigger than MAX_USER_FEED_LENGTH posts
-        pipeline.zremrangebyrank(user_feed, 0, -MAX_USER_FEED_LENGTH + 1)
-        #logger.info(redis_conn.zrange(user_feed, 0, -1, withscores=True))
     pipeline.execute()
+    feed_fan_out(redis_conn, user_id, expose_level, recipe_id_name, score)
 
     mongo_conn = get_mongodb_connection()
     recipe = get_recipe(recipe_id)
@@ -90,7 +117,7 @@ def user_feed_put_comment(message):
     redis_conn = get_redis_conn()
     recipe_commentors_id = RECIPE_COMMENTORS + recipe_id
     recipients = redis_conn.smembers(recipe_commentors_id)
-    pipeline = redis_conn.pipeline(True)
+    pipeline = redis_conn.pipeline(False)
     # Add the current commentor, so we can notify him when others comments on this recipe
     pipeline.sadd(recipe_commentors_id, commenter_id)
     for recipient in recipients:
@@ -110,8 +137,7 @@ def user_feed_add_activity(message):
     user_id, expose_level, recipe_id, activity_id, status, activity_imgs = json_util.loads(message.strip("'<>() ").replace('\'', '\"'))
 
     redis_conn = get_redis_conn()
-    pipeline = redis_conn.pipeline(True)
-    # Get all contacts and followers userids
+    pipeline = redis_conn.pipeline(False)
     activity_id_name = ACTIVITY + activity_id
 
     img_urls = []
@@ -122,23 +148,10 @@ def user_feed_add_activity(message):
         else:
             logger.error('Image upload to cloud server failed with status code: %s' % status_code)
 
-    # Redis hmset can't store list, so convert list to string
-    pipeline.hmset(activity_id_name, {'images': str(img_urls)})
-    contacts_id_name = CONTACTS + user_id
-
-    if int(expose_level) == ExposeLevel.FRIENDS:
-        recipients = redis_conn.smembers(contacts_id_name)
-    elif int(expose_level) == ExposeLevel.PUBLIC:
-        followers_id_name = FOLLOWERS + user_id
-        recipients = redis_conn.sunion(contacts_id_name, followers_id_name)
-
-    for recipient in recipients:
-        # Use the count of this user feed bucket for notification
-        user_feed = USER_FEED + recipient
-        pipeline.zadd(user_feed, {activity_id_name: time.time()})
-        # Remove old feed if the feed is bigger than MAX_USER_FEED_LENGTH posts
-        pipeline.zremrangebyrank(user_feed, 0, -MAX_USER_FEED_LENGTH + 1)
+    pipeline.hmset(activity_id_name, ACTIVITY_VIEW.encode({'images': img_urls}))
+    invalidate_concise_view(activity_id_name, pipeline)
     pipeline.execute()
+    feed_fan_out(redis_conn, user_id, expose_level, activity_id_name, time.time())
 
     mongo_conn = get_mongodb_connection()
     activity = get_activity(activity_id)
@@ -2,9 +2,11 @@ from celery.utils.log import get_task_logger
 
 from uggipuggi.celery.celery import celery
 from uggipuggi.services.user import get_user
+from uggipuggi.services.contacts import add_joined_user
 from uggipuggi.helpers.logs_metrics import init_logger, init_statsd
 from uggipuggi.services.db_service import get_mongodb_connection
 from uggipuggi.controllers.hooks import get_redis_conn
+from uggipuggi.helpers.concise_view import USER_VIEW
 from uggipuggi.controllers.utils.gcloud_utils import upload_image_to_gcs
 from uggipuggi.constants import USER, GAE_IMG_SERVER, GCS_USER_BUCKET
 
@@ -20,4 +22,12 @@ def user_display_pic_task(user_id, image_path):
     user.update(display_pic=img_url)
     redis_user_id_name = USER + user_id
     redis_conn = get_redis_conn()
-    redis_conn.hmset(redis_user_id_name, {'display_pic': img_url})
+    redis_conn.hmset(redis_user_id_name, USER_VIEW.encode({'display_pic': img_url}))
+
+
+@celery.task
+@statsd.timer('add_joined_contacts')
+def add_joined_contacts(user_id, phone):
+    # After a user verified their number, for the address books waiting for it
+    books = add_joined_user(get_redis_conn(), user_id, phone)
+    statsd.incr('add_joined_contacts.books', books)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# Recipients per second of the feed fan-out: the previous single MULTI/EXEC
+# (smembers/sunion, then zadd + zremrangebyrank per recipient) against SSCAN
+# chunks applied with the fan-out script. Needs a scratch redis, its db is flushed:
+#
+#   REDIS_URL=redis://localhost:6379/15 python uggipuggi/tests/benchmarks/bench_feed_fanout.py
+#
+from __future__ import absolute_import, print_function
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import redis
+from uggipuggi.constants import CONTACTS, USER_FEED, MAX_USER_FEED_LENGTH
+from uggipuggi.helpers.keys import followers_key
+from uggipuggi.services.feed_fanout import recipient_chunks, fan_out
+from uggipuggi.services.user_ids import cache_uid
+
+AUDIENCES = (100, 1000, 10000, 100000)
+AUTHOR = 'author'
+# Items already in every feed, so that each add also trims
+FEED_FILL = MAX_USER_FEED_LENGTH
+
+
+def legacy_fan_out(redis_conn, item, score):
+    recipients = redis_conn.sunion(CONTACTS + AUTHOR, followers_key(AUTHOR))
+    pipeline = redis_conn.pipeline(True)
+    for recipient in recipients:
+        # Members were user ids then, the feeds setup() filled
+        user_feed = USER_FEED + 'u' + recipient
+        pipeline.zadd(user_feed, {item: score})
+        pipeline.zremrangebyrank(user_feed, 0, -MAX_USER_FEED_LENGTH + 1)
+    pipeline.execute()
+    return len(recipients)
+
+
+def chunked_fan_out(redis_conn, item, score):
+    # What the chunk tasks do between them, here in one process
+    return sum(fan_out(redis_conn, chunk, item, score)
+               for chunk in recipient_chunks(redis_conn, [CONTACTS + AUTHOR, followers_key(AUTHOR)]))
+
+
+def setup(redis_conn, audience):
+    redis_conn.flushdb()
+    pipeline = redis_conn.pipeline(False)
+    for i in range(audience):
+        recipient = 'u%d' % i
+        # Sets hold integer ids
+        cache_uid(pipeline, recipient, i)
+        pipeline.sadd(CONTACTS + AUTHOR if i % 10 == 0 else followers_key(AUTHOR), i)
+        pipeline.zadd(USER_FEED + recipient, {'r:old%d' % n: n for n in range(FEED_FILL)})
+        if i % 1000 == 999:
+            pipeline.execute()
+    pipeline.execute()
+
+
+def main():
+    redis_conn = redis.StrictRedis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/15'),
+                                            decode_responses=True)
+    for audience in AUDIENCES:
+        for label, run in [('legacy', legacy_fan_out), ('chunked', chunked_fan_out)]:
+            setup(redis_conn, audience)
+            start = time.time()
+            recipients = run(redis_conn, 'r:new', time.time())
+            secs = time.time() - start
+            assert recipients == audience
+            print('%7d recipients %-8s %8.3f s %10.0f recipients/s' %(audience, label, secs, audience / secs))
+    redis_conn.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# Memory of the phone number to user id mapping: a top level key per number,
+# as before, against the bucketed phone directory, plus the encoding of the
+# directory hashes and batched lookup rates. Needs a scratch redis, its db
+# is flushed:
+#
+#   REDIS_URL=redis://localhost:6379/15 python uggipuggi/tests/benchmarks/bench_phone_directory.py
+#
+# Without a redis, --estimate works the memory out from how redis 5/6 encodes
+# the keys, ziplists and hashtables and jemalloc's size classes. These are
+# its numbers, not measured ones; the old fixed 65536 buckets fill past 128
+# entries at ~8.4M users and their hashes turn into hashtables:
+#
+#   python uggipuggi/tests/benchmarks/bench_phone_directory.py --estimate
+#
+#   Estimated, hash-max-ziplist-entries 128
+#      10000 users keys                  1171072 bytes   117.1 bytes/user
+#      10000 users directory/65536       1116960 bytes   111.7 bytes/user  95% of keys, 0 of 9248 buckets hashtables
+#      10000 users directory/250000      1155736 bytes   115.6 bytes/user  99% of keys, 0 of 9787 buckets hashtables
+#     100000 users keys                 11448576 bytes   114.5 bytes/user
+#     100000 users directory/65536       7493008 bytes    74.9 bytes/user  65% of keys, 0 of 51354 buckets hashtables
+#     100000 users directory/250000     10190112 bytes   101.9 bytes/user  89% of keys, 0 of 82476 buckets hashtables
+#    1000000 users keys                112388608 bytes   112.4 bytes/user
+#    1000000 users directory/65536      39484656 bytes    39.5 bytes/user  35% of keys, 0 of 65536 buckets hashtables
+#    1000000 users directory/250000     54321272 bytes    54.3 bytes/user  48% of keys, 0 of 245497 buckets hashtables
+#   10000000 users keys               1174217728 bytes   117.4 bytes/user
+#   10000000 users directory/65536     854365256 bytes    85.4 bytes/user  73% of keys, 64058 of 65536 buckets hashtables
+#   10000000 users directory/250000    361737664 bytes    36.2 bytes/user  31% of keys, 0 of 250000 buckets hashtables
+#
+# The directory's fixed cost is per bucket, so with 250000 buckets it saves
+# little below a million users and the most at the millions it is sized for.
+#
+from __future__ import absolute_import, print_function
+import os
+import sys
+import time
+import random
+import binascii
+from array import array
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import redis
+from uggipuggi.constants import PHONE_DIRECTORY, PHONE_DIRECTORY_BUCKETS
+from uggipuggi.services.phone_directory import set_phone, lookup_phones
+
+USERS = (10000, 100000, 1000000, 10000000)
+LOOKUP_BATCH = 1000
+
+
+def phone_numbers(count):
+    # Registered form, 00 then country code and a 10 digit number
+    rand = random.Random(count)
+    return ['00%d%010d' % (rand.choice((1, 44, 91)), rand.randrange(10 ** 10)) for _ in range(count)]
+
+
+def user_id():
+    # Mongo ObjectIds as stored
+    return binascii.hexlify(os.urandom(12)).decode('ascii')
+
+
+def fill(redis_conn, phones, legacy):
+    pipeline = redis_conn.pipeline(False)
+    for i, phone in enumerate(phones):
+        if legacy:
+            pipeline.set(phone, user_id())
+        else:
+            set_phone(pipeline, phone, user_id())
+        if i % 1000 == 999:
+            pipeline.execute()
+    pipeline.execute()
+
+
+def used_memory(redis_conn):
+    return redis_conn.info('memory')['used_memory']
+
+
+def lookups_per_second(redis_conn, phones, legacy):
+    batches = [phones[start:start + LOOKUP_BATCH] for start in range(0, min(len(phones), 100000), LOOKUP_BATCH)]
+    start = time.time()
+    for batch in batches:
+        if legacy:
+            redis_conn.mget(batch)
+        else:
+            lookup_phones(redis_conn, batch, legacy_lookup=False)
+    return sum(len(batch) for batch in batches) / (time.time() - start)
+
+
+def size_class(size):
+    # jemalloc's: 8, then multiples of 16 to 128, then 4 classes per doubling
+    if size <= 8:
+        return 8
+    if size <= 128:
+        return -(-size // 16) * 16
+    step = 1 << ((size - 1).bit_length() - 3)
+    return -(-size // step) * step
+
+
+def sds_size(length):
+    # sdshdr8 header, string and terminator
+    return size_class(3 + length + 1)
+
+
+def dict_table(entries):
+    # Slots are pointers, the table is the next power of two
+    return 8 * (1 << max(entries - 1, 1).bit_length()) if entries else 0
+
+
+def ziplist_entry(value, prev_size):
+    prev_len = 1 if prev_size < 254 else 5
+    if value.isdigit() and len(value) < 20 and str(int(value)) == value:
+        number = int(value)
+        for limit, size in ((12, 0), (1 << 7, 1), (1 << 15, 2), (1 << 23, 3), (1 << 31, 4)):
+            if number < limit:
+                return prev_len + 1 + size
+        return prev_len + 1 + 8
+    return prev_len + (1 if len(value) < 64 else 2) + len(value)
+
+
+def estimate_keys(phones):
+    # Per number: dict entry, key, embedded string object of the user id
+    total = dict_table(len(phones))
+    for phone in phones:
+        total += 24 + sds_size(len(phone)) + size_class(16 + 3 + 24 + 1)
+    return total
+
+
+def estimate_directory(phones, buckets, max_ziplist_entries=128):
+    # Field lengths per bucket are enough, a user id is always 24 characters
+    fields = {}
+    for phone in phones:
+        number = int(phone[2:])
+        fields.setdefault(number % buckets, array('l')).append(number // buckets)
+    total = dict_table(len(fields))
+    converted = 0
+    for bucket, bucket_fields in fields.items():
+        total += 24 + sds_size(len(PHONE_DIRECTORY + str(bucket))) + 16
+        if len(bucket_fields) <= max_ziplist_entries:
+            size, prev_size = 11, 0
+            for field in bucket_fields:
+                for value in (str(field), 'u' * 24):
+                    prev_size = ziplist_entry(value, prev_size)
+                    size += prev_size
+            total += size_class(size)
+        else:
+            converted += 1
+            total += size_class(96) + dict_table(len(bucket_fields))
+            for field in bucket_fields:
+                total += 24 + sds_size(len(str(field))) + sds_size(24)
+    return total, converted, len(fields)
+
+
+def estimate():
+    print('Estimated, hash-max-ziplist-entries 128')
+    for users in USERS:
+        phones = phone_numbers(users)
+        keys = estimate_keys(phones)
+        print('%8d users %-16s %12d bytes %7.1f bytes/user' %(users, 'keys', keys, keys / float(users)))
+        for buckets in (65536, PHONE_DIRECTORY_BUCKETS):
+            total, converted, used = estimate_directory(phones, buckets)
+            print('%8d users %-16s %12d bytes %7.1f bytes/user %3.0f%% of keys, %d of %d buckets hashtables'
+                  %(users, 'directory/%d' % buckets, total, total / float(users), 100.0 * total / keys,
+                    converted, used))
+
+
+def main():
+    redis_conn = redis.StrictRedis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/15'),
+                                            decode_responses=True)
+    print('hash-max-ziplist-entries %s, %d buckets' %(redis_conn.config_get('hash-max-ziplist-entries'),
+                                                      PHONE_DIRECTORY_BUCKETS))
+    for users in USERS:
+        phones = phone_numbers(users)
+        results = {}
+        for label, legacy in [('keys', True), ('directory', False)]:
+            redis_conn.flushdb()
+            before = used_memory(redis_conn)
+            fill(redis_conn, phones, legacy)
+            results[label] = used_memory(redis_conn) - before
+            rate = lookups_per_second(redis_conn, phones, legacy)
+            print('%8d users %-10s %12d bytes %7.1f bytes/user %10.0f lookups/s'
+                  %(users, label, results[label], results[label] / float(users), rate))
+        encodings = {}
+        for bucket in random.sample(range(PHONE_DIRECTORY_BUCKETS), 100):
+            encoding = redis_conn.object('encoding', PHONE_DIRECTORY + str(bucket))
+            encodings[encoding] = encodings.get(encoding, 0) + 1
+        print('%8d users directory is %.0f%% of keys, encodings of 100 buckets: %r'
+              %(users, 100.0 * results['directory'] / results['keys'], encodings))
+    redis_conn.flushdb()
+
+
+if __name__ == '__main__':
+    estimate() if '--estimate' in sys.argv else main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+#
+# Compares the per request cost of the compiled route policy lookup with the
+# previous ACL_MAP path munging + isinstance exemption chain in AuthMiddleware.
+#
+#   python uggipuggi/tests/benchmarks/bench_route_policy.py
+#
+from __future__ import absolute_import, print_function
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from uggipuggi.models.user import Role
+from uggipuggi.middlewares.policy import ACL_MAP, attach_route_policy, get_route_policy
+
+NUMBER = 200000
+
+# ACL_MAP as it was keyed before, by path with the last segment replaced by '+'
+LEGACY_ACL_MAP = {template.replace('{id}', '+'): acl for template, acl in ACL_MAP.items()}
+
+
+class Request(object):
+    def __init__(self, method, path, uri_template):
+        self.method = method
+        self.path = path
+        self.url = 'http://uggipuggi' + path
+        self.uri_template = uri_template
+
+
+class Register(object): pass
+class Verify(object): pass
+class PasswordChange(object): pass
+class ForgotPassword(object): pass
+class Metrics(object): pass
+class Ping(object): pass
+class Item(object): pass
+
+
+def legacy_check(req, resource):
+    if isinstance(resource, Register) or \
+       isinstance(resource, Verify) or \
+       isinstance(resource, PasswordChange) or \
+       isinstance(resource, ForgotPassword) or \
+       isinstance(resource, Metrics) or \
+       isinstance(resource, Ping) or ("/images/" in req.url and req.method.lower()=='get'):
+        return None
+    method = req.method.lower() or 'get'
+    path = req.path.lower()
+    if path not in LEGACY_ACL_MAP:
+        sub_path, _, id = path.rpartition('/')
+        if not sub_path:
+            return False
+        path = "{}/+".format(sub_path)
+        if path not in LEGACY_ACL_MAP:
+            return False
+    return LEGACY_ACL_MAP[path].get(method, Role.USER)
+
+
+def compiled_check(req, resource):
+    policy = get_route_policy(req, resource)
+    if policy is None:
+        return False
+    if not policy.token_required:
+        return None
+    return policy.min_role
+
+
+def main():
+    resource = Item()
+    attach_route_policy(resource, '/recipes/{id}')
+    req = Request('GET', '/recipes/5ea6f8ba8b5c1f0001ee5c31', '/recipes/{id}')
+    assert legacy_check(req, resource) == compiled_check(req, resource)
+
+    for name, check in [('legacy ACL_MAP', legacy_check), ('compiled policy', compiled_check)]:
+        secs = min(timeit.repeat(lambda: check(req, resource), number=NUMBER, repeat=5))
+        print('%-16s %7.3f us/request' %(name, secs / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+#
+# Compares interpreted colander validation with the compiled validators on
+# recipe create/update and rating bodies.
+#
+#   python uggipuggi/tests/benchmarks/bench_schema.py
+#
+from __future__ import absolute_import, print_function
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+from uggipuggi.helpers.schema import compile_schema, partial
+from uggipuggi.controllers.schema.recipe import RecipeSchema, RecipeUpdateSchema
+from uggipuggi.controllers.schema.rating import RecipeRatingSchema
+
+NUMBER = 2000
+
+RECIPE = {'recipe_name': 'Dal tadka',
+          'steps': ['Step %d of the recipe, with some more words to it' %i for i in range(8)],
+          'ingredients': ['Ingredient %d' %i for i in range(10)],
+          'ingredients_quant': [0.5 * i for i in range(10)],
+          'ingredients_metric': ['gm'] * 10,
+          'category': 1, 'cook_time': 20, 'prep_time': 10, 'expose_level': 1,
+          'description': 'A short description of the recipe',
+          'images': ['https://storage.googleapis.com/bucket/%d.jpg' %i for i in range(3)],
+          'tags': ['veg', 'quick']}
+
+
+def main():
+    cases = [
+        ('recipe create', RecipeSchema(), RECIPE),
+        ('recipe update', partial(RecipeUpdateSchema()), {'cook_time': 25, 'description': 'Less salt'}),
+        ('rating', RecipeRatingSchema(), {'user_id': '5ea6f8ba8b5c1f0001ee5c31', 'rating': 4.5}),
+    ]
+    for name, schema, cstruct in cases:
+        compiled = compile_schema(schema)
+        assert compiled.deserialize(cstruct) == schema.deserialize(cstruct)
+        for label, deserialize in [('colander', schema.deserialize), ('compiled', compiled.deserialize)]:
+            secs = min(timeit.repeat(lambda: deserialize(cstruct), number=NUMBER, repeat=5))
+            print('%-14s %-9s %8.2f us' %(name, label, secs / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Compares the previous serialize hook (_to_json copy + bson.json_util.dumps)
+# with the single pass encoder on recipe and feed shaped response bodies.
+#
+#   python uggipuggi/tests/benchmarks/bench_serialize.py
+#
+from __future__ import absolute_import, print_function
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import mongoengine as mongo
+from bson import json_util, ObjectId
+from uggipuggi.helpers import encoder
+from uggipuggi.models.recipe import Recipe, Comment
+
+NUMBER = 200
+
+
+def legacy_dumps(body):
+    def _to_json(obj):
+        if isinstance(obj, mongo.Document):
+            return obj._data
+        if isinstance(obj, dict):
+            return {k: _to_json(v) for k, v in obj.items()}
+        if isinstance(obj, mongo.queryset.queryset.QuerySet) or isinstance(obj, list):
+            return [_to_json(item) for item in obj]
+        return obj
+    return json_util.dumps(_to_json(body))
+
+
+def make_recipe(i):
+    recipe = Recipe(recipe_name='Recipe %d' %i, user_id=str(ObjectId()), category=1,
+                    steps=['Step %d of the recipe, with some more words to it' %s for s in range(8)],
+                    ingredients=['Ingredient %d' %s for s in range(10)],
+                    ingredients_quant=list(range(10)), ingredients_metric=['gm'] * 10,
+                    description='A short description of recipe %d' %i,
+                    images=['https://storage.googleapis.com/bucket/%d_%d.jpg' %(i, s) for s in range(3)],
+                    tags=['veg', 'quick'], last_modified=datetime.utcnow(),
+                    comments=[Comment(user_id=str(ObjectId()), user_name='user', content='Yum!')
+                              for _ in range(5)])
+    recipe.id = ObjectId()
+    return recipe
+
+
+def make_feed_item(i):
+    # Concise views as read back from the redis hashes
+    return {'id': 'r:%s' %ObjectId(), 'recipe_name': 'Recipe %d' %i, 'likes_count': '10',
+            'saves_count': '2', 'comments_count': '5', 'cook_time': '15', 'item_type': 'recipe',
+            'description': 'A short description of recipe %d' %i, 'user_id': str(ObjectId()),
+            'author_display_name': 'UggiPuggi User', 'author_avatar': 'https://a/b.jpg',
+            'generation_time': datetime.utcnow().isoformat(),
+            'images': ['https://storage.googleapis.com/bucket/%d_%d.jpg' %(i, s) for s in range(3)]}
+
+
+def strip_comments(body):
+    if isinstance(body, dict):
+        return {k: strip_comments(v) for k, v in body.items() if k != 'comments'}
+    if isinstance(body, list):
+        return [strip_comments(item) for item in body]
+    return body
+
+
+def main():
+    bodies = [
+        ('recipe item', make_recipe(0)),
+        ('25 recipes', {'items': [make_recipe(i) for i in range(25)], 'count': 25}),
+        ('150 feed items', [make_feed_item(i) for i in range(150)]),
+    ]
+    for name, body in bodies:
+        # json_util wrote embedded comments out as lists of their field names,
+        # the encoder writes them as objects, everything else must be identical
+        assert strip_comments(json_util.loads(legacy_dumps(body))) == \
+               strip_comments(json_util.loads(encoder.dumps(body)))
+        for label, dumps in [('legacy', legacy_dumps), ('encoder', encoder.dumps)]:
+            secs = min(timeit.repeat(lambda: dumps(body), number=NUMBER, repeat=5))
+            print('%-16s %-8s %8.1f us' %(name, label, secs / NUMBER * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# Memory of follower sets holding 24 character ObjectId strings, as before,
+# against integer user ids, on a synthetic power law graph: follower counts
+# are Pareto distributed, most users have a handful and a few have a large
+# share of everyone. Needs a scratch redis, its db is flushed:
+#
+#   REDIS_URL=redis://localhost:6379/15 python uggipuggi/tests/benchmarks/bench_user_ids.py
+#
+from __future__ import absolute_import, print_function
+import os
+import sys
+import random
+import binascii
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+
+import redis
+from uggipuggi.helpers.keys import followers_key
+
+USERS = (10000, 100000)
+# Shape of the follower count distribution, lower is more skewed
+PARETO_ALPHA = 1.2
+MEAN_FOLLOWERS = 20
+
+
+def power_law_graph(users):
+    # Followers of each user, as indexes of users
+    rand = random.Random(users)
+    graph = []
+    scale = MEAN_FOLLOWERS * (PARETO_ALPHA - 1) / PARETO_ALPHA
+    for _ in range(users):
+        count = min(users - 1, int(rand.paretovariate(PARETO_ALPHA) * scale))
+        graph.append(rand.sample(range(users), count))
+    return graph
+
+
+def fill(redis_conn, graph, user_ids, members):
+    # Keys are named by user id either way, only members change
+    pipeline = redis_conn.pipeline(False)
+    for user, followers in enumerate(graph):
+        if followers:
+            pipeline.sadd(followers_key(user_ids[user]), *[members[f] for f in followers])
+        if user % 1000 == 999:
+            pipeline.execute()
+    pipeline.execute()
+
+
+def main():
+    redis_conn = redis.StrictRedis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/15'),
+                                            decode_responses=True)
+    print('set-max-intset-entries %s' % redis_conn.config_get('set-max-intset-entries'))
+    for users in USERS:
+        graph = power_law_graph(users)
+        edges = sum(len(followers) for followers in graph)
+        object_ids = [binascii.hexlify(os.urandom(12)).decode('ascii') for _ in range(users)]
+        results = {}
+        for label, members in [('object ids', object_ids), ('integer ids', list(range(1, users + 1)))]:
+            redis_conn.flushdb()
+            before = redis_conn.info('memory')['used_memory']
+            fill(redis_conn, graph, object_ids, members)
+            results[label] = redis_conn.info('memory')['used_memory'] - before
+            print('%7d users %8d follows %-11s %12d bytes %6.1f bytes/follow'
+                  %(users, edges, label, results[label], results[label] / float(edges)))
+        encodings = {}
+        for user in random.sample(range(users), min(users, 1000)):
+            if graph[user]:
+                encoding = redis_conn.object('encoding', followers_key(object_ids[user]))
+                encodings[encoding] = encodings.get(encoding, 0) + 1
+        print('%7d users integer ids take %.0f%% of object ids, encodings of 1000 sets: %r'
+              %(users, 100.0 * results['integer ids'] / results['object ids'], encodings))
+    redis_conn.flushdb()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import absolute_import
+import json
 import colander
 import mock
+from bson import json_util, ObjectId
+from datetime import datetime, timedelta, timezone
 from falcon import testing
 from ast import literal_eval as eval
 from uggipuggi.controllers.hooks import serialize, deserialize
-from uggipuggi.libs.error import HTTPBadRequest, HTTPNotAcceptable
+from uggipuggi.libs.error import HTTPBadRequest, HTTPNotAcceptable, HTTPPayloadTooLarge
+from uggipuggi.models.recipe import Recipe
 
 dummy = mock.Mock()
 
@@ -16,6 +20,17 @@ class MockSchema(colander.MappingSchema):
     age = colander.SchemaNode(colander.Int())
 
 
+def make_body_req(method, stream, content_type='application/json', content_length=-1):
+    req = mock.Mock()
+    req.method = method
+    req.content_type = content_type
+    req.content_length = len(stream) if content_length == -1 else content_length
+    req.params = {}
+    req.stream.read.return_value = stream
+    req.bounded_stream.read.return_value = stream
+    return req
+
+
 class TestDeserialize(testing.TestBase):
 
     def test_deserialize(self):
@@ -35,16 +50,12 @@ class TestDeserialize(testing.TestBase):
             },
         ]
         for t in stream_tests:
-            req = mock.Mock()
-            req.method = t['method']
-            req.content_type = 'application/json'
-            req.params = {}
-            req.stream.read.return_value = t['stream']
+            req = make_body_req(t['method'], t['stream'])
 
             if t['error']:
-                self.assertRaises(HTTPBadRequest, deserialize, req, dummy, dummy, schema=t['schema'])
+                self.assertRaises(HTTPBadRequest, deserialize, req, dummy, dummy, {}, schema=t['schema'])
             else:
-                deserialize(req, dummy, dummy, schema=t['schema'])
+                deserialize(req, dummy, dummy, {}, schema=t['schema'])
                 self.assertDictEqual(req.params['body'], t['expected'])
 
         query_tests = [
@@ -76,9 +87,9 @@ class TestDeserialize(testing.TestBase):
             req.query_string = t['query']
 
             if t['error']:
-                self.assertRaises(HTTPBadRequest, deserialize, req, dummy, dummy, schema=t['schema'])
+                self.assertRaises(HTTPBadRequest, deserialize, req, dummy, dummy, {}, schema=t['schema'])
             else:
-                deserialize(req, dummy, dummy, schema=t['schema'])
+                deserialize(req, dummy, dummy, {}, schema=t['schema'])
                 self.assertDictEqual(req.params['query'], t['expected'])
 
     def test_empty_stream(self):
@@ -88,19 +99,54 @@ class TestDeserialize(testing.TestBase):
         req.method = query_test['method']
         req.params = {}
         req.query_string = query_test['query']
-        deserialize(req, dummy, dummy)
+        deserialize(req, dummy, dummy, {})
         self.assertEquals(req.params['query'], query_test['expected'])
 
         stream_test = {'method': 'POST', 'stream': '', 'expected': {}}
 
-        req = mock.Mock()
-        req.method = stream_test['method']
-        req.content_type = 'application/json'
-        req.params = {}
-        req.stream.read.return_value = stream_test['stream']
-        deserialize(req, dummy, dummy)
+        req = make_body_req(stream_test['method'], stream_test['stream'])
+        deserialize(req, dummy, dummy, {})
         self.assertEquals(req.params['body'], stream_test['expected'])
 
+    def test_body_size_limit(self):
+        tests = [
+            {'stream': b'{"name":"siri"}', 'content_length': 15, 'error': False},
+            {'stream': b'{"name":"siri", "age": 1}', 'content_length': 25, 'error': True},
+            # no Content-Length, e.g. chunked: only what is read counts
+            {'stream': b'{"name":"siri", "age": 1}', 'content_length': None, 'error': True},
+        ]
+        for t in tests:
+            req = make_body_req('POST', t['stream'], content_length=t['content_length'])
+            if t['error']:
+                self.assertRaises(HTTPPayloadTooLarge, deserialize, req, dummy, dummy, {}, max_body_size=20)
+            else:
+                deserialize(req, dummy, dummy, {}, max_body_size=20)
+                self.assertDictEqual(req.params['body'], {'name': 'siri'})
+
+    def test_extended_json(self):
+        stream = '{"id": {"$oid": "5ea6f8ba8b5c1f0001ee5c31"}}'
+        tests = [
+            {'extended_json': False, 'expected': {'id': {'$oid': '5ea6f8ba8b5c1f0001ee5c31'}}},
+            {'extended_json': True, 'expected': {'id': ObjectId('5ea6f8ba8b5c1f0001ee5c31')}},
+        ]
+        for t in tests:
+            req = make_body_req('POST', stream)
+            deserialize(req, dummy, dummy, {}, extended_json=t['extended_json'])
+            self.assertDictEqual(req.params['body'], t['expected'])
+
+    def test_incremental(self):
+        lines = [b'"+447901103131"\n', b'\n', b'"+447901103132"\n']
+        req = make_body_req('PUT', b''.join(lines), content_type='application/x-ndjson')
+        req.bounded_stream = iter(lines)
+        deserialize(req, dummy, dummy, {}, incremental=True)
+        self.assertEqual(req.params['body'], {})
+        self.assertEqual(list(req.params['body_items']), ['+447901103131', '+447901103132'])
+
+        req = make_body_req('PUT', b'"+4479011031', content_type='application/x-ndjson')
+        req.bounded_stream = iter([b'"+4479011031\n'])
+        deserialize(req, dummy, dummy, {}, incremental=True)
+        self.assertRaises(HTTPBadRequest, list, req.params['body_items'])
+
     def test_content_type_check(self):
         tests = [
             {'content_type': 'text/html', 'error': True},
@@ -136,4 +182,36 @@ class TestSerialize(testing.TestBase):
             resp.body = t['body']
 
             serialize(dummy, resp, dummy)
-            self.assertDictEqual(eval(resp.body), eval(t['expected']))
+            self.assertIsNone(resp.body)
+            self.assertDictEqual(json.loads(resp.data), eval(t['expected']))
+
+    def test_bson_types(self):
+        # Clients parse the legacy json_util format, output must not change
+        oid = ObjectId('5ea6f8ba8b5c1f0001ee5c31')
+        tests = [
+            {'body': {'id': oid, 'items': [oid, {'id': oid}]}},
+            {'body': {'last_modified': datetime(2020, 5, 1, 10, 0, 0, 123456)}},
+            {'body': {'last_modified': datetime(2020, 5, 1, 10, 0, 0, tzinfo=timezone(timedelta(hours=5)))}},
+            {'body': [{'images': ['a.jpg'], 'likes_count': 1, 'description': u'caf\xe9'}]},
+        ]
+        for t in tests:
+            resp = mock.Mock()
+            resp.body = t['body']
+
+            serialize(dummy, resp, dummy)
+            self.assertEqual(json.loads(resp.data), json.loads(json_util.dumps(t['body'])))
+
+    def test_documents(self):
+        recipe = Recipe(recipe_name='dal', user_id='user_1', category=1,
+                        last_modified=datetime(2020, 5, 1, 10, 0, 0))
+        recipe.id = ObjectId('5ea6f8ba8b5c1f0001ee5c31')
+        tests = [
+            {'body': recipe, 'expected': recipe._data},
+            {'body': {'items': [recipe], 'tags': {'veg'}}, 'expected': {'items': [recipe._data], 'tags': ['veg']}},
+        ]
+        for t in tests:
+            resp = mock.Mock()
+            resp.body = t['body']
+
+            serialize(dummy, resp, dummy)
+            self.assertEqual(json.loads(resp.data), json.loads(json_util.dumps(t['expected'])))
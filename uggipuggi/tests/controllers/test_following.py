@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import falcon
+import mock
+from falcon import testing
+from uggipuggi.controllers import redis_following
+
+USER_A = '5ea6f8ba8b5c1f0001ee5c40'
+USER_B = '5ea6f8ba8b5c1f0001ee5c41'
+
+
+class UserId(object):
+    # Stands in for the auth middleware
+    def process_request(self, req, resp):
+        req.user_id = USER_A
+
+
+class TestBulkPut(testing.TestBase):
+
+    def setUp(self):
+        super(TestBulkPut, self).setUp()
+        self.app = falcon.API(middleware=[UserId()])
+        self.app.add_route('/following/{id}/bulk', redis_following.Bulk())
+        self.client = testing.TestClient(self.app)
+        for target in ['uggipuggi.controllers.hooks.connections',
+                       'uggipuggi.messaging.following_kafka_producers.connections']:
+            patcher = mock.patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @mock.patch('uggipuggi.controllers.redis_following.follow', return_value=(1, 1))
+    @mock.patch('uggipuggi.controllers.redis_following.public_profiles', return_value=[True])
+    def test_user_ids(self, public_profiles, follow):
+        tests = [
+            # (body, status)
+            ({'follow': [USER_B]}, falcon.HTTP_OK),
+            ({'follow': USER_B}, falcon.HTTP_BAD_REQUEST),
+            ({'follow': [[USER_B]]}, falcon.HTTP_BAD_REQUEST),
+            ({'follow': [{'id': USER_B}]}, falcon.HTTP_BAD_REQUEST),
+            ({'unfollow': [42]}, falcon.HTTP_BAD_REQUEST),
+            ({'unfollow': ['user_b']}, falcon.HTTP_BAD_REQUEST),
+        ]
+        for body, status in tests:
+            result = self.client.simulate_put('/following/%s/bulk' % USER_A, json=body)
+            self.assertEqual(result.status, status, body)
+        public_profiles.assert_called_once_with(mock.ANY, [USER_B])
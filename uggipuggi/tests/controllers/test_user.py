@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.controllers import user
+from uggipuggi.libs.error import HTTPUnauthorized
+
+
+class TestUserItemPut(testing.TestBase):
+
+    def test_check_role_change(self):
+        tests = [
+            # (update, is admin, allowed)
+            ({'status': 'cooking'}, False, True),
+            ({'role': 9}, False, False),
+            ({'role': 9}, True, True),
+        ]
+        resource = user.Item.__new__(user.Item)
+        for user_data, is_admin, allowed in tests:
+            req = mock.Mock()
+            req.context.identity.role_satisfy.return_value = is_admin
+            if allowed:
+                resource._check_role_change(req, user_data)
+            else:
+                self.assertRaises(HTTPUnauthorized, resource._check_role_change, req, user_data)
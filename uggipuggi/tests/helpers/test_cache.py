@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from falcon import testing
+import mock
+from uggipuggi.helpers.cache import TTLCache, InvalidationBus
+
+
+class FakeTimer(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(testing.TestBase):
+
+    def test_get_set(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 'default'), 'default')
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+
+    def test_expiry(self):
+        timer = FakeTimer()
+        cache = TTLCache(maxsize=10, ttl=60, timer=timer)
+        cache.set('a', 1)
+        cache.set('b', 2, ttl=120)
+        timer.now = 60
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')  # 'b' is now least recently used
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_pop(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.pop('a'), 1)
+        self.assertIsNone(cache.pop('a'))
+        self.assertIsNone(cache.get('a'))
+
+
+class TestInvalidationBus(testing.TestBase):
+
+    def test_dispatch(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set('user_1', 'identity')
+        bus = InvalidationBus(mock.Mock())
+        bus.subscribe('identity_invalidate', cache.pop)
+        bus._dispatch({'channel': 'identity_invalidate', 'data': 'user_1'})
+        self.assertIsNone(cache.get('user_1'))
+
+    def test_publish(self):
+        redis_conn = mock.Mock()
+        bus = InvalidationBus(lambda: redis_conn)
+        bus.publish('identity_invalidate', 'user_1')
+        redis_conn.publish.assert_called_once_with('identity_invalidate', 'user_1')
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from falcon import testing
+from uggipuggi.constants import RECIPE_CONCISE_VIEW_FIELDS, ACTIVITY_CONCISE_VIEW_FIELDS,\
+                                RECIPE_VERY_CONCISE_VIEW_FIELDS
+from uggipuggi.helpers.concise_view import RECIPE_VIEW, ACTIVITY_VIEW, USER_VIEW, VERSION_FIELD,\
+                                           CONCISE_VIEW_VERSION, view_for_key, decode_hash
+
+
+def stored(mapping):
+    # What redis hands back for an hmset of mapping
+    return {field: str(value) for field, value in mapping.items()}
+
+
+class TestConciseView(testing.TestBase):
+
+    def test_round_trip(self):
+        tests = [
+            (RECIPE_VIEW, {'images': ['https://img/1', 'https://img/2'], 'recipe_name': "Mum's dal",
+                           'likes_count': 3, 'saves_count': 0, 'comments_count': 12, 'cook_time': 40,
+                           'description': '', 'id': '5ea6f8ba8b5c1f0001ee5c31'}),
+            (ACTIVITY_VIEW, {'images': [], 'recipe_name': 'Dal', 'likes_count': 0,
+                             'recipe_id': '5ea6f8ba8b5c1f0001ee5c31', 'item_type': 'activity'}),
+            (USER_VIEW, {'display_name': 'raka', 'public_profile': False, 'account_active': True,
+                         'num_followers': 7}),
+        ]
+        for view, data in tests:
+            mapping = stored(view.encode(data))
+            self.assertEqual(view.decode(mapping), data)
+
+    def test_version_stamp(self):
+        tests = [
+            # (data, stamped)
+            ({'images': [], 'recipe_name': 'Dal'}, True),
+            ({'likes_count': 1}, False),
+            ({}, False),
+        ]
+        for data, stamped in tests:
+            mapping = RECIPE_VIEW.encode(data)
+            self.assertEqual(mapping.get(VERSION_FIELD) == CONCISE_VIEW_VERSION, stamped)
+
+    def test_none_values_not_written(self):
+        self.assertEqual(RECIPE_VIEW.encode({'cook_time': None, 'recipe_name': 'Dal'}),
+                         {'recipe_name': 'Dal'})
+
+    def test_decode_version_1(self):
+        tests = [
+            # (stored images, decoded)
+            ("['https://img/1', 'https://img/2']", ['https://img/1', 'https://img/2']),
+            ('[]', []),
+            ("__import__('os').system('true')", []),
+            ('', []),
+        ]
+        for value, expected in tests:
+            self.assertEqual(RECIPE_VIEW.decode_field('images', value), expected)
+
+    def test_decode_scalars(self):
+        tests = [
+            (USER_VIEW, 'public_profile', 'True', True),
+            (USER_VIEW, 'public_profile', '0', False),
+            (USER_VIEW, 'account_active', '1', True),
+            (RECIPE_VIEW, 'likes_count', '5', 5),
+            (RECIPE_VIEW, 'likes_count', None, None),
+            (RECIPE_VIEW, 'cook_time', '', None),
+            (RECIPE_VIEW, 'recipe_name', '12', '12'),
+        ]
+        for view, field, value, expected in tests:
+            self.assertEqual(view.decode_field(field, value), expected)
+
+    def test_decode_values(self):
+        values = ['["https://img/1"]', 'Dal', '2', 'r1', None, '0']
+        self.assertEqual(RECIPE_VIEW.decode_values(RECIPE_VERY_CONCISE_VIEW_FIELDS, values),
+                         [['https://img/1'], 'Dal', 2, 'r1', None, 0])
+
+    def test_view_for_key(self):
+        tests = [
+            ('r:5ea6f8ba8b5c1f0001ee5c31', RECIPE_VIEW),
+            ('act:5ea6f8ba8b5c1f0001ee5c31', ACTIVITY_VIEW),
+            ('u:5ea6f8ba8b5c1f0001ee5c31', USER_VIEW),
+            ('otp:+4412345', None),
+        ]
+        for key, view in tests:
+            self.assertIs(view_for_key(key), view)
+        self.assertEqual(decode_hash('otp:+4412345', {'code': '1234'}), {'code': '1234'})
+
+    def test_every_concise_field_typed(self):
+        for view, fields in [(RECIPE_VIEW, RECIPE_CONCISE_VIEW_FIELDS),
+                             (ACTIVITY_VIEW, ACTIVITY_CONCISE_VIEW_FIELDS)]:
+            self.assertEqual(set(fields) - set(view.types), set())
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import RECIPE, ACTIVITY, USER, USER_FEED, USER_SAVED_RECIPES, COUNTER_FLUSH,\
+                                COUNTER_BATCHES
+from uggipuggi.helpers.keys import hash_tag, key_slot, is_cluster, item_likes_key, item_saves_key,\
+                                   user_liked_key, pulled_feed_key, counter_deltas_key,\
+                                   counter_flush_key, counter_batches_key, following_key,\
+                                   followers_key, migrate_legacy_keys
+
+ITEM_ID = '5ea6f8ba8b5c1f0001ee5c31'
+USER_ID = '5ea6f8ba8b5c1f0001ee5c40'
+
+
+class TestKeys(testing.TestBase):
+
+    def test_key_slot(self):
+        tests = [
+            # Values from the redis cluster specification and CLUSTER KEYSLOT
+            ('123456789', 12739),
+            ('foo', 12182),
+            ('{user1000}.following', key_slot('user1000')),
+            ('{user1000}.followers', key_slot('user1000')),
+            # Empty or unclosed tags hash the whole key
+            ('foo{}{bar}', key_slot('foo{}{bar}')),
+            ('foo{{bar}}zap', key_slot('{bar')),
+            ('foo{bar}{zap}', key_slot('bar')),
+        ]
+        for key, slot in tests:
+            self.assertEqual(key_slot(key), slot)
+
+    def test_hash_tag(self):
+        tests = [
+            ('r:1', 'r:1'),
+            ('r_liked{r:1}', 'r:1'),
+            ('foo{}{bar}', 'foo{}{bar}'),
+            ('foo{bar', 'foo{bar'),
+        ]
+        for key, tag in tests:
+            self.assertEqual(hash_tag(key), tag)
+
+    def test_script_keys_share_a_slot(self):
+        tests = [
+            # Keys each script is called with
+            [item_likes_key(RECIPE + ITEM_ID), RECIPE + ITEM_ID],
+            [item_likes_key(ACTIVITY + ITEM_ID), ACTIVITY + ITEM_ID],
+            [item_saves_key(ITEM_ID), RECIPE + ITEM_ID],
+            [user_liked_key(USER_ID), USER_SAVED_RECIPES + USER_ID],
+            [USER_FEED + USER_ID, pulled_feed_key(USER_ID)],
+            [following_key(USER_ID), USER + USER_ID],
+            [followers_key(USER_ID), USER + USER_ID],
+            [counter_deltas_key(RECIPE), counter_flush_key(RECIPE), counter_batches_key(RECIPE)],
+            [counter_deltas_key(ACTIVITY), counter_flush_key(ACTIVITY), counter_batches_key(ACTIVITY)],
+        ]
+        for keys in tests:
+            self.assertEqual(len(set(key_slot(key) for key in keys)), 1, keys)
+
+    def test_is_cluster(self):
+        self.assertFalse(is_cluster(mock.Mock()))
+
+    def test_migrate_legacy_keys(self):
+        legacy = {'r_liked' + ITEM_ID: ['a', 'b'], 'r_liked{r:2}': ['c']}
+        redis_conn = mock.Mock()
+        redis_conn.scan_iter.side_effect = [iter(['r_liked' + ITEM_ID, 'r_liked{r:2}'])] +\
+                                           [iter([]) for _ in range(5)]
+        redis_conn.sscan_iter.side_effect = lambda key, count=None: iter(legacy[key])
+        redis_conn.get.side_effect = lambda key: {COUNTER_BATCHES: '7'}.get(key)
+        redis_conn.hgetall.side_effect = lambda key: {'_batch': '7'} if key == COUNTER_FLUSH + RECIPE else {}
+        redis_conn.exists.return_value = 0
+        self.assertEqual(migrate_legacy_keys(redis_conn), 2)
+        # Keys already tagged are left alone
+        redis_conn.sadd.assert_called_once_with(item_likes_key(RECIPE + ITEM_ID), 'a', 'b')
+        redis_conn.set.assert_has_calls([mock.call(counter_batches_key(RECIPE), 7),
+                                         mock.call(counter_batches_key(ACTIVITY), 7)])
+        redis_conn.hmset.assert_called_once_with(counter_flush_key(RECIPE), {'_batch': '7'})
+        redis_conn.delete.assert_has_calls([mock.call('r_liked' + ITEM_ID), mock.call(COUNTER_FLUSH + RECIPE)])
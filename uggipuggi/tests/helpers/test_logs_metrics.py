@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import logging
+import threading
+from falcon import testing
+import mock
+from uggipuggi.helpers import logs_metrics
+from uggipuggi.helpers.logs_metrics import LogShipper, DroppingQueueHandler, RequestIdFilter,\
+                                           init_logger, lazy, set_request_id
+
+
+class FakeLogstashHandler(object):
+    def __init__(self):
+        self.sent = []
+
+    def makePickle(self, record):
+        return record.getMessage().encode('utf-8') + b'\n'
+
+    def send(self, data):
+        self.sent.append(data)
+
+
+def make_record(msg, *args):
+    return logging.LogRecord('test', logging.INFO, __file__, 1, msg, args, None)
+
+
+class TestLogPipeline(testing.TestBase):
+
+    def test_init_logger_adds_one_handler(self):
+        root = logging.getLogger()
+        with mock.patch.object(logs_metrics, '_log_handler', None),\
+             mock.patch('uggipuggi.helpers.logs_metrics.logstash.TCPLogstashHandler') as handler_cls:
+            for _ in range(5):
+                logger = init_logger()
+            self.assertIs(logger, root)
+            self.assertEqual(handler_cls.call_count, 1)
+            self.assertEqual(root.handlers.count(logs_metrics._log_handler), 1)
+            root.removeHandler(logs_metrics._log_handler)
+
+    def test_full_queue_drops_records(self):
+        statsd = mock.Mock()
+        shipper = LogShipper(FakeLogstashHandler(), maxsize=2, statsd=statsd)
+        handler = DroppingQueueHandler(shipper)
+        with mock.patch.object(shipper, 'ensure_started'):
+            for i in range(5):
+                handler.handle(make_record('record %d', i))
+        self.assertEqual(shipper.queue.qsize(), 2)
+        self.assertEqual(shipper.dropped, 3)
+        # Reported by the shipper, once
+        shipper.flush()
+        shipper.flush()
+        statsd.incr.assert_called_once_with('log_shipper.dropped', 3)
+
+    def test_formatted_on_shipper(self):
+        build = mock.Mock(return_value='Dal')
+        logstash = FakeLogstashHandler()
+        shipper = LogShipper(logstash)
+        handler = DroppingQueueHandler(shipper)
+        with mock.patch.object(shipper, 'ensure_started'):
+            handler.handle(make_record('recipe %s', lazy(build)))
+        self.assertFalse(build.called)
+        shipper.flush()
+        self.assertEqual(logstash.sent, [b'recipe Dal\n'])
+
+    def test_records_shipped_in_batches(self):
+        tests = [
+            # (records queued, batch size, expected sends)
+            (1, 10, 1),
+            (10, 10, 1),
+            (25, 10, 3),
+        ]
+        for count, batch_size, sends in tests:
+            logstash = FakeLogstashHandler()
+            shipper = LogShipper(logstash, batch_size=batch_size)
+            for i in range(count):
+                shipper.put(make_record('record %d', i))
+            shipper.flush()
+            self.assertEqual(len(logstash.sent), sends)
+            self.assertEqual(b''.join(logstash.sent).count(b'\n'), count)
+
+    def test_lazy_only_built_when_logged(self):
+        build = mock.Mock(return_value={'recipe_name': 'Dal'})
+        logger = logging.getLogger('uggipuggi.tests.lazy')
+        logger.setLevel(logging.INFO)
+        logger.debug("%s", lazy(build))
+        self.assertFalse(build.called)
+        self.assertEqual(make_record("%s", lazy(build)).getMessage(), "{'recipe_name': 'Dal'}")
+        build.assert_called_once_with()
+
+    def test_request_id_filter(self):
+        record_filter = RequestIdFilter()
+        results = {}
+
+        def log(request_id):
+            set_request_id(request_id)
+            record = make_record('hello')
+            record_filter.filter(record)
+            results[request_id] = record.request_id
+
+        threads = [threading.Thread(target=log, args=('req_%d' %i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {'req_%d' %i: 'req_%d' %i for i in range(4)})
@@ -4,7 +4,9 @@ from __future__ import absolute_import
 from falcon import testing
 import colander
 import mock
-from uggipuggi.helpers.schema import CommaList, CommaIntList
+from uggipuggi.helpers.schema import CommaList, CommaIntList, compile_schema, partial
+from uggipuggi.controllers.schema.recipe import RecipeSchema, RecipeUpdateSchema
+from uggipuggi.controllers.schema.rating import RecipeRatingSchema
 
 dummy = mock.Mock()
 
@@ -51,3 +53,44 @@ class TestCommaIntList(testing.TestBase):
                 self.assertIsNone(CommaIntList.is_int_list(dummy, t['list']))  # passes validation
 
 
+
+
+RECIPE = {'recipe_name': 'dal', 'steps': ['boil', 'fry'], 'ingredients': ['dal', 'salt'],
+          'ingredients_quant': [1, 0.5], 'ingredients_metric': ['cup', 'tsp'], 'category': 1}
+
+
+class TestCompiledSchema(testing.TestBase):
+
+    def test_same_as_interpreted(self):
+        tests = [
+            {'schema': RecipeSchema(), 'cstruct': RECIPE},
+            {'schema': RecipeSchema(), 'cstruct': dict(RECIPE, category='2', cook_time='20',
+                                                       ingredients_quant=['1.5', 2],
+                                                       comments_disabled='true', likes_count=100)},
+            {'schema': RecipeSchema(), 'cstruct': dict(RECIPE, images=['https://a.com/b.jpg'], description='')},
+            {'schema': RecipeSchema(), 'cstruct': {'recipe_name': ''}},
+            {'schema': RecipeSchema(), 'cstruct': dict(RECIPE, steps='boil', category='one', images=['not a url'])},
+            {'schema': RecipeSchema(), 'cstruct': dict(RECIPE, description='x' * 1001, steps=['boil', None])},
+            {'schema': RecipeSchema(), 'cstruct': ['not', 'a', 'mapping']},
+            {'schema': partial(RecipeUpdateSchema()), 'cstruct': {'cook_time': 10}},
+            {'schema': partial(RecipeUpdateSchema()), 'cstruct': {'comment': {'user_id': 'u1', 'content': 'yum'}}},
+            {'schema': RecipeRatingSchema(), 'cstruct': {'user_id': 'u1', 'rating': 4}},
+            {'schema': RecipeRatingSchema(), 'cstruct': {'user_id': 'u1', 'rating': 7.5}},
+            {'schema': RecipeRatingSchema(), 'cstruct': {'user_id': 'u1'}},
+        ]
+        for t in tests:
+            compiled = compile_schema(t['schema'])
+            try:
+                expected = t['schema'].deserialize(t['cstruct'])
+            except colander.Invalid as e:
+                with self.assertRaises(colander.Invalid) as cm:
+                    compiled.deserialize(t['cstruct'])
+                self.assertEqual(cm.exception.asdict(), e.asdict())
+            else:
+                self.assertEqual(compiled.deserialize(t['cstruct']), expected)
+
+    def test_partial(self):
+        schema = partial(RecipeSchema())
+        self.assertEqual(schema.deserialize({}), {})
+        # the original schema is left alone
+        self.assertRaises(colander.Invalid, RecipeSchema().deserialize, {})
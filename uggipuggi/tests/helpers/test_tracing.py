@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import falcon
+import mock
+import opentracing
+from falcon import testing
+from opentracing.mocktracer import MockTracer
+from jaeger_client import Tracer as JaegerTracer
+from jaeger_client.reporter import InMemoryReporter
+from jaeger_client.sampler import ConstSampler
+from uggipuggi.helpers.tracing import child_span, MongoCommandTracer
+from uggipuggi.middlewares.tracing import TracingMiddleware
+
+
+class Resource(object):
+    def on_get(self, req, resp, id):
+        with child_span('redis.hgetall'):
+            pass
+        resp.media = {}
+
+
+def make_command_event(request_id, command_name='find'):
+    return mock.Mock(request_id=request_id, connection_id=('mongo', 27017),
+                     command_name=command_name, database_name='uprecipes',
+                     command={command_name: 'recipe'}, failure={'errmsg': 'boom'})
+
+
+class TestTracing(testing.TestBase):
+
+    def setUp(self):
+        self.tracer = MockTracer()
+        patcher = mock.patch('opentracing.tracer', self.tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_child_span_without_request_span(self):
+        with child_span('redis.get') as span:
+            self.assertIsNone(span)
+        self.assertEqual(self.tracer.finished_spans(), [])
+
+    def test_child_span_tracing_disabled(self):
+        with mock.patch('opentracing.tracer', opentracing.Tracer()):
+            with child_span('redis.get') as span:
+                self.assertIsNone(span)
+
+    def test_child_span_of_active_span(self):
+        with self.tracer.start_active_span('GET /feed') as scope:
+            with child_span('redis.pipeline', tags={'redis.commands': 3}) as span:
+                self.assertIsNotNone(span)
+        child, parent = self.tracer.finished_spans()
+        self.assertEqual(child.parent_id, scope.span.context.span_id)
+        self.assertEqual(child.tags['redis.commands'], 3)
+
+    def test_no_child_spans_when_not_sampled(self):
+        reporter = InMemoryReporter()
+        tracer = JaegerTracer('test', reporter, ConstSampler(False))
+        with mock.patch('opentracing.tracer', tracer):
+            with tracer.start_active_span('GET /feed'):
+                with child_span('redis.get') as span:
+                    self.assertIsNone(span)
+        tracer.close()
+
+    def test_middleware_span_per_route(self):
+        app = falcon.API(middleware=[TracingMiddleware(self.tracer)])
+        app.add_route('/recipes/{id}', Resource())
+        client = testing.TestClient(app)
+        client.simulate_get('/recipes/5ea6f8ba8b5c1f0001ee5c31')
+        child, server = self.tracer.finished_spans()
+        self.assertEqual(server.operation_name, 'GET /recipes/{id}')
+        self.assertEqual(server.tags['http.status_code'], '200')
+        self.assertEqual(child.operation_name, 'redis.hgetall')
+        self.assertEqual(child.parent_id, server.context.span_id)
+        self.assertIsNone(self.tracer.active_span)
+
+    def test_mongo_command_spans(self):
+        listener = MongoCommandTracer()
+        tests = [
+            # (command events, finishing callback, error tag expected)
+            (make_command_event(1), listener.succeeded, False),
+            (make_command_event(2, 'insert'), listener.failed, True),
+        ]
+        with self.tracer.start_active_span('POST /recipes'):
+            for event, finish, error in tests:
+                listener.started(event)
+                finish(event)
+                span = self.tracer.finished_spans()[-1]
+                self.assertEqual(span.operation_name, 'mongo.' + event.command_name)
+                self.assertEqual(span.tags['mongo.collection'], 'recipe')
+                self.assertEqual(span.tags.get('error', False), error)
+        self.assertEqual(listener._spans, {})
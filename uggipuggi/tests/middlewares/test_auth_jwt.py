@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from falcon import testing
+import falcon
+import jwt
+import mock
+from uggipuggi.middlewares import auth_jwt
+from uggipuggi.middlewares.policy import attach_route_policy
+from uggipuggi.models.user import Role
+from uggipuggi.services.identity import Identity
+
+SECRET = 'uggipuggi'
+PHONE_LAST_VERIFIED = '2020-05-01 10:00:00'
+
+
+def make_token(user_id, secret=SECRET):
+    return jwt.encode({'user_identifier': user_id,
+                       'exp': datetime.utcnow() + timedelta(seconds=60),
+                       'phone_last_verified': PHONE_LAST_VERIFIED},
+                      secret, algorithm='HS256').decode('utf-8')
+
+
+def make_req(token, path='/feed', method='GET'):
+    req = mock.Mock()
+    req.method = method
+    req.path = path
+    req.uri_template = path
+    req.url = 'http://uggipuggi' + path
+    req.context = falcon.Request.context_type()
+    req.get_header.return_value = token
+    return req
+
+
+class Resource(object):
+    pass
+
+
+def make_resource(template='/feed', **kwargs):
+    resource = Resource()
+    attach_route_policy(resource, template, **kwargs)
+    return resource
+
+
+def fake_get_identity(user_id, get_user=None):
+    return Identity(user_id, phone_last_verified=PHONE_LAST_VERIFIED)
+
+
+class TestAuthMiddlewareThreadSafety(testing.TestBase):
+
+    def setUp(self):
+        self.middleware = auth_jwt.AuthMiddleware(mock.Mock(), SECRET, name='auth_token', location='header')
+
+    @mock.patch('uggipuggi.middlewares.auth_jwt.get_identity', side_effect=fake_get_identity)
+    def test_concurrent_requests(self, _):
+        # Every request must end up with its own user, whatever the interleaving
+        user_ids = ['user_%d' % i for i in range(200)]
+        reqs = [make_req(make_token(user_id)) for user_id in user_ids]
+
+        resource = make_resource()
+
+        def authenticate(req):
+            self.middleware.process_resource(req, mock.Mock(), resource, {})
+            return req
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            done = list(pool.map(authenticate, reqs))
+
+        for user_id, req in zip(user_ids, done):
+            self.assertEqual(req.context.user_id, user_id)
+            self.assertEqual(req.context.auth_claims['user_identifier'], user_id)
+            self.assertEqual(req.context.identity.user_id, user_id)
+        self.assertFalse(hasattr(self.middleware, 'decoded'))
+
+    @mock.patch('uggipuggi.middlewares.auth_jwt.get_identity', side_effect=fake_get_identity)
+    def test_invalid_token(self, _):
+        tests = [
+            {'token': make_token('user_1', secret='not_the_secret')},
+            {'token': 'garbage'},
+        ]
+        for t in tests:
+            req = make_req(t['token'])
+            self.assertRaises(falcon.HTTPUnauthorized, self.middleware.process_resource,
+                              req, mock.Mock(), make_resource(), {})
+
+
+class TestRoutePolicy(testing.TestBase):
+
+    def setUp(self):
+        self.middleware = auth_jwt.AuthMiddleware(mock.Mock(), SECRET, name='auth_token', location='header')
+
+    @mock.patch('uggipuggi.middlewares.auth_jwt.get_identity', side_effect=fake_get_identity)
+    def test_policy(self, _):
+        acl_map = {'/feed': {'get': Role.USER}, '/users': {'delete': Role.ADMIN}}
+        tests = [
+            {'template': '/feed', 'method': 'GET', 'token': make_token('user_1'), 'allowed': True},
+            {'template': '/feed', 'method': 'PUT', 'token': make_token('user_1'), 'allowed': True},
+            {'template': '/users', 'method': 'DELETE', 'token': make_token('user_1'), 'allowed': False},
+            # no policy for the template: fail closed, even with a valid token
+            {'template': '/batch/recipes', 'method': 'POST', 'token': make_token('user_1'), 'allowed': False},
+            # public routes don't look at the token at all
+            {'template': '/ping', 'method': 'GET', 'token': None, 'allowed': True},
+            {'template': '/images/{id}', 'method': 'GET', 'token': None, 'allowed': True},
+            {'template': '/images/{id}', 'method': 'POST', 'token': None, 'allowed': False},
+        ]
+        for t in tests:
+            resource = make_resource(t['template'], acl_map=acl_map)
+            req = make_req(t['token'], path=t['template'], method=t['method'])
+            if t['allowed']:
+                self.middleware.process_resource(req, mock.Mock(), resource, {})
+            else:
+                self.assertRaises(falcon.HTTPError, self.middleware.process_resource,
+                                  req, mock.Mock(), resource, {})
+
+    def test_resource_without_policy(self):
+        req = make_req(make_token('user_1'))
+        self.assertRaises(falcon.HTTPUnauthorized, self.middleware.process_resource,
+                          req, mock.Mock(), Resource(), {})
+
+
+class Echo(object):
+    # Stands in for the real resources, answers with the user the middleware set
+    def on_put(self, req, resp, id):
+        resp.media = {'user_id': req.context.user_id}
+        resp.status = falcon.HTTP_OK
+
+    on_post = on_put
+
+
+class TestRoutedPolicy(testing.TestBase):
+    # Requests go through falcon's routing and the middleware, with the real ACL_MAP
+
+    def setUp(self):
+        super(TestRoutedPolicy, self).setUp()
+        self.middleware = auth_jwt.AuthMiddleware(mock.Mock(), SECRET, name='auth_token', location='header')
+        self.app = falcon.API(middleware=[self.middleware])
+        self.client = testing.TestClient(self.app)
+
+    @mock.patch('uggipuggi.middlewares.auth_jwt.get_identity', side_effect=fake_get_identity)
+    def test_routes(self, _):
+        tests = [
+            # (template, path, method, token, status)
+            ('/following/{id}/bulk', '/following/user_1/bulk', 'PUT', make_token('user_1'), falcon.HTTP_OK),
+            ('/following/{id}/bulk', '/following/user_1/bulk', 'PUT', None, falcon.HTTP_BAD_REQUEST),
+            ('/contacts/{id}/sync', '/contacts/user_1/sync', 'POST', make_token('user_1'), falcon.HTTP_OK),
+        ]
+        for template, path, method, token, status in tests:
+            resource = Echo()
+            attach_route_policy(resource, template)
+            self.app.add_route(template, resource)
+            headers = {'auth_token': token} if token else {}
+            result = self.client.simulate_request(method, path, headers=headers)
+            self.assertEqual(result.status, status)
+            if status == falcon.HTTP_OK:
+                self.assertEqual(result.json, {'user_id': 'user_1'})
+
+
+class TestAddNewJWToken(testing.TestBase):
+
+    def test_token_opts_not_mutated(self):
+        resource = auth_jwt.VerifyPhoneResource(mock.Mock(), SECRET, 60, name='auth_token', location='header')
+        token_opts = dict(resource.token_opts)
+        for user_id in ['user_1', 'user_2']:
+            resp = mock.Mock()
+            resp.body = {}
+            resource.add_new_jwtoken(resp, user_id, phone_last_verified=PHONE_LAST_VERIFIED)
+            self.assertEqual(resp.body['user_identifier'], user_id)
+            self.assertEqual(jwt.decode(resp.body['auth_token'], SECRET, algorithms=['HS256'])['user_identifier'],
+                             user_id)
+        self.assertDictEqual(resource.token_opts, token_opts)
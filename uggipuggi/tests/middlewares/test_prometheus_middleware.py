@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import falcon
+from falcon import testing
+from uggipuggi.middlewares.prometheus_middleware import PrometheusMiddleware, registry
+
+
+class Resource(object):
+    def on_get(self, req, resp, id):
+        resp.data = b'x' * 250
+
+
+class TestPrometheusMiddleware(testing.TestBase):
+
+    def setUp(self):
+        self.middleware = PrometheusMiddleware()
+        app = falcon.API(middleware=[self.middleware])
+        app.add_route('/recipes/{id}', Resource())
+        app.add_route('/metrics', self.middleware)
+        self.client = testing.TestClient(app)
+
+    def sample(self, name, **labels):
+        return registry.get_sample_value(name, labels) or 0
+
+    def test_labelled_by_route_template(self):
+        before = self.sample('http_total_request_total', method='GET', route='/recipes/{id}', status='200')
+        latency_before = self.sample('http_request_duration_seconds_count', method='GET', route='/recipes/{id}')
+        size_before = self.sample('http_response_size_bytes_sum', method='GET', route='/recipes/{id}')
+        for id in ['5ea6f8ba8b5c1f0001ee5c31', '5ea6f8ba8b5c1f0001ee5c32', '5ea6f8ba8b5c1f0001ee5c33']:
+            self.client.simulate_get('/recipes/' + id)
+        self.assertEqual(self.sample('http_total_request_total', method='GET',
+                                     route='/recipes/{id}', status='200') - before, 3)
+        self.assertEqual(self.sample('http_request_duration_seconds_count', method='GET',
+                                     route='/recipes/{id}') - latency_before, 3)
+        self.assertEqual(self.sample('http_response_size_bytes_sum', method='GET',
+                                     route='/recipes/{id}') - size_before, 750)
+        self.assertEqual(self.sample('http_requests_in_flight'), 0)
+
+    def test_unmatched_route(self):
+        before = self.sample('http_total_request_total', method='GET', route='unmatched', status='404')
+        self.client.simulate_get('/no/such/path')
+        self.assertEqual(self.sample('http_total_request_total', method='GET',
+                                     route='unmatched', status='404') - before, 1)
+
+    def test_metrics_endpoint(self):
+        self.client.simulate_get('/recipes/5ea6f8ba8b5c1f0001ee5c31')
+        result = self.client.simulate_get('/metrics')
+        self.assertEqual(result.status, falcon.HTTP_OK)
+        self.assertIn('http_request_duration_seconds_bucket', result.text)
+        self.assertNotIn('5ea6f8ba8b5c1f0001ee5c31', result.text)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import falcon
+from falcon import testing
+from uggipuggi.helpers.logs_metrics import get_request_id
+from uggipuggi.middlewares.request_id import RequestIdMiddleware, MAX_REQUEST_ID_LENGTH
+
+
+class Resource(object):
+    def on_get(self, req, resp):
+        resp.media = {'context': req.context.request_id, 'logging': get_request_id()}
+
+
+class TestRequestIdMiddleware(testing.TestBase):
+
+    def setUp(self):
+        app = falcon.API(middleware=[RequestIdMiddleware()])
+        app.add_route('/ping', Resource())
+        self.client = testing.TestClient(app)
+
+    def test_request_id(self):
+        tests = [
+            # (X-Request-ID sent, expected id, or None for a generated one)
+            (None, None),
+            ('abc123', 'abc123'),
+            ('x' * 200, 'x' * MAX_REQUEST_ID_LENGTH),
+        ]
+        for sent, expected in tests:
+            headers = {'X-Request-ID': sent} if sent else {}
+            result = self.client.simulate_get('/ping', headers=headers)
+            request_id = result.headers['X-Request-ID']
+            if expected is None:
+                self.assertEqual(len(request_id), 32)
+            else:
+                self.assertEqual(request_id, expected)
+            self.assertEqual(result.json, {'context': request_id, 'logging': request_id})
+            self.assertIsNone(get_request_id())
+
+    def test_generated_ids_unique(self):
+        ids = {self.client.simulate_get('/ping').headers['X-Request-ID'] for _ in range(10)}
+        self.assertEqual(len(ids), 10)
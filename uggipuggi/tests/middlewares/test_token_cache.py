@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from datetime import datetime, timedelta
+from falcon import testing
+import jwt
+import mock
+from uggipuggi.middlewares import token_cache
+
+SECRET = 'uggipuggi'
+
+
+def make_token(user_id, expires_in=60, secret=SECRET):
+    return jwt.encode({'user_identifier': user_id,
+                       'exp': datetime.utcnow() + timedelta(seconds=expires_in)},
+                      secret, algorithm='HS256').decode('utf-8')
+
+
+@mock.patch('uggipuggi.middlewares.token_cache.invalidation_bus')
+class TestTokenCache(testing.TestBase):
+
+    def setUp(self):
+        token_cache.token_cache.clear()
+
+    def test_decoded_once(self, _):
+        token = make_token('user_1')
+        with mock.patch('uggipuggi.middlewares.token_cache.jwt.decode', wraps=jwt.decode) as decode:
+            for _ in range(3):
+                claims = token_cache.decode_token(token, SECRET)
+                self.assertEqual(claims['user_identifier'], 'user_1')
+            self.assertEqual(decode.call_count, 1)
+
+    def test_entry_expires_with_token(self, _):
+        token = make_token('user_1', expires_in=30)
+        token_cache.decode_token(token, SECRET)
+        value, expires_at = token_cache.token_cache._data[token_cache.token_digest(token)]
+        self.assertLessEqual(expires_at - token_cache.token_cache._timer(), 30)
+
+    def test_invalid_tokens_not_cached(self, _):
+        tests = [
+            {'token': make_token('user_1', secret='not_the_secret')},
+            {'token': make_token('user_1', expires_in=-10)},
+            {'token': 'garbage'},
+        ]
+        for t in tests:
+            self.assertRaises(jwt.InvalidTokenError, token_cache.decode_token, t['token'], SECRET)
+            self.assertFalse(token_cache.token_digest(t['token']) in token_cache.token_cache)
+
+    def test_revoke(self, bus):
+        token = make_token('user_1')
+        token_cache.decode_token(token, SECRET)
+        digest = token_cache.token_digest(token)
+        token_cache.revoke_token(digest)
+        self.assertFalse(digest in token_cache.token_cache)
+        bus.publish.assert_called_once_with(token_cache.TOKEN_REVOCATION_CHANNEL, digest, None)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from falcon import testing
+import mock
+from uggipuggi.constants import CONCISE_INVALIDATION_CHANNEL
+from uggipuggi.services import concise_cache
+
+RECIPE_HASH = {'recipe_name': 'Dal', 'likes_count': '3', 'images': '["https://img/1"]', '_v': '2'}
+ACTIVITY_HASH = {'recipe_name': 'Dal', 'likes_count': '1', 'images': '[]'}
+
+
+def make_redis(hashes):
+    redis_conn = mock.Mock()
+    pipeline = redis_conn.pipeline.return_value
+    fetched = []
+    pipeline.hgetall.side_effect = fetched.append
+    pipeline.execute.side_effect = lambda: [hashes.get(key, {}) for key in fetched]
+    return redis_conn, fetched
+
+
+@mock.patch('uggipuggi.services.concise_cache.invalidation_bus')
+class TestConciseCache(testing.TestBase):
+
+    def setUp(self):
+        concise_cache.concise_cache.clear()
+
+    def test_read_through(self, _):
+        redis_conn, fetched = make_redis({'r:1': RECIPE_HASH, 'act:1': ACTIVITY_HASH})
+        tests = [
+            # (keys, fetched from redis)
+            (['r:1', 'act:1'], ['r:1', 'act:1']),
+            (['r:1', 'act:1', 'r:2'], ['r:2']),
+            # deleted items aren't cached
+            (['r:2'], ['r:2']),
+        ]
+        for keys, expected in tests:
+            del fetched[:]
+            views = concise_cache.get_concise_views(redis_conn, keys)
+            self.assertEqual(fetched, expected)
+            self.assertEqual(set(views), set(keys))
+        self.assertEqual(views['r:2'], {})
+        views = concise_cache.get_concise_views(redis_conn, ['r:1', 'act:1'])
+        self.assertEqual(views['r:1'], {'recipe_name': 'Dal', 'likes_count': 3, 'images': ['https://img/1']})
+        self.assertEqual(views['act:1']['likes_count'], 1)
+
+    def test_get_concise_values(self, _):
+        redis_conn, _ = make_redis({'r:1': RECIPE_HASH})
+        self.assertEqual(concise_cache.get_concise_values(redis_conn, ['r:1', 'r:2'], ('images', 'likes_count')),
+                         [[['https://img/1'], 3], [None, None]])
+
+    def test_invalidate(self, invalidation_bus):
+        redis_conn, fetched = make_redis({'r:1': RECIPE_HASH})
+        concise_cache.get_concise_views(redis_conn, ['r:1'])
+        concise_cache.invalidate_concise_view('r:1', redis_conn)
+        invalidation_bus.publish.assert_called_once_with(CONCISE_INVALIDATION_CHANNEL, 'r:1', redis_conn)
+        del fetched[:]
+        concise_cache.get_concise_views(redis_conn, ['r:1'])
+        self.assertEqual(fetched, ['r:1'])
+
+    def test_not_cached_when_invalidated_while_reading(self, _):
+        redis_conn, fetched = make_redis({'r:1': RECIPE_HASH})
+        execute = redis_conn.pipeline.return_value.execute.side_effect
+
+        def invalidated_meanwhile():
+            concise_cache._evict('r:1')
+            return execute()
+        redis_conn.pipeline.return_value.execute.side_effect = invalidated_meanwhile
+        concise_cache.get_concise_views(redis_conn, ['r:1'])
+        self.assertNotIn('r:1', concise_cache.concise_cache)
+
+    def test_warm_up(self, _):
+        redis_conn, _ = make_redis({'r:1': RECIPE_HASH, 'r:2': RECIPE_HASH})
+        redis_conn.zrevrange.return_value = ['r:2', 'r:1']
+        concise_cache.warm_up(redis_conn, count=2)
+        redis_conn.zrevrange.assert_called_once_with('p_recipes', 0, 1)
+        self.assertEqual(len(concise_cache.concise_cache), 2)
+        # Redis being down doesn't stop the worker from starting
+        redis_conn.zrevrange.side_effect = ConnectionError()
+        concise_cache.warm_up(redis_conn)
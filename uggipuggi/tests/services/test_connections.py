@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.helpers.tracing import TracedRedis, TracedProducer
+from uggipuggi.services.connections import ConnectionManager, ConnectionPoolCollector
+
+CONFIG = {
+    'redis': {'host': 'redis', 'port': '6379', 'db': '0', 'max_connections': '20', 'pool_timeout': '1'},
+    'kafka': {'kafka_bootstrap_servers': 'kafka:9092', 'linger_ms': '10'},
+    'mongodb': {'name': 'uprecipes', 'host': 'mongo', 'port': '27017', 'max_pool_size': '10'},
+}
+
+
+class TestConnectionManager(testing.TestBase):
+
+    def setUp(self):
+        self.manager = ConnectionManager(CONFIG)
+
+    def test_one_client_per_process(self):
+        redis_conn = self.manager.redis
+        producer = self.manager.kafka_producer
+        self.assertIsInstance(redis_conn, TracedRedis)
+        self.assertIsInstance(producer, TracedProducer)
+        self.assertIs(self.manager.redis, redis_conn)
+        self.assertIs(self.manager.kafka_producer, producer)
+        # A forked child gets its own clients, without hooks too
+        with mock.patch('uggipuggi.services.connections.os.getpid', return_value=-1):
+            self.assertIsNot(self.manager.redis, redis_conn)
+            self.assertIsNot(self.manager.kafka_producer, producer)
+
+    def test_redis_pool_from_config(self):
+        pool = self.manager.redis.connection_pool
+        self.assertEqual(pool.max_connections, 20)
+        self.assertEqual(pool.timeout, 1.0)
+        self.assertEqual(pool.connection_kwargs['host'], 'redis')
+        self.assertTrue(pool.connection_kwargs['decode_responses'])
+
+    @mock.patch('uggipuggi.services.connections.mongo_connection')
+    def test_mongo_connected_lazily_once(self, mongo_connection):
+        for _ in range(3):
+            self.manager.connect_mongo()
+        self.assertEqual(mongo_connection.connect.call_count, 1)
+        args, kwargs = mongo_connection.connect.call_args
+        self.assertEqual(args, ('uprecipes',))
+        self.assertFalse(kwargs['connect'])
+        self.assertEqual(kwargs['maxPoolSize'], 10)
+        self.assertEqual(kwargs['port'], 27017)
+        # after_fork replaces the parent's client straight away
+        self.manager.after_fork()
+        self.assertEqual(mongo_connection.connect.call_count, 2)
+
+    def test_pool_stats_collector(self):
+        tests = [
+            # (clients created, expected samples)
+            ([], []),
+            (['redis', 'kafka'], [('redis_pool_connections', {'state': 'in_use'}, 0),
+                                  ('redis_pool_connections', {'state': 'idle'}, 0),
+                                  ('redis_pool_max_connections', {}, 20),
+                                  ('kafka_producer_queued_messages', {}, 0)]),
+        ]
+        for created, expected in tests:
+            manager = ConnectionManager(CONFIG)
+            for name in created:
+                getattr(manager, 'redis' if name == 'redis' else 'kafka_producer')
+            samples = [(sample.name, {k: v for k, v in sample.labels.items() if k != 'pid'}, sample.value)
+                       for metric in ConnectionPoolCollector(manager).collect() for sample in metric.samples]
+            self.assertEqual(samples, expected)
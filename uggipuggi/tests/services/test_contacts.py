@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import CONTACTS, CONTACTS_DIGEST, CONTACTS_SYNC_LOCK, CONTACTS_WAITING,\
+                                CONTACTS_JOINED, CONTACTS_PENDING, CONTACTS_CHUNK_SIZE
+from uggipuggi.services.contacts import normalize_number, normalize_numbers, resolve_numbers,\
+                                        book_digest, sync_contacts, SyncInProgress, add_joined_user
+
+USER_ID = '5ea6f8ba8b5c1f0001ee5c40'
+
+
+class TestContacts(testing.TestBase):
+
+    def test_normalize_number(self):
+        tests = [
+            # (number, country code of the address book, E.164)
+            ('+44 7911 123456', None, '+447911123456'),
+            ('0044-7911-123456', None, '+447911123456'),
+            ('(0)7911 123.456', '44', '+447911123456'),
+            ('07911123456', '+44', '+447911123456'),
+            ('9876543210', '91', '+919876543210'),
+            ('07911123456', None, None),
+            ('+44 12', None, None),
+            ('+0447911123456', None, None),
+            ('+4479111234567890', None, None),
+            ('call me', '44', None),
+        ]
+        for number, country_code, e164 in tests:
+            self.assertEqual(normalize_number(number, country_code), e164, number)
+
+    def test_normalize_numbers(self):
+        self.assertEqual(normalize_numbers(['+447911123456', '00447911123456', 'x']),
+                         ({'+447911123456'}, ['x']))
+
+    def test_resolve_numbers(self):
+        with mock.patch('uggipuggi.services.contacts.lookup_phones') as lookup_phones:
+            lookup_phones.return_value = ['u1', None, 'u3']
+            self.assertEqual(resolve_numbers(mock.Mock(), iter(['+441', '+442', '+443'])),
+                             {'+441': 'u1', '+443': 'u3'})
+
+    def test_book_digest(self):
+        self.assertEqual(book_digest(['+442', '+441']), book_digest(iter(['+441', '+442'])))
+        self.assertNotEqual(book_digest(['+441']), book_digest(['+441', '+442']))
+        # Updated from the numbers added and removed
+        self.assertEqual(book_digest(['+442'], book_digest(['+441'])), book_digest(['+441', '+442']))
+        self.assertEqual(book_digest(['+442'], book_digest(['+441', '+442'])), book_digest(['+441']))
+        self.assertEqual(book_digest([]), '0' * 40)
+
+    def test_delta_sync(self):
+        # Only the numbers of the delta are looked at, the book and pending set aren't scanned
+        digest = book_digest(['+447911000001', '+447911000002'])
+        redis_conn = mock.Mock()
+        redis_conn.set.return_value = True
+        redis_conn.get.return_value = digest
+        pipeline = redis_conn.pipeline.return_value
+        pipeline.execute.side_effect = [
+            # in the book, sorted added numbers then removed: 0001 was added before, 0002 is removed
+            [True, False, False, True],
+            None,
+            # joined since the last sync
+            [{'u9'}, 1],
+        ]
+        resolved = {'+447911000003': 'u3', '+447911000002': 'u2'}
+        with mock.patch('uggipuggi.services.contacts.resolve_numbers',
+                        side_effect=lambda r, numbers, chunk_size: {n: resolved[n] for n in numbers if n in resolved}), \
+             mock.patch('uggipuggi.services.contacts.to_uids', side_effect=lambda r, ids: [int(i[1:]) for i in ids]):
+            result = sync_contacts(redis_conn, USER_ID, digest=digest,
+                                   added=['+447911000003', '+447911000001', '+447911000004'],
+                                   removed=['+447911000002'])
+        self.assertFalse(redis_conn.sscan_iter.called)
+        self.assertEqual(result['digest'], book_digest(['+447911000001', '+447911000003', '+447911000004']))
+        self.assertEqual(result['added_contacts'], ['u3'])
+        self.assertEqual(result['removed_contacts'], ['u2'])
+        self.assertEqual(result['joined_contacts'], ['u9'])
+        pipeline.sadd.assert_any_call(CONTACTS_WAITING + '+447911000004', USER_ID)
+        pipeline.set.assert_called_once_with(CONTACTS_DIGEST + USER_ID, result['digest'])
+
+    def test_add_joined_user(self):
+        redis_conn = mock.Mock()
+        redis_conn.sscan_iter.return_value = iter(['w1', USER_ID])
+        pipeline = redis_conn.pipeline.return_value
+        with mock.patch('uggipuggi.services.contacts.to_uids', return_value=[7]):
+            self.assertEqual(add_joined_user(redis_conn, USER_ID, '00447911123456'), 2)
+        redis_conn.sscan_iter.assert_called_once_with(CONTACTS_WAITING + '+447911123456',
+                                                      count=CONTACTS_CHUNK_SIZE)
+        # Not a contact of themselves
+        pipeline.sadd.assert_has_calls([mock.call(CONTACTS + 'w1', 7),
+                                        mock.call(CONTACTS_JOINED + 'w1', USER_ID)])
+        self.assertEqual(pipeline.sadd.call_count, 2)
+        pipeline.srem.assert_any_call(CONTACTS_PENDING + 'w1', '+447911123456')
+        redis_conn.delete.assert_called_once_with(CONTACTS_WAITING + '+447911123456')
+
+    def test_sync_conflict(self):
+        tests = [
+            # (digest sent, digest stored)
+            ('abc', 'def'),
+            (None, 'def'),
+            ('abc', None),
+        ]
+        for digest, stored in tests:
+            redis_conn = mock.Mock()
+            redis_conn.set.return_value = True
+            redis_conn.get.side_effect = lambda key: stored if key == CONTACTS_DIGEST + USER_ID else None
+            self.assertIsNone(sync_contacts(redis_conn, USER_ID, digest=digest, added=['+447911123456']))
+            self.assertFalse(redis_conn.pipeline.called)
+            # Released with the token it was taken with
+            token = redis_conn.set.call_args[0][1]
+            redis_conn.register_script.return_value.assert_called_once_with(
+                keys=[CONTACTS_SYNC_LOCK + USER_ID], args=[token])
+
+    def test_sync_in_progress(self):
+        # Another sync holds the lock, it's neither released nor reported as a conflict
+        redis_conn = mock.Mock()
+        redis_conn.set.return_value = None
+        self.assertRaises(SyncInProgress, sync_contacts, redis_conn, USER_ID, digest='abc',
+                          added=['+447911123456'])
+        self.assertFalse(redis_conn.register_script.called)
+        self.assertFalse(redis_conn.delete.called)
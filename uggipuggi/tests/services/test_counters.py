@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from bson import ObjectId
+from falcon import testing
+from uggipuggi.constants import RECIPE, COUNTER_DELTAS
+from uggipuggi.helpers.keys import counter_flush_key, counter_batches_key
+from uggipuggi.services.counters import incr_counter, batch_updates, flush
+
+RECIPE_ID = '5ea6f8ba8b5c1f0001ee5c31'
+OTHER_ID = '5ea6f8ba8b5c1f0001ee5c32'
+
+
+class TestCounters(testing.TestBase):
+
+    def test_incr_counter(self):
+        pipeline = mock.Mock()
+        incr_counter(pipeline, RECIPE + RECIPE_ID, 'likes_count', -1)
+        pipeline.hincrby.assert_has_calls([mock.call(RECIPE + RECIPE_ID, 'likes_count', -1),
+                                           mock.call(COUNTER_DELTAS + RECIPE, RECIPE_ID + ':likes_count', -1)])
+        self.assertEqual(pipeline.hsetnx.call_args[0][:2], (COUNTER_DELTAS + RECIPE, '_since'))
+
+    def test_batch_updates(self):
+        batch = {'_batch': '7', '_since': '1588000000.5',
+                 RECIPE_ID + ':likes_count': '3', RECIPE_ID + ':saves_count': '-1',
+                 OTHER_ID + ':likes_count': '0', 'not-an-id:likes_count': '2'}
+        updates, since = batch_updates(batch)
+        self.assertEqual(since, 1588000000.5)
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0]._filter, {'_id': ObjectId(RECIPE_ID), 'counters_batch': {'$ne': 7}})
+        self.assertEqual(updates[0]._doc, {'$inc': {'likes_count': 3, 'saves_count': -1},
+                                           '$set': {'counters_batch': 7}})
+
+    def test_flush(self):
+        tests = [
+            # (batch taken from redis, bulk_write batch sizes, documents updated)
+            ([], [], 0),
+            (['_batch', '1', '_since', '1588000000', RECIPE_ID + ':likes_count', '1',
+              OTHER_ID + ':likes_count', '2'], [1, 1], 2),
+        ]
+        for values, bulk_sizes, expected in tests:
+            redis_conn = mock.Mock()
+            script = redis_conn.register_script.return_value
+            script.return_value = values
+            collection = mock.Mock()
+            collection.bulk_write.return_value.modified_count = 1
+            with mock.patch('uggipuggi.models.recipe.Recipe._get_collection', return_value=collection):
+                updated, lag = flush(redis_conn, RECIPE, batch_size=1)
+            script.assert_called_once_with(keys=[COUNTER_DELTAS + RECIPE, counter_flush_key(RECIPE),
+                                                 counter_batches_key(RECIPE)])
+            self.assertEqual(updated, expected)
+            self.assertEqual([len(call[0][0]) for call in collection.bulk_write.call_args_list], bulk_sizes)
+            if values:
+                self.assertGreater(lag, 0)
+                # Only deleted once applied
+                redis_conn.delete.assert_called_once_with(counter_flush_key(RECIPE))
+            else:
+                self.assertIsNone(lag)
+                self.assertFalse(redis_conn.delete.called)
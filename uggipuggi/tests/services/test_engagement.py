@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import RECIPE, ACTIVITY, USER_SAVED_RECIPES, COUNTER_DELTAS,\
+                                ENGAGEMENT_EVENTS, ENGAGEMENT_FORWARD_LOCK, CONCISE_INVALIDATION_CHANNEL
+from uggipuggi.helpers.keys import item_likes_key, item_saves_key, user_liked_key
+from uggipuggi.services.engagement import toggle_like, toggle_save, viewer_flags, backfill_liked,\
+                                          forward_events
+
+ITEM_ID = '5ea6f8ba8b5c1f0001ee5c31'
+USER_ID = '5ea6f8ba8b5c1f0001ee5c40'
+# Integer id of USER_ID, which item sets hold
+UID = 7
+UIDS = {'1': 'a', '2': 'b', '3': 'c'}
+
+
+class FakeProducer(object):
+    # As confluent_kafka's, delivery callbacks are served by flush()
+    def __init__(self, failed=(), queued=()):
+        self.failed, self.queued = failed, queued
+        self.produced, self.callbacks = [], []
+
+    def produce(self, topic, value, key, on_delivery):
+        self.produced.append((topic, value, key))
+        self.callbacks.append((value, on_delivery))
+
+    def flush(self, timeout=None):
+        for value, on_delivery in self.callbacks:
+            if value not in self.queued:
+                on_delivery('delivery failed' if value in self.failed else None, mock.Mock())
+        self.callbacks = []
+        return len(self.queued)
+
+
+class TestEngagement(testing.TestBase):
+
+    def setUp(self):
+        super(TestEngagement, self).setUp()
+        for name, fake in [('require_uid', lambda redis_conn, user_id: UID),
+                           ('to_user_ids', lambda redis_conn, uids: [UIDS[uid] for uid in uids])]:
+            patcher = mock.patch('uggipuggi.services.engagement.' + name, side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_toggle_like(self):
+        tests = [
+            # (key, liked, delta hash, script result, returned)
+            (RECIPE + ITEM_ID, True, COUNTER_DELTAS + RECIPE, [1, 4], (True, 4)),
+            (RECIPE + ITEM_ID, False, COUNTER_DELTAS + RECIPE, [1, 3], (True, 3)),
+            (ACTIVITY + ITEM_ID, True, COUNTER_DELTAS + ACTIVITY, [1, 1], (True, 1)),
+        ]
+        for key, liked, deltas, result, returned in tests:
+            redis_conn = mock.Mock()
+            script = redis_conn.register_script.return_value
+            script.return_value = result
+            with mock.patch('uggipuggi.services.engagement.invalidate_concise_view') as invalidate:
+                self.assertEqual(toggle_like(redis_conn, USER_ID, key, liked, 'topic', 'event'), returned)
+            # The user's side is written by the same script call
+            script.assert_called_once_with(
+                keys=[item_likes_key(key), key, deltas, user_liked_key(USER_ID), ENGAGEMENT_EVENTS],
+                args=[UID, int(liked), 'likes_count', ITEM_ID + ':likes_count', mock.ANY, mock.ANY, '',
+                      mock.ANY, 'topic', USER_ID, 'event', CONCISE_INVALIDATION_CHANNEL])
+            self.assertFalse(redis_conn.pipeline.called)
+            invalidate.assert_called_once_with(key, published=True)
+
+    def test_toggle_like_cluster(self):
+        tests = [
+            # (key, liked, delta hash, script result, returned)
+            (RECIPE + ITEM_ID, True, COUNTER_DELTAS + RECIPE, [1, 4], (True, 4)),
+            (RECIPE + ITEM_ID, False, COUNTER_DELTAS + RECIPE, [1, 3], (True, 3)),
+            (ACTIVITY + ITEM_ID, True, COUNTER_DELTAS + ACTIVITY, [1, 1], (True, 1)),
+        ]
+        for key, liked, deltas, result, returned in tests:
+            redis_conn = mock.Mock()
+            script = redis_conn.register_script.return_value
+            script.return_value = result
+            pipeline = redis_conn.pipeline.return_value
+            with mock.patch('uggipuggi.services.engagement.is_cluster', return_value=True), \
+                 mock.patch('uggipuggi.services.engagement.invalidate_concise_view') as invalidate:
+                self.assertEqual(toggle_like(redis_conn, USER_ID, key, liked, 'topic', 'event'), returned)
+            # The script only touches the item's slot
+            script.assert_called_once_with(keys=[item_likes_key(key), key],
+                                           args=[UID, int(liked), 'likes_count'])
+            (pipeline.sadd if liked else pipeline.srem).assert_called_once_with(user_liked_key(USER_ID), key)
+            pipeline.hincrby.assert_called_once_with(deltas, ITEM_ID + ':likes_count', 1 if liked else -1)
+            pipeline.xadd.assert_called_once_with(ENGAGEMENT_EVENTS,
+                                                  {'topic': 'topic', 'key': USER_ID, 'value': 'event'},
+                                                  maxlen=mock.ANY)
+            invalidate.assert_called_once_with(key, pipeline)
+            self.assertTrue(pipeline.execute.called)
+
+    def test_toggle_unchanged(self):
+        # Liking twice only counts once, and nothing else is written
+        for cluster in (False, True):
+            redis_conn = mock.Mock()
+            redis_conn.register_script.return_value.return_value = [0, 4]
+            with mock.patch('uggipuggi.services.engagement.is_cluster', return_value=cluster), \
+                 mock.patch('uggipuggi.services.engagement.invalidate_concise_view') as invalidate:
+                self.assertEqual(toggle_like(redis_conn, USER_ID, RECIPE + ITEM_ID, True, 'topic', 'event'),
+                                 (False, 4))
+            self.assertFalse(redis_conn.pipeline.called)
+            self.assertFalse(invalidate.called)
+
+    def test_toggle_save(self):
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        script.return_value = [1, 2]
+        with mock.patch('uggipuggi.services.engagement.invalidate_concise_view'):
+            self.assertEqual(toggle_save(redis_conn, USER_ID, ITEM_ID, True, 'topic', 'event'), (True, 2))
+        keys, args = script.call_args[1]['keys'], script.call_args[1]['args']
+        self.assertEqual(keys, [item_saves_key(ITEM_ID), RECIPE + ITEM_ID, COUNTER_DELTAS + RECIPE,
+                                USER_SAVED_RECIPES + USER_ID, ENGAGEMENT_EVENTS])
+        self.assertEqual(args[:4], [UID, 1, 'saves_count', ITEM_ID + ':saves_count'])
+        # Scored by the time saved
+        self.assertTrue(isinstance(args[6], int))
+
+    def test_toggle_save_cluster(self):
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        script.return_value = [1, 2]
+        pipeline = redis_conn.pipeline.return_value
+        with mock.patch('uggipuggi.services.engagement.is_cluster', return_value=True), \
+             mock.patch('uggipuggi.services.engagement.invalidate_concise_view'):
+            self.assertEqual(toggle_save(redis_conn, USER_ID, ITEM_ID, True, 'topic', 'event'), (True, 2))
+        script.assert_called_once_with(keys=[item_saves_key(ITEM_ID), RECIPE + ITEM_ID],
+                                       args=[UID, 1, 'saves_count'])
+        self.assertEqual(pipeline.zadd.call_args[0][0], USER_SAVED_RECIPES + USER_ID)
+        self.assertEqual(list(pipeline.zadd.call_args[0][1]), [RECIPE + ITEM_ID])
+
+    def test_viewer_flags(self):
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        script.return_value = [1, 0, 0, 1, 1, 1]
+        keys = [RECIPE + '1', RECIPE + '2', ACTIVITY + '3']
+        self.assertEqual(viewer_flags(redis_conn, USER_ID, keys),
+                         [(True, False), (False, True), (True, True)])
+        script.assert_called_once_with(keys=[user_liked_key(USER_ID), USER_SAVED_RECIPES + USER_ID],
+                                       args=keys)
+        self.assertEqual(viewer_flags(redis_conn, USER_ID, []), [])
+        self.assertEqual(script.call_count, 1)
+
+    def test_backfill_liked(self):
+        redis_conn = mock.Mock()
+        redis_conn.scan_iter.side_effect = [iter([item_likes_key(RECIPE + '1')]),
+                                           iter([item_likes_key(ACTIVITY + '2')])]
+        redis_conn.sscan_iter.side_effect = [iter(['1', '2', '3']), iter(['1'])]
+        pipeline = redis_conn.pipeline.return_value
+        self.assertEqual(backfill_liked(redis_conn, batch_size=2), 4)
+        pipeline.sadd.assert_has_calls([mock.call(user_liked_key('a'), RECIPE + '1'),
+                                        mock.call(user_liked_key('b'), RECIPE + '1'),
+                                        mock.call(user_liked_key('c'), RECIPE + '1'),
+                                        mock.call(user_liked_key('a'), ACTIVITY + '2')])
+        self.assertEqual(pipeline.execute.call_count, 3)
+
+    def test_forward_events(self):
+        events = [('1-0', {'topic': 'recipe_liked_item_post', 'key': 'a', 'value': 'e1'}),
+                  ('2-0', {'topic': 'recipe_saved_item_post', 'key': 'b', 'value': 'e2'}),
+                  ('3-0', {'topic': 'recipe_liked_item_post', 'key': 'c', 'value': 'e3'})]
+        redis_conn = mock.Mock()
+        redis_conn.xrange.side_effect = [events[:2], events[2:]]
+        producer = FakeProducer()
+        self.assertEqual(forward_events(redis_conn, producer, batch_size=2), 3)
+        self.assertEqual(producer.produced, [('recipe_liked_item_post', 'e1', 'a'),
+                                             ('recipe_saved_item_post', 'e2', 'b'),
+                                             ('recipe_liked_item_post', 'e3', 'c')])
+        redis_conn.xdel.assert_has_calls([mock.call(ENGAGEMENT_EVENTS, '1-0', '2-0'),
+                                          mock.call(ENGAGEMENT_EVENTS, '3-0')])
+        # The lock is released with the token it was taken with
+        token = redis_conn.set.call_args[0][1]
+        redis_conn.register_script.return_value.assert_called_once_with(keys=[ENGAGEMENT_FORWARD_LOCK],
+                                                                        args=[token])
+
+    def test_forward_events_undelivered_kept(self):
+        tests = [
+            # (failed values, values still queued after flush, deleted ids)
+            (['e2'], [], ['1-0']),
+            ([], ['e2'], ['1-0']),
+            (['e1', 'e2'], [], []),
+        ]
+        events = [('1-0', {'topic': 't', 'key': 'a', 'value': 'e1'}),
+                  ('2-0', {'topic': 't', 'key': 'a', 'value': 'e2'})]
+        for failed, queued, deleted in tests:
+            redis_conn = mock.Mock()
+            redis_conn.xrange.return_value = events
+            producer = FakeProducer(failed, queued)
+            self.assertEqual(forward_events(redis_conn, producer, batch_size=2), len(deleted))
+            # Not read again, the next run retries them
+            self.assertEqual(redis_conn.xrange.call_count, 1)
+            if deleted:
+                redis_conn.xdel.assert_called_once_with(ENGAGEMENT_EVENTS, *deleted)
+            else:
+                self.assertFalse(redis_conn.xdel.called)
+            self.assertTrue(redis_conn.register_script.return_value.called)
+
+    def test_forward_events_locked(self):
+        redis_conn = mock.Mock()
+        redis_conn.set.return_value = None
+        producer = mock.Mock()
+        self.assertIsNone(forward_events(redis_conn, producer))
+        self.assertFalse(producer.produce.called)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import USER_FEED, USER_TIMELINE, PUBLIC_RECIPES, MAX_USER_FEED_LENGTH,\
+                                PULLED_FEED_TTL
+from uggipuggi.helpers.keys import pulled_feed_key
+from uggipuggi.services.feed_fanout import recipient_chunks, fan_out, push_sets, build_pulled_feed,\
+                                           encode_cursor, decode_cursor, read_feed
+
+
+def make_redis(sets):
+    redis_conn = mock.Mock()
+    redis_conn.sscan_iter.side_effect = lambda key, count=None: iter(sets.get(key, []))
+    script = mock.Mock(side_effect=lambda keys, args: len(keys))
+    redis_conn.register_script.return_value = script
+    return redis_conn, script
+
+
+def fake_user_ids(redis_conn, uids):
+    # Sets hold integer ids, feeds are named by user id
+    return ['u%s' % uid for uid in uids]
+
+
+class TestFeedFanOut(testing.TestBase):
+
+    def setUp(self):
+        super(TestFeedFanOut, self).setUp()
+        patcher = mock.patch('uggipuggi.services.feed_fanout.to_user_ids', side_effect=fake_user_ids)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recipient_chunks(self):
+        sets = {'c:a': ['u1', 'u2', 'u3'], 'f:a': ['u3', 'u4', 'u5', 'u6', 'u7']}
+        tests = [
+            # (set keys, chunk size, chunks)
+            (['c:a'], 10, [['u1', 'u2', 'u3']]),
+            (['c:a', 'f:a'], 10, [['u1', 'u2', 'u3', 'u4', 'u5', 'u6', 'u7']]),
+            # duplicates are only dropped within a chunk
+            (['c:a', 'f:a'], 3, [['u1', 'u2', 'u3'], ['u3', 'u4', 'u5'], ['u6', 'u7']]),
+            (['c:a', 'f:a'], 2, [['u1', 'u2'], ['u3', 'u4'], ['u5', 'u6'], ['u7']]),
+            (['c:missing'], 3, []),
+            ([], 3, []),
+        ]
+        for set_keys, chunk_size, expected in tests:
+            redis_conn, _ = make_redis(sets)
+            self.assertEqual(list(recipient_chunks(redis_conn, set_keys, chunk_size)), expected)
+
+    def test_fan_out_batches(self):
+        tests = [
+            # (recipients, batch size, feeds per script call)
+            (list(range(5)), 2, [2, 2, 1]),
+            (list(range(4)), 250, [4]),
+            ([], 250, []),
+        ]
+        for recipients, batch_size, calls in tests:
+            redis_conn, script = make_redis({})
+            updated = fan_out(redis_conn, recipients, 'r:1', 1577836800.0, batch_size=batch_size)
+            self.assertEqual(updated, len(recipients))
+            self.assertEqual([len(call[1]['keys']) for call in script.call_args_list], calls)
+            keys = [key for call in script.call_args_list for key in call[1]['keys']]
+            self.assertEqual(keys, [USER_FEED + 'u%d' % recipient for recipient in recipients])
+            for call in script.call_args_list:
+                self.assertEqual(call[1]['args'], [1577836800.0, 'r:1', MAX_USER_FEED_LENGTH])
+
+    def test_fan_out_cluster(self):
+        # Feeds are in different slots, no script
+        redis_conn, script = make_redis({})
+        pipeline = redis_conn.pipeline.return_value
+        with mock.patch('uggipuggi.services.feed_fanout.is_cluster', return_value=True):
+            self.assertEqual(fan_out(redis_conn, ['1', '2', '3'], 'r:1', 5.0, batch_size=2), 3)
+        self.assertFalse(script.called)
+        pipeline.zadd.assert_has_calls([mock.call(USER_FEED + recipient, {'r:1': 5.0})
+                                        for recipient in ['u1', 'u2', 'u3']])
+        self.assertEqual(pipeline.execute.call_count, 2)
+
+    def test_push_sets(self):
+        tests = [
+            # (public, celebrity, sets)
+            (False, False, ['contacts:a']),
+            (False, True, ['contacts:a']),
+            (True, False, ['contacts:a', 'followers:{u:a}']),
+            (True, True, ['contacts:a']),
+        ]
+        for public, celebrity, expected in tests:
+            self.assertEqual(push_sets('a', public, celebrity), expected)
+
+    def test_build_pulled_feed(self):
+        tests = [
+            # (celebrities followed, timelines merged)
+            ({'10', '9'}, [USER_TIMELINE + 'u9', USER_TIMELINE + 'u10']),
+            (set(), None),
+        ]
+        for celebrities, timelines in tests:
+            redis_conn = mock.Mock()
+            redis_conn.sinter.return_value = celebrities
+            pipeline = redis_conn.pipeline.return_value
+            build_pulled_feed(redis_conn, 'a')
+            if timelines:
+                pipeline.zunionstore.assert_called_once_with(pulled_feed_key('a'), timelines, aggregate='MAX')
+            else:
+                self.assertFalse(pipeline.zunionstore.called)
+            # Following no celebrity is cached as well
+            self.assertTrue(pipeline.zadd.called)
+            pipeline.expire.assert_called_once_with(pulled_feed_key('a'), PULLED_FEED_TTL)
+
+    def test_build_pulled_feed_cluster(self):
+        redis_conn = mock.Mock()
+        redis_conn.sinter.return_value = {'1', '2'}
+        pipeline = redis_conn.pipeline.return_value
+        pipeline.execute.side_effect = [[[('r:1', 5.0), ('r:2', 3.0)], [('r:2', 4.0), ('act:3', 1.0)]], None]
+        with mock.patch('uggipuggi.services.feed_fanout.is_cluster', return_value=True):
+            build_pulled_feed(redis_conn, 'a')
+        self.assertFalse(pipeline.zunionstore.called)
+        # Highest score of an item on several timelines, as AGGREGATE MAX
+        self.assertEqual(pipeline.zadd.call_args_list[0], mock.call(pulled_feed_key('a'),
+                                                                    {'r:1': 5.0, 'r:2': 4.0, 'act:3': 1.0}))
+
+    def test_cursor(self):
+        self.assertEqual(decode_cursor(encode_cursor('r:5ea6f8ba8b5c1f0001ee5c31', '1588000000.5')),
+                         ('1588000000.5', 'r:5ea6f8ba8b5c1f0001ee5c31'))
+        for cursor in ['r:5ea6f8ba8b5c1f0001ee5c31', '1588000000', 'abc:r:1']:
+            self.assertRaises(ValueError, decode_cursor, cursor)
+
+    def test_read_feed(self):
+        views = {'r:2': {'recipe_name': 'Dal'}, 'r:1': {'recipe_name': 'Kheer'}, 'act:1': {}}
+        tests = [
+            # (user's feeds and public recipes pages, user's feeds page after building the pulled
+            #  feed, cursor, limit, expected script args, items, next cursor)
+            ([[1, 'r:2', '2'], [1, 'act:1', '1']], None, None, 2, ['+inf', '', 2],
+             [('r:2', {'recipe_name': 'Dal'})], '1:act:1'),
+            ([[1, 'r:2', '2', 'act:1', '1'], [1]], None, '3:r:3', 3, ['3', 'r:3', 3],
+             [('r:2', {'recipe_name': 'Dal'})], None),
+            # A public recipe pushed to the feed too is listed once
+            ([[1, 'r:2', '2'], [1, 'r:2', '2', 'r:1', '1']], None, None, 3, ['+inf', '', 3],
+             [('r:2', {'recipe_name': 'Dal'}), ('r:1', {'recipe_name': 'Kheer'})], None),
+            ([[], [1, 'r:1', '1']], [1], None, 2, ['+inf', '', 2], [('r:1', {'recipe_name': 'Kheer'})], None),
+        ]
+        for pages, rebuilt_page, cursor, limit, args, items, next_cursor in tests:
+            redis_conn = mock.Mock()
+            script = redis_conn.register_script.return_value
+            script.return_value = rebuilt_page
+            pipeline = redis_conn.pipeline.return_value
+            pipeline.execute.return_value = pages
+            with mock.patch('uggipuggi.services.feed_fanout.build_pulled_feed') as build,\
+                 mock.patch('uggipuggi.services.feed_fanout.get_concise_views',
+                            side_effect=lambda redis_conn, keys: {key: views[key] for key in keys}):
+                self.assertEqual(read_feed(redis_conn, 'a', cursor, limit), (items, next_cursor))
+            # Both pages in one round trip, the user's feeds share a slot
+            self.assertEqual(script.call_args_list[:2],
+                             [mock.call(keys=[USER_FEED + 'a', pulled_feed_key('a')], args=args,
+                                        client=pipeline),
+                              mock.call(keys=[PUBLIC_RECIPES], args=args, client=pipeline)])
+            pipeline.execute.assert_called_once_with()
+            self.assertEqual(build.called, rebuilt_page is not None)
+            if rebuilt_page is not None:
+                script.assert_called_with(keys=[USER_FEED + 'a', pulled_feed_key('a')], args=args)
+
+    def test_read_feed_cluster(self):
+        # Public recipes are in another slot, each page is its own call
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        script.side_effect = [[1, 'r:2', '2'], [1, 'r:1', '1']]
+        with mock.patch('uggipuggi.services.feed_fanout.is_cluster', return_value=True),\
+             mock.patch('uggipuggi.services.feed_fanout.get_concise_views',
+                        side_effect=lambda redis_conn, keys: {key: {'id': key} for key in keys}):
+            items, next_cursor = read_feed(redis_conn, 'a', None, 2)
+        self.assertEqual([item for item, _ in items], ['r:2', 'r:1'])
+        self.assertEqual(next_cursor, '1:r:1')
+        self.assertFalse(redis_conn.pipeline.called)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import USER
+from uggipuggi.helpers.keys import following_key, followers_key
+from uggipuggi.services.follows import follow, remove_followers, public_profiles
+
+USER_ID = '5ea6f8ba8b5c1f0001ee5c40'
+# Integer ids, which the sets hold, 'x' has none
+UIDS = {USER_ID: 7, 'a': 1, 'b': 2}
+
+
+class TestFollows(testing.TestBase):
+
+    def setUp(self):
+        super(TestFollows, self).setUp()
+        for name, fake in [('to_uids', lambda redis_conn, user_ids: [UIDS.get(i) for i in user_ids]),
+                           ('require_uid', lambda redis_conn, user_id: UIDS[user_id])]:
+            patcher = mock.patch('uggipuggi.services.follows.' + name, side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_follow(self):
+        tests = [
+            # (add, followees, script results, returned)
+            (True, ['a'], [[1, 5], [1, 20]], (1, 5)),
+            (True, ['a', 'b'], [[1, 6], [0, 20], [1, 1]], (1, 6)),
+            (False, ['a'], [[1, 4], [1, 19]], (1, 4)),
+        ]
+        for add, followees, results, returned in tests:
+            redis_conn = mock.Mock()
+            script = redis_conn.register_script.return_value
+            pipeline = redis_conn.pipeline.return_value
+            pipeline.execute.return_value = results
+            self.assertEqual(follow(redis_conn, USER_ID, followees, add), returned)
+            # One call per user, each on keys of that user's slot, sent in one pipeline
+            calls = [mock.call(keys=[following_key(USER_ID), USER + USER_ID],
+                               args=[int(add), 'num_following'] + [UIDS[f] for f in followees],
+                               client=pipeline)]
+            calls += [mock.call(keys=[followers_key(followee), USER + followee],
+                                args=[int(add), 'num_followers', 7], client=pipeline)
+                      for followee in followees]
+            self.assertEqual(script.call_args_list, calls)
+            pipeline.execute.assert_called_once_with()
+
+    def test_follow_transaction(self):
+        # Both sides at once on a single node, split per slot on a cluster
+        for cluster in (False, True):
+            redis_conn = mock.Mock()
+            redis_conn.pipeline.return_value.execute.return_value = [[1, 5], [1, 20]]
+            with mock.patch('uggipuggi.services.follows.is_cluster', return_value=cluster):
+                follow(redis_conn, USER_ID, ['a'])
+            redis_conn.pipeline.assert_called_once_with(not cluster)
+
+    def test_follow_nobody(self):
+        redis_conn = mock.Mock()
+        redis_conn.scard.return_value = 3
+        self.assertEqual(follow(redis_conn, USER_ID, []), (0, 3))
+        self.assertFalse(redis_conn.pipeline.called)
+
+    def test_remove_followers(self):
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        pipeline = redis_conn.pipeline.return_value
+        pipeline.execute.return_value = [[1, 2], [1, 7], [2, 8]]
+        self.assertEqual(remove_followers(redis_conn, USER_ID, ['a', 'b']), 8)
+        self.assertEqual(script.call_args_list[-1],
+                         mock.call(keys=[followers_key(USER_ID), USER + USER_ID],
+                                   args=[0, 'num_followers', 1, 2], client=pipeline))
+
+    def test_follow_unknown_user(self):
+        # Users without an integer id don't exist
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        redis_conn.pipeline.return_value.execute.return_value = [[1, 1], [1, 3]]
+        self.assertEqual(follow(redis_conn, USER_ID, ['x', 'a']), (1, 1))
+        self.assertEqual(script.call_count, 2)
+        self.assertEqual(script.call_args_list[0][1]['args'], [1, 'num_following', 1])
+
+    def test_public_profiles(self):
+        redis_conn = mock.Mock()
+        pipeline = redis_conn.pipeline.return_value
+        pipeline.execute.return_value = ['1', '0', None]
+        self.assertEqual(public_profiles(redis_conn, ['a', 'b', 'c']), [True, False, False])
+        pipeline.hget.assert_has_calls([mock.call(USER + 'a', 'public_profile')])
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import PHONE_DIRECTORY
+from uggipuggi.services.phone_directory import directory_entry, legacy_key, set_phone,\
+                                               lookup_phones, migrate_legacy_phones
+
+
+class TestPhoneDirectory(testing.TestBase):
+
+    def test_directory_entry(self):
+        tests = [
+            # (number, buckets, hash, field)
+            ('00447911123456', 1000, PHONE_DIRECTORY + '456', '447911123'),
+            ('+447911123456', 1000, PHONE_DIRECTORY + '456', '447911123'),
+            ('+919876543210', 65536, PHONE_DIRECTORY + str(919876543210 % 65536),
+             str(919876543210 // 65536)),
+        ]
+        for number, buckets, key, field in tests:
+            self.assertEqual(directory_entry(number, buckets), (key, field))
+        self.assertEqual(legacy_key('+447911123456'), '00447911123456')
+
+    def test_set_phone(self):
+        pipeline = mock.Mock()
+        set_phone(pipeline, '00447911123456', 'u1')
+        pipeline.hset.assert_called_once_with(*(directory_entry('00447911123456') + ('u1',)))
+
+    def test_lookup_phones(self):
+        tests = [
+            # (legacy lookup, pipeline results per chunk, user ids)
+            (False, [['u1', None], ['u3']], ['u1', None, None, 'u3']),
+            (True, [[None, 'u1', None, None], [None, None]], ['u1', None, None, None]),
+            # A directory hit with a stale legacy key doesn't shift the numbers after it
+            (True, [['u1', 'u1_old', None, None], ['u3', None]], ['u1', None, None, 'u3']),
+        ]
+        phones = ['+441111111', '+442222222', 'not a number', '+443333333']
+        for legacy_lookup, results, user_ids in tests:
+            redis_conn = mock.Mock()
+            pipeline = redis_conn.pipeline.return_value
+            pipeline.execute.side_effect = results
+            self.assertEqual(lookup_phones(redis_conn, phones, chunk_size=3, legacy_lookup=legacy_lookup),
+                             user_ids)
+            self.assertEqual(pipeline.hget.call_count, 3)
+            self.assertEqual(pipeline.get.call_count, 3 if legacy_lookup else 0)
+
+    def test_migrate_legacy_phones(self):
+        redis_conn = mock.Mock()
+        redis_conn.scan_iter.return_value = iter(['00447911123456', '00447911000000', '00x'])
+        pipeline = redis_conn.pipeline.return_value
+        pipeline.execute.side_effect = [['u1', None], None]
+        self.assertEqual(migrate_legacy_phones(redis_conn), 1)
+        # Numbers set since aren't overwritten
+        pipeline.hsetnx.assert_called_once_with(*(directory_entry('00447911123456') + ('u1',)))
+        # A DEL per key, as a cluster pipeline requires
+        self.assertEqual(pipeline.delete.call_args_list, [mock.call('00447911123456'),
+                                                          mock.call('00447911000000')])
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Runs the redis services against a real cluster, a script or pipeline on keys of
+# several slots fails there. Skipped unless REDIS_CLUSTER_NODES is set, see
+# rediscluster.yml for a local one:
+#
+#   REDIS_CLUSTER_NODES=localhost:7000 python -m pytest uggipuggi/tests/services/test_redis_cluster.py
+#
+from __future__ import absolute_import
+import os
+import time
+import mock
+import unittest
+from falcon import testing
+from uggipuggi.constants import RECIPE, USER_TIMELINE, CELEBRITIES
+from uggipuggi.helpers.keys import RedisCluster, following_key
+from uggipuggi.services.concise_cache import concise_cache
+from uggipuggi.services.counters import flush
+from uggipuggi.services.engagement import toggle_like, toggle_save, viewer_flags
+from uggipuggi.services.feed_fanout import fan_out, read_feed
+from uggipuggi.services.user_ids import cache_uid
+
+CLUSTER_NODES = os.environ.get('REDIS_CLUSTER_NODES')
+# Ids unlikely to clash with anything else on the cluster
+RUN = str(int(time.time() * 1000))
+# Integer ids of the users, as verification would allocate them
+UIDS = {name + RUN: int(RUN) * 10 + i for i, name in enumerate(['u1', 'u2', 'reader', 'celeb', 'other'])}
+
+
+@unittest.skipUnless(CLUSTER_NODES and RedisCluster, 'needs REDIS_CLUSTER_NODES and redis-py-cluster')
+class TestRedisCluster(testing.TestBase):
+
+    def setUp(self):
+        super(TestRedisCluster, self).setUp()
+        startup_nodes = [{'host': host, 'port': int(port)}
+                         for host, port in (node.rsplit(':', 1) for node in CLUSTER_NODES.split(','))]
+        self.redis_conn = RedisCluster(startup_nodes=startup_nodes, decode_responses=True)
+        concise_cache.clear()
+        pipeline = self.redis_conn.pipeline(False)
+        for user_id, uid in UIDS.items():
+            cache_uid(pipeline, user_id, uid)
+        pipeline.execute()
+
+    def test_toggles(self):
+        recipe_id = 'recipe' + RUN
+        self.assertEqual(toggle_like(self.redis_conn, 'u1' + RUN, RECIPE + recipe_id, True, 't', 'e'), (True, 1))
+        self.assertEqual(toggle_like(self.redis_conn, 'u1' + RUN, RECIPE + recipe_id, True, 't', 'e'), (False, 1))
+        self.assertEqual(toggle_save(self.redis_conn, 'u1' + RUN, recipe_id, True, 't', 'e'), (True, 1))
+        self.assertEqual(viewer_flags(self.redis_conn, 'u1' + RUN, [RECIPE + recipe_id, RECIPE + 'other']),
+                         [(True, True), (False, False)])
+
+    def test_counters_flush(self):
+        collection = mock.Mock()
+        collection.bulk_write.return_value.modified_count = 1
+        toggle_like(self.redis_conn, 'u2' + RUN, RECIPE + '5ea6f8ba8b5c1f0001ee5c31', True, 't', 'e')
+        with mock.patch('uggipuggi.models.recipe.Recipe._get_collection', return_value=collection):
+            updated, lag = flush(self.redis_conn, RECIPE)
+        self.assertGreaterEqual(updated, 1)
+
+    def test_feed(self):
+        user_id, celebrity = 'reader' + RUN, 'celeb' + RUN
+        self.redis_conn.sadd(following_key(user_id), UIDS[celebrity])
+        self.redis_conn.sadd(CELEBRITIES, UIDS[celebrity])
+        # Newer than anything public on the cluster
+        self.redis_conn.zadd(USER_TIMELINE + celebrity, {'r:pulled' + RUN: 4e9})
+        self.redis_conn.hmset('r:pulled' + RUN, {'recipe_name': 'Pulled'})
+        self.redis_conn.hmset('r:pushed' + RUN, {'recipe_name': 'Pushed'})
+        fan_out(self.redis_conn, [UIDS[user_id], UIDS['other' + RUN]], 'r:pushed' + RUN, 3e9)
+        items, _ = read_feed(self.redis_conn, user_id, limit=50)
+        items = [item for item, view in items]
+        self.assertEqual(items[:2], ['r:pulled' + RUN, 'r:pushed' + RUN])
+        self.redis_conn.srem(CELEBRITIES, UIDS[celebrity])
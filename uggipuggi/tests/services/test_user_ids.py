@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import USER, USER_UIDS, CONTACTS
+from uggipuggi.services import user_ids
+from uggipuggi.services.user_ids import to_uids, to_user_ids, cache_uid, migrate_user_sets
+
+USER_A = '5ea6f8ba8b5c1f0001ee5c40'
+USER_B = '5ea6f8ba8b5c1f0001ee5c41'
+DIGITS_ID = '123456789012345678901234'
+
+
+class TestUserIds(testing.TestBase):
+
+    def setUp(self):
+        super(TestUserIds, self).setUp()
+        self.clear_caches()
+
+    def clear_caches(self):
+        user_ids.uid_cache.clear()
+        user_ids.user_id_cache.clear()
+
+    def test_cache_uid(self):
+        pipeline = mock.Mock()
+        cache_uid(pipeline, USER_A, 1234)
+        pipeline.hset.assert_has_calls([mock.call(USER + USER_A, 'uid', 1234),
+                                        mock.call(USER_UIDS + '12', '34', USER_A)])
+
+    def test_to_uids(self):
+        redis_conn = mock.Mock()
+        pipeline = redis_conn.pipeline.return_value
+        pipeline.execute.return_value = ['3', None]
+        self.assertEqual(to_uids(redis_conn, [USER_A, 'nobody', USER_A]), [3, None, 3])
+        # Looked up once each, invalid ids aren't looked up in mongo
+        self.assertEqual(pipeline.hget.call_count, 2)
+        # Cached both ways
+        self.assertEqual(to_uids(redis_conn, [USER_A]), [3])
+        self.assertEqual(to_user_ids(redis_conn, ['3']), [USER_A])
+        self.assertEqual(pipeline.execute.call_count, 1)
+
+    def test_mongo_fallback(self):
+        tests = [
+            # (translate, values, user ids and uids in mongo, result)
+            (to_uids, [USER_A, USER_B], {USER_A: 1}, [1, None]),
+            (to_user_ids, ['1', 2], {USER_B: 2}, [None, USER_B]),
+        ]
+        for translate, values, in_mongo, result in tests:
+            self.clear_caches()
+            redis_conn = mock.Mock()
+            redis_conn.pipeline.return_value.execute.return_value = [None, None]
+            users = [mock.Mock(id=user_id, uid=uid) for user_id, uid in in_mongo.items()]
+            with mock.patch('uggipuggi.services.user_ids.User') as User:
+                User.objects.return_value.only.return_value = users
+                self.assertEqual(translate(redis_conn, values), result)
+            # Found ones are written back to redis
+            self.assertEqual(redis_conn.pipeline.return_value.hset.call_count, 2 * len(users))
+
+    def test_migrate_user_sets(self):
+        redis_conn = mock.Mock()
+        redis_conn.scan_iter.side_effect = lambda match, count: iter([CONTACTS + USER_A]
+                                                                     if match == CONTACTS + '*' else [])
+        redis_conn.type.return_value = 'set'
+        redis_conn.sscan_iter.return_value = iter([USER_B, '12', 'deleted', DIGITS_ID])
+        pipeline = redis_conn.pipeline.return_value
+        with mock.patch('uggipuggi.services.user_ids.to_uids', return_value=[5, None, 6]) as to_uids:
+            self.assertEqual(migrate_user_sets(redis_conn), 2)
+        # Integer members are left as they are, users who no longer exist dropped,
+        # an ObjectId of only digits is still replaced
+        to_uids.assert_called_once_with(redis_conn, [USER_B, 'deleted', DIGITS_ID])
+        pipeline.sadd.assert_called_once_with(CONTACTS + USER_A, 5, 6)
+        pipeline.srem.assert_called_once_with(CONTACTS + USER_A, USER_B, 'deleted', DIGITS_ID)
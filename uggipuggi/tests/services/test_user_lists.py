@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+import mock
+from falcon import testing
+from uggipuggi.constants import USER, MAX_USER_LIST_LOAD
+from uggipuggi.helpers.keys import followers_key
+from uggipuggi.services.user_lists import list_users
+
+USER_A = '5ea6f8ba8b5c1f0001ee5c40'
+USER_B = '5ea6f8ba8b5c1f0001ee5c41'
+FIELDS = ['display_name', 'display_pic', 'status']
+
+
+class TestListUsers(testing.TestBase):
+
+    def setUp(self):
+        super(TestListUsers, self).setUp()
+        self.redis_conn = mock.Mock()
+        self.pipeline = self.redis_conn.pipeline.return_value
+
+    def test_page(self):
+        tests = [
+            # (hydrate, scan, user ids, views, users, next cursor)
+            (False, (17, ['1', '2']), [USER_A, USER_B], [], [USER_A, USER_B], '17'),
+            (True, (0, ['1']), [USER_A], [['Ann', None, 'cooking']],
+             [{'id': USER_A, 'display_name': 'Ann', 'display_pic': None, 'status': 'cooking'}], None),
+        ]
+        for hydrate, scan, user_ids, views, users, next_cursor in tests:
+            self.redis_conn.sscan.return_value = scan
+            self.pipeline.execute.return_value = views
+            with mock.patch('uggipuggi.services.user_lists.to_user_ids', return_value=user_ids) as to_user_ids:
+                self.assertEqual(list_users(self.redis_conn, followers_key(USER_A), '5', hydrate=hydrate),
+                                 (users, next_cursor))
+            self.redis_conn.sscan.assert_called_with(followers_key(USER_A), 5, count=MAX_USER_LIST_LOAD)
+            to_user_ids.assert_called_once_with(self.redis_conn, scan[1])
+        self.pipeline.hmget.assert_called_once_with(USER + USER_A, FIELDS)
+
+    def test_deleted_users(self):
+        # Users who no longer exist are dropped before their views are read
+        self.redis_conn.sscan.return_value = (9, ['1', '2'])
+        self.pipeline.execute.return_value = [['Ann', None, None]]
+        with mock.patch('uggipuggi.services.user_lists.to_user_ids', return_value=[None, USER_A]):
+            users, next_cursor = list_users(self.redis_conn, followers_key(USER_A), hydrate=True, count=10)
+        self.redis_conn.sscan.assert_called_once_with(followers_key(USER_A), 0, count=10)
+        self.pipeline.hmget.assert_called_once_with(USER + USER_A, FIELDS)
+        self.assertEqual(users, [{'id': USER_A, 'display_name': 'Ann', 'display_pic': None, 'status': None}])
+        self.assertEqual(next_cursor, '9')
+
+    def test_invalid_cursor(self):
+        for cursor in ['abc', '-1', '1.5']:
+            self.assertRaises(ValueError, list_users, self.redis_conn, followers_key(USER_A), cursor)